@@ -1,36 +1,100 @@
+import hashlib
 import os
+import secrets
 from functools import wraps
 
-from flask import Flask, render_template, request, flash, redirect, session, g, jsonify
-from flask_debugtoolbar import DebugToolbarExtension
+from flask import (Flask, Blueprint, current_app, render_template, request, flash, redirect, session, g,
+                   jsonify, send_file, abort, make_response)
+from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
-from dotenv import load_dotenv
 
 from forms import UserAddForm, LoginForm, UserEditForm, ListAddForm
-from models import db, connect_db, User, Recipe, List, ListsRecipes, UsersFavoritesRecipes
+from models import (db, connect_db, User, Recipe, List, ListsRecipes, UsersFavoritesRecipes,
+                    UserRecommendation)
+from sampling import get_sampler
+from decks import RecipeDeck, get_recipe_bounds
+from cache import TTLCache
+from cards import RecipeCards
+from images import ImageStore, ImageFetchError, SIZES, image_path, is_remote, url_version
+from search import search_recipes
+from recommend import Updater
+from purge import Purger, CLOSED_PASSWORD, close_user, delete_user as delete_account, is_large
+from passwords import PasswordHasher, PasswordHasherBusy
+from config import CONFIGS
+from metrics import Metrics
 
 CURR_USER_KEY = "curr_user"
+DECK_KEY = "recipe_deck"
+HOME_MODE_KEY = "home_mode"
+FOR_YOU_KEY = "for_you_after"
+MAX_PREFETCH = 30
+MAX_BULK_RECIPES = 500
+MAX_PAGE_SIZE = 100
+# Requests that never look at the current user.
+ANONYMOUS_ENDPOINTS = {'static', 'tender.recipe_image'}
 
-load_dotenv()
+bp = Blueprint('tender', __name__)
 
-app = Flask(__name__)
 
-# Get DB_URI from environ variable (useful for production/testing) or,
-# if not set there, use development local db.
-db_username = os.environ.get('DB_USERNAME', 'postgres')
-db_password = os.environ.get('DB_PASSWORD', '')
-db_host = os.environ.get('DB_HOST', 'localhost')
-db_port = os.environ.get('DB_PORT', '5432')
-db_uri = f'postgresql://{db_username}:{db_password}@{db_host}:{db_port}/tender'
+def create_app(config=None):
+    """Build the app for a config profile: 'development', 'testing' or 'production'.
 
-app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
-toolbar = DebugToolbarExtension(app)
+    The profile defaults to the FLASK_CONFIG environment variable, then
+    development. Nothing here connects to the database or starts a thread,
+    so an app built before gunicorn forks (--preload) is safe to share.
+    """
+
+    app = Flask(__name__)
+    app.config.from_object(CONFIGS[config or os.environ.get('FLASK_CONFIG', 'development')])
+    app.config['IMAGE_CACHE_DIR'] = app.config['IMAGE_CACHE_DIR'] or os.path.join(app.instance_path, 'images')
+
+    if app.config['DEBUG_TB_ENABLED']:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    connect_db(app)
+    app.extensions['password_hasher'] = PasswordHasher(app)
+
+    # Current users are cached per worker with the User.version they were
+    # read at (see get_current_user). The navbar's (id, title) list
+    # projections are cached by (user id, version).
+    app.extensions['user_cache'] = TTLCache(maxsize=app.config['USER_CACHE_SIZE'],
+                                            ttl=app.config['USER_CACHE_TTL'])
+    app.extensions['list_cache'] = TTLCache(maxsize=app.config['USER_CACHE_SIZE'],
+                                            ttl=app.config['LIST_CACHE_TTL'])
+    app.extensions['image_store'] = ImageStore(app.config['IMAGE_CACHE_DIR'])
+    app.extensions['recipe_cards'] = RecipeCards(app)
+    app.jinja_env.globals['image_path'] = image_path
+    app.extensions['etag_salt'] = template_digest(app)
+    app.extensions['recommendations'] = Updater(app)
+    app.extensions['purger'] = Purger(app)
+
+    with app.app_context():
+        app.extensions['metrics'] = Metrics(app, db.engine)
+
+    app.register_blueprint(bp)
+    return app
+
+
+def template_digest(app):
+    """A short digest of the app's templates, so a deploy that changes them changes every ETag."""
+
+    digest = hashlib.sha1()
+    for name in sorted(app.jinja_loader.list_templates()):
+        with open(os.path.join(app.root_path, app.template_folder, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:8]
+
+
+def __getattr__(name):
+    # `from app import app` (and gunicorn's app:app) builds the default app
+    # on first use rather than at import.
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-connect_db(app)
 
 def authorize_user(func):
     @wraps(func)
@@ -41,39 +105,355 @@ def authorize_user(func):
         return func(*args, **kwargs)
     return wrapper
 
-def get_three_random_recipes():
-    return Recipe.query.order_by(db.func.random()).limit(3).all()
+
+def internal_only(func):
+    """Serve only with the INTERNAL_TOKEN bearer token, or in debug/testing without one."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = current_app.config['INTERNAL_TOKEN']
+        if token:
+            given = request.headers.get('Authorization', '').removeprefix('Bearer ')
+            if not secrets.compare_digest(given, token):
+                abort(404)
+        elif not (current_app.debug or current_app.testing):
+            abort(404)
+        return func(*args, **kwargs)
+    return wrapper
+
+def page_etag(list_id=None):
+    """Return an ETag for the current user's page from their version counter.
+
+    With a list_id the list's counter is included too, and None is returned if
+    the list isn't the user's.
+    """
+
+    versions = [g.user_version]
+
+    if list_id is not None:
+        list_version = db.session.execute(db.select(List.version)
+                                          .where(List.id == list_id, List.user_id == g.user.id)).scalar()
+        if list_version is None:
+            return None
+        versions.append(list_version)
+
+    return '-'.join(str(part) for part in (current_app.extensions['etag_salt'], g.user.id, list_id, *versions))
+
+
+def conditional(func):
+    """Answer a GET with 304 Not Modified if the user's versions match its ETag.
+
+    Every route that changes what these pages show bumps the user's (or the
+    list's) version. The user's version is the one get_current_user cached,
+    so a change made through another worker can take USER_CACHE_REVALIDATE
+    seconds to show. The versions are read before the page is rendered, so a
+    change that lands mid-render only costs the next request a re-render.
+    Catalog edits (ingest, snapshots) bump no one's version, so an edited
+    recipe shows on these pages once they change for another reason.
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        etag = page_etag(kwargs.get('list_id'))
+
+        # Pages with flashed messages are one-offs.
+        if etag is None or '_flashes' in session:
+            return func(*args, **kwargs)
+
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(func(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
+
+def get_random_recipes(n=None):
+    sampler = get_sampler(current_app.config['RECIPE_SAMPLER'])
+    return sampler.sample(n or current_app.config['RECIPE_SAMPLE_SIZE'])
+
+def deal_recipes(n=None):
+    """Deal the next recipes from the user's deck, reshuffling when it runs out."""
+
+    n = n or current_app.config['RECIPE_SAMPLE_SIZE']
+    low, high = get_recipe_bounds()
+
+    if DECK_KEY in session:
+        deck = RecipeDeck.from_session(session[DECK_KEY])
+        deck.merge(high)
+    else:
+        deck = RecipeDeck.shuffle(low, high)
+
+    recipes = deck.deal(n)
+
+    if len(recipes) < n:
+        deck = RecipeDeck.shuffle(low, high)
+        seen = {recipe.id for recipe in recipes}
+        recipes += [r for r in deck.deal(n) if r.id not in seen][:n - len(recipes)]
+
+    session[DECK_KEY] = deck.to_session()
+    return recipes
+
+def deal_recommendations(n=None):
+    """Deal the user's next recommended recipes, topping up from the deck.
+
+    Recommendations are precomputed (see recommend.py), so this is a single
+    lookup; new users with nothing saved get random recipes.
+    """
+
+    n = n or current_app.config['RECIPE_SAMPLE_SIZE']
+    after = session.get(FOR_YOU_KEY)
+
+    recipes, after = UserRecommendation.page(g.user.id, after, n)
+    session[FOR_YOU_KEY] = after
+
+    if len(recipes) < n:
+        seen = {recipe.id for recipe in recipes}
+        more = deal_recipes(n) if current_app.config['RECIPE_DECKS'] else get_random_recipes(n)
+        recipes += [r for r in more if r.id not in seen][:n - len(recipes)]
+
+    return recipes
+
+def next_cards(n=None):
+    """Return the next recipe cards for the homepage's mode."""
+
+    if session.get(HOME_MODE_KEY) == 'for-you':
+        return deal_recommendations(n)
+    if current_app.config['RECIPE_DECKS']:
+        return deal_recipes(n)
+    return get_random_recipes(n)
+
+def update_recommendations(basket=None, owner_id=None, recipe_ids=(), removed=False):
+    """Queue an update of the current user's recommendations after a save changes.
+
+    With no basket (e.g. after deleting a list) only the user's own
+    recommendations are recomputed.
+    """
+
+    if basket is None or recipe_ids:
+        current_app.extensions['recommendations'].submit(g.user.id, basket, owner_id, recipe_ids, removed)
 
 def get_my_lists():
-    return List.query.filter(List.username == g.user.username).all()
+    """Return the current user's lists as (id, title) projections, cached."""
+
+    # Every change to the user's lists bumps User.version, so sessions on
+    # other devices and workers see it once they revalidate the user.
+    key = (g.user.id, g.user_version)
+    lists = current_app.extensions['list_cache'].get(key)
+
+    if lists is None:
+        lists = List.get_projections(g.user.id)
+        current_app.extensions['list_cache'].set(key, lists)
+
+    return lists
+
+def get_favorite_ids(recipe_ids):
+    """Return which of `recipe_ids` the current user has favorited."""
 
-@app.route('/')
+    if not recipe_ids:
+        return set()
+
+    rows = (db.session.query(UsersFavoritesRecipes.recipe_id)
+            .filter(UsersFavoritesRecipes.user_id == g.user.id,
+                    UsersFavoritesRecipes.recipe_id.in_(recipe_ids)))
+    return {recipe_id for (recipe_id,) in rows}
+
+def get_page_args():
+    """Return the (after, limit) keyset pagination arguments of the request."""
+
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', current_app.config['RECIPE_PAGE_SIZE'], type=int)
+    return after, max(1, min(limit, MAX_PAGE_SIZE))
+
+def serialize_recipe(recipe, favorite_ids, delete_url=None):
+    """A recipe for the JSON APIs, with its card rendered as in the templates."""
+
+    favorited = recipe.id in favorite_ids
+    return {
+        'id': recipe.id,
+        'title': recipe.title,
+        'imageUrl': image_path(recipe, 'card'),
+        'favorited': favorited,
+        'html': str(current_app.extensions['recipe_cards'].render(recipe, favorited, delete_url)),
+    }
+
+@bp.route('/')
 def homepage():
     """Show homepage with links to recipes and lists."""
 
     if not g.user:
         return redirect('/signup')
-    
-    recipes = get_three_random_recipes()
+
+    mode = request.args.get('mode')
+    if mode in ('for-you', 'random'):
+        session[HOME_MODE_KEY] = mode
+        session.pop(FOR_YOU_KEY, None)
+
+    recipes = next_cards()
     lists = get_my_lists()
 
-    return render_template('home.html', recipes=recipes, lists=lists, user=g.user)
+    favorite_ids = get_favorite_ids([recipe.id for recipe in recipes])
+
+    return render_template('home.html', recipes=recipes, lists=lists, favorite_ids=favorite_ids,
+                           page_size=current_app.config['RECIPE_SAMPLE_SIZE'],
+                           mode=session.get(HOME_MODE_KEY, 'random'))
+
+@bp.route('/api/recipes/next')
+@authorize_user
+def next_recipes():
+    """Return the next `n` recipe cards from the user's deck as JSON.
+
+    The client calls this to refill its prefetch queue, so a whole window of
+    cards is looked up in one batch.
+    """
+
+    n = min(request.args.get('n', current_app.config['RECIPE_SAMPLE_SIZE'], type=int), MAX_PREFETCH)
+
+    if n < 1:
+        return jsonify({'recipes': []})
+
+    recipes = next_cards(n)
+
+    favorite_ids = get_favorite_ids([recipe.id for recipe in recipes])
+
+    return jsonify({'recipes': [serialize_recipe(r, favorite_ids) for r in recipes]})
+
+def get_current_user(user_id):
+    """Return the UserProjection for a logged in user, from cache if we can.
+
+    A cached user is used without touching Postgres for USER_CACHE_REVALIDATE
+    seconds. After that only their version is read, and the projection is
+    reloaded if it changed; deleted and closed accounts (see purge.py) have
+    no version, so their sessions are logged out. Routes that change a user
+    drop this worker's copy at once with forget_user.
+    """
+
+    cache = current_app.extensions['user_cache']
+    entry = cache.get(user_id)
+    now = cache.clock()
+
+    if entry is not None and now - entry[2] < current_app.config['USER_CACHE_REVALIDATE']:
+        user, version, _ = entry
+    else:
+        version = db.session.execute(db.select(User.version)
+                                     .where(User.id == user_id, User.password != CLOSED_PASSWORD)).scalar()
+        if version is None:
+            cache.delete(user_id)
+            return None
+
+        if entry is not None and entry[1] == version:
+            user = entry[0]
+        else:
+            user = User.get_projection(user_id)
+            if user is None:
+                return None
+
+        cache.set(user_id, (user, version, now))
+
+    g.user_version = version
+    return user
+
+def forget_user(user_id):
+    """Drop this worker's cached copy of a user after changing their version."""
+
+    current_app.extensions['user_cache'].delete(user_id)
+
+@bp.route('/search')
+@authorize_user
+def search():
+    """Show the first page of recipes whose titles match `q`."""
+
+    q = request.args.get('q', '').strip()
+    lists = get_my_lists()
+    recipes, cursor, truncated = [], None, False
 
-@app.before_request
+    if q:
+        recipes, cursor, truncated = search_recipes(q, request.args.get('after'),
+                                                    current_app.config['RECIPE_PAGE_SIZE'])
+
+    favorite_ids = get_favorite_ids([recipe.id for recipe in recipes])
+
+    return render_template('search.html', q=q, recipes=recipes, favorite_ids=favorite_ids,
+                           lists=lists, next_cursor=cursor, truncated=truncated)
+
+@bp.route('/api/search')
+@authorize_user
+def search_page():
+    """Return a page of search results as JSON, for infinite scroll."""
+
+    q = request.args.get('q', '').strip()
+    _, limit = get_page_args()
+
+    if not q:
+        return jsonify({'recipes': [], 'next': None, 'truncated': False})
+
+    recipes, cursor, truncated = search_recipes(q, request.args.get('after'), limit)
+    favorite_ids = get_favorite_ids([recipe.id for recipe in recipes])
+    return jsonify({'recipes': [serialize_recipe(r, favorite_ids) for r in recipes], 'next': cursor,
+                    'truncated': truncated})
+
+@bp.route('/img/<int:recipe_id>/<size>')
+def recipe_image(recipe_id, size):
+    """Serve a recipe's image from the local cache, fetching it on a miss.
+
+    A cached image is served without the database only if it matches the
+    URL digest in `v` (see images.image_path); otherwise the recipe's current
+    image URL decides. If the origin can't be reached, redirect to it instead.
+    """
+
+    if size not in SIZES:
+        abort(404)
+
+    version = request.args.get('v')
+    store = current_app.extensions['image_store']
+    entry = store.cached(recipe_id)
+
+    if entry is None or version is None or url_version(entry['url']) != version:
+        recipe = Recipe.query.get_or_404(recipe_id)
+        try:
+            entry = store.fetch(recipe.id, recipe.image_url)
+        except ImageFetchError:
+            if not is_remote(recipe.image_url):
+                abort(404)
+            return redirect(recipe.image_url)
+
+    path, content_type, etag = store.variant(entry, size)
+
+    # Only a versioned URL always means the same image.
+    max_age = current_app.config['IMAGE_MAX_AGE'] if version == url_version(entry['url']) else 0
+    return send_file(path, mimetype=content_type, etag=etag, conditional=True, max_age=max_age)
+
+@bp.before_app_request
 def add_user_to_g():
     """If we're logged in, add curr user to Flask global."""
 
-    if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+    g.user = None
 
-    else:
-        g.user = None
+    if CURR_USER_KEY in session and request.endpoint not in ANONYMOUS_ENDPOINTS:
+        g.user = get_current_user(session[CURR_USER_KEY])
+
+        if g.user is None:
+            do_logout()
+
+
+@bp.app_errorhandler(PasswordHasherBusy)
+def password_hasher_busy(error):
+    """Shed load when too many passwords are waiting to be hashed."""
+
+    return "Too many people are signing in right now. Please try again in a moment.", 503, {'Retry-After': '1'}
 
 
 def do_login(user):
     """Log in user."""
 
     session[CURR_USER_KEY] = user.id
+    session.pop(DECK_KEY, None)
+    session.pop(HOME_MODE_KEY, None)
+    session.pop(FOR_YOU_KEY, None)
 
 
 def do_logout():
@@ -82,8 +462,12 @@ def do_logout():
     if CURR_USER_KEY in session:
         del session[CURR_USER_KEY]
 
+    session.pop(DECK_KEY, None)
+    session.pop(HOME_MODE_KEY, None)
+    session.pop(FOR_YOU_KEY, None)
 
-@app.route('/signup', methods=["GET", "POST"])
+
+@bp.route('/signup', methods=["GET", "POST"])
 def signup():
     """Handle user signup.
 
@@ -106,18 +490,11 @@ def signup():
                 password=form.password.data,
                 email=form.email.data,
             )
-            db.session.commit()
-
-            default_list = List(
-                title="My List",
-                description="My first list",
-                username=user.username
-            )
-
-            db.session.add(default_list)
+            user.lists.append(List(title="My List", description="My first list"))
             db.session.commit()
 
         except IntegrityError:
+            db.session.rollback()
             flash("Username already taken", 'danger')
             return render_template('users/signup.html', form=form)
 
@@ -129,7 +506,7 @@ def signup():
         return render_template('users/signup.html', form=form)
 
 
-@app.route('/login', methods=["GET", "POST"])
+@bp.route('/login', methods=["GET", "POST"])
 def login():
     """Handle user login."""
 
@@ -140,6 +517,7 @@ def login():
                                  form.password.data)
 
         if user:
+            db.session.commit()
             do_login(user)
             flash(f"Hello, {user.username}!", "success")
             return redirect("/")
@@ -149,69 +527,138 @@ def login():
     return render_template('users/login.html', form=form)
 
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     """Handle logout of user."""
     do_logout()
     flash("Logged out successfully.", "success")
     return redirect("/")
 
-@app.route('/favorites')
+@bp.route('/favorites')
 @authorize_user
+@conditional
 def show_favorites():
-    """Show all favorites."""
+    """Show the first page of favorites."""
 
-    favorites = g.user.favorites
+    recipes, cursor = UsersFavoritesRecipes.page(g.user.id, *get_page_args())
+    favorite_ids = {recipe.id for recipe in recipes}
     lists = get_my_lists()
-    return render_template('favorites/favorites.html', recipes=favorites, user=g.user, lists=lists)
+    return render_template('favorites/favorites.html', recipes=recipes, favorite_ids=favorite_ids,
+                           lists=lists, next_cursor=cursor)
+
+@bp.route('/api/favorites')
+@authorize_user
+def favorites_page():
+    """Return a page of favorites as JSON, for infinite scroll."""
+
+    recipes, cursor = UsersFavoritesRecipes.page(g.user.id, *get_page_args())
+    favorite_ids = {recipe.id for recipe in recipes}
+    return jsonify({'recipes': [serialize_recipe(r, favorite_ids) for r in recipes], 'next': cursor})
+
+def get_json_field(name):
+    """Return a field of the request's JSON object, or None."""
+
+    data = request.get_json(silent=True)
+    return data.get(name) if isinstance(data, dict) else None
 
-@app.route('/favorites/add', methods=["POST"])
+def is_json_id(value):
+    """Is `value` a JSON integer? bool is an int in Python, so it's ruled out."""
+
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def get_json_recipe_id():
+    """Return the request's JSON recipeId, or None if it isn't an integer."""
+
+    recipe_id = get_json_field('recipeId')
+    return recipe_id if is_json_id(recipe_id) else None
+
+@bp.route('/favorites/add', methods=["POST"])
 @authorize_user
 def add_favorite():
     """Add favorite."""
 
-    recipe_id = request.json['recipeId']
-    recipe = Recipe.query.get(recipe_id)
-    g.user.favorites.append(recipe)
-    db.session.commit()
-    return redirect("/favorites")
+    recipe_id = get_json_recipe_id()
+
+    if recipe_id is None:
+        return jsonify({'message': 'recipeId must be an integer'}), 400
 
-@app.route('/favorites/remove', methods=["POST"])
+    try:
+        changed = UsersFavoritesRecipes.add(g.user.id, recipe_id)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'message': 'Recipe not found.'}), 404
+
+    if changed:
+        forget_user(g.user.id)
+        update_recommendations('favorites', g.user.id, [recipe_id])
+
+    return jsonify({'message': 'success', 'recipeId': recipe_id, 'favorited': True, 'changed': changed})
+
+@bp.route('/favorites/remove', methods=["POST"])
 @authorize_user
 def remove_favorite():
     """Remove favorite."""
 
-    recipe_id = request.json['recipeId']
-    recipe = Recipe.query.get(recipe_id)
-    g.user.favorites.remove(recipe)
+    recipe_id = get_json_recipe_id()
+
+    if recipe_id is None:
+        return jsonify({'message': 'recipeId must be an integer'}), 400
+
+    changed = UsersFavoritesRecipes.remove(g.user.id, recipe_id)
     db.session.commit()
-    return redirect("/favorites")
 
-@app.route('/lists')
+    if changed:
+        forget_user(g.user.id)
+        update_recommendations('favorites', g.user.id, [recipe_id], removed=True)
+
+    return jsonify({'message': 'success', 'recipeId': recipe_id, 'favorited': False, 'changed': changed})
+
+@bp.route('/lists')
 @authorize_user
+@conditional
 def show_lists():
     """Show all lists."""
 
     lists = get_my_lists()
     return render_template('lists/lists.html', lists=lists)
 
-@app.route('/lists/<int:list_id>')
+@bp.route('/lists/<int:list_id>')
 @authorize_user
+@conditional
 def show_list(list_id):
     """Show list details."""
 
     lists = get_my_lists()
     list = List.query.get_or_404(list_id)
 
-    if list.username != g.user.username:
+    if list.user_id != g.user.id:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    recipes = list.recipes
+    recipes, cursor = ListsRecipes.page(list.id, *get_page_args())
+    favorite_ids = get_favorite_ids([recipe.id for recipe in recipes])
 
-    return render_template('lists/list.html', list=list, lists=lists, recipes=recipes, user=g.user)
+    return render_template('lists/list.html', list=list, lists=lists, recipes=recipes,
+                           favorite_ids=favorite_ids, next_cursor=cursor)
 
-@app.route('/lists/new', methods=["GET", "POST"])
+@bp.route('/api/lists/<int:list_id>/recipes')
+@authorize_user
+def list_recipes_page(list_id):
+    """Return a page of a list's recipes as JSON, for infinite scroll."""
+
+    list = List.query.get_or_404(list_id)
+
+    if list.user_id != g.user.id:
+        return jsonify({'message': 'Access unauthorized.'}), 403
+
+    recipes, cursor = ListsRecipes.page(list.id, *get_page_args())
+    favorite_ids = get_favorite_ids([recipe.id for recipe in recipes])
+    return jsonify({'recipes': [serialize_recipe(r, favorite_ids, f"/lists/delete_recipe/{list.id}/{r.id}")
+                                for r in recipes],
+                    'next': cursor})
+
+@bp.route('/lists/new', methods=["GET", "POST"])
 @authorize_user
 def new_list():
     """Show form to add list and process form."""
@@ -222,77 +669,145 @@ def new_list():
 
     if form.validate_on_submit():
         list = List(
-            username=g.user.username,
-            title=form.title.data, 
+            user_id=g.user.id,
+            title=form.title.data,
             description=form.description.data
         )
         db.session.add(list)
+        User.bump_version(g.user.id)
         db.session.commit()
+        forget_user(g.user.id)
         return redirect(f"/lists")
 
     else:
         return render_template('lists/new_list.html', form=form, lists=lists)
 
 
-@app.route('/lists/delete/<int:list_id>')
+@bp.route('/lists/delete/<int:list_id>')
 @authorize_user
 def delete_list(list_id):
     """Delete list."""
 
-    list = List.query.get_or_404(list_id)
+    # One statement; the list's recipes go with it by cascade.
+    deleted = db.session.execute(db.delete(List)
+                                 .where(List.id == list_id, List.user_id == g.user.id)
+                                 .returning(List.id)).scalar()
 
-    if list.username != g.user.username:
+    if deleted is None:
+        if db.session.get(List, list_id) is None:
+            abort(404)
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    db.session.delete(list)
+    User.bump_version(g.user.id)
     db.session.commit()
+    forget_user(g.user.id)
+    update_recommendations()
 
     return redirect("/lists")
 
-@app.route('/lists/add', methods=["POST"])
+@bp.route('/lists/add', methods=["POST"])
 @authorize_user
 def add_recipe_to_list():
 
-    list_title = request.json["listTitle"]
-    recipe_id = request.json["recipeId"]
+    list_title = get_json_field('listTitle')
+    recipe_id = get_json_recipe_id()
+
+    if not isinstance(list_title, str):
+        return jsonify({'message': 'listTitle must be a string'}), 400
 
-    list = List.query.filter_by(title=list_title, username=g.user.username).first_or_404()
+    if recipe_id is None:
+        return jsonify({'message': 'recipeId must be an integer'}), 400
 
-    if list.username != g.user.username:
+    list = List.query.filter_by(title=list_title, user_id=g.user.id).first_or_404()
+
+    if list.user_id != g.user.id:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
-    list_recipes = ListsRecipes(
-        list_id=list.id,
-        recipe_id=recipe_id
-    )
-
-    db.session.add(list_recipes)
+    added = ListsRecipes.add_many(list.id, [recipe_id])
+    if added:
+        List.bump_version(list.id)
     db.session.commit()
+    update_recommendations('list', list.id, added)
 
     return jsonify({'message': 'success'})
 
 
-@app.route('/lists/delete_recipe/<int:list_id>/<int:recipe_id>')
+def get_json_recipe_ids():
+    """Return the request's JSON recipeIds, or None if it isn't a short list of ints."""
+
+    recipe_ids = get_json_field('recipeIds')
+
+    if (not isinstance(recipe_ids, list) or len(recipe_ids) > MAX_BULK_RECIPES
+            or not all(is_json_id(i) for i in recipe_ids)):
+        return None
+
+    return recipe_ids
+
+@bp.route('/api/lists/<int:list_id>/recipes', methods=["POST", "DELETE"])
+@authorize_user
+def sync_list_recipes(list_id):
+    """Add (POST) or remove (DELETE) many recipes on a list at once.
+
+    Takes JSON like {"recipeIds": [1, 2, 3]} and applies it in a single
+    statement. Repeating a request is harmless. Responds with a status per
+    recipe: added/exists/not_found for POST, removed/missing for DELETE.
+    """
+
+    recipe_ids = get_json_recipe_ids()
+
+    if recipe_ids is None:
+        return jsonify({'message': f'recipeIds must be a list of at most {MAX_BULK_RECIPES} ids'}), 400
+
+    list = List.query.get_or_404(list_id)
+
+    if list.user_id != g.user.id:
+        return jsonify({'message': 'Access unauthorized.'}), 403
+
+    if request.method == "POST":
+        added = ListsRecipes.add_many(list.id, recipe_ids)
+        known = set(db.session.scalars(db.select(Recipe.id).where(Recipe.id.in_(recipe_ids))))
+        if added:
+            List.bump_version(list.id)
+        db.session.commit()
+        update_recommendations('list', list.id, added)
+        results = [
+            {'recipeId': i, 'status': 'added' if i in added else 'exists' if i in known else 'not_found'}
+            for i in recipe_ids
+        ]
+    else:
+        removed = ListsRecipes.remove_many(list.id, recipe_ids)
+        if removed:
+            List.bump_version(list.id)
+        db.session.commit()
+        update_recommendations('list', list.id, removed, removed=True)
+        results = [{'recipeId': i, 'status': 'removed' if i in removed else 'missing'} for i in recipe_ids]
+
+    return jsonify({'message': 'success', 'results': results})
+
+
+@bp.route('/lists/delete_recipe/<int:list_id>/<int:recipe_id>')
 @authorize_user
 def delete_recipe_from_list(list_id, recipe_id):
     """Delete recipe from list."""
 
     list = List.query.get_or_404(list_id)
 
-    if list.username != g.user.username:
+    if list.user_id != g.user.id:
         flash("Access unauthorized.", "danger")
         return redirect("/")
 
     list_recipe = ListsRecipes.query.filter_by(list_id=list_id, recipe_id=recipe_id).first_or_404()
 
     db.session.delete(list_recipe)
+    List.bump_version(list_id)
     db.session.commit()
+    update_recommendations('list', list_id, [recipe_id], removed=True)
 
     return redirect(f"/lists/{list_id}")
 
-@app.route('/my-account', methods=["GET", "POST"])
+@bp.route('/my-account', methods=["GET", "POST"])
 @authorize_user
 def my_account():
     """Show user account page."""
@@ -302,13 +817,14 @@ def my_account():
     form = UserEditForm(obj=g.user)
 
     if form.validate_on_submit():
-        user = User.authenticate(g.user.username,
-                                 form.password.data)
+        user = db.session.get(User, g.user.id)
 
-        if user:
-            g.user.username = form.username.data
-            g.user.email = form.email.data
+        if user.check_password(form.password.data):
+            user.username = form.username.data
+            user.email = form.email.data
+            User.bump_version(user.id)
             db.session.commit()
+            forget_user(user.id)
             flash("Account updated.", "success")
             return redirect("/my-account")
 
@@ -316,13 +832,40 @@ def my_account():
 
     return render_template('users/my_account.html', user=g.user, form=form, lists=lists)
 
-@app.route('/my-account/delete')
+@bp.route('/my-account/delete')
 @authorize_user
 def delete_user():
     """Delete user."""
 
-    db.session.delete(g.user)
-    db.session.commit()
+    # Large accounts are closed now and purged in batches in the background.
+    if is_large(g.user.id, current_app.config['ACCOUNT_PURGE_THRESHOLD']):
+        close_user(g.user.id)
+        db.session.commit()
+        current_app.extensions['purger'].submit(g.user.id)
+    else:
+        delete_account(g.user.id)
+        db.session.commit()
 
+    forget_user(g.user.id)
     do_logout()
-    return redirect("/signup")
\ No newline at end of file
+    return redirect("/signup")
+
+
+@bp.route('/internal/pool')
+@internal_only
+def pool_stats():
+    """This worker's connection pool counters and the server's connection headroom."""
+
+    stats = current_app.extensions['pool_stats'].snapshot()
+    stats['max_connections'] = int(db.session.execute(text("SHOW max_connections")).scalar())
+    stats['connections'] = db.session.execute(text("SELECT count(*) FROM pg_stat_activity")).scalar()
+    return jsonify(stats)
+
+
+@bp.route('/metrics')
+@internal_only
+def metrics():
+    """This worker's request, SQL and pool metrics in Prometheus text format."""
+
+    body = current_app.extensions['metrics'].render(current_app.extensions['pool_stats'])
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4'}
@@ -0,0 +1,80 @@
+"""Benchmark password checks per worker at different bcrypt work factors.
+
+A login's cost is dominated by one bcrypt check, so this measures how many
+checks per second one worker process gets through, with a number of request
+threads hammering a PasswordHasher configured like the app's. Refused checks
+are the ones the app would answer with a 503.
+
+run like:
+
+    python benchmarks/bench_login.py [--seconds 3] [--workers 2] [--queue 2]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from passwords import PasswordHasher, PasswordHasherBusy
+
+ROUNDS = [10, 11, 12]
+THREADS = [1, 4, 16]
+
+
+def run(hasher, hashed, threads, seconds):
+    """Check passwords from `threads` threads for `seconds`; return (done, refused)."""
+
+    counts = {'done': 0, 'refused': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        while time.perf_counter() < deadline:
+            try:
+                hasher.check(hashed, "password")
+                outcome = 'done'
+            except PasswordHasherBusy:
+                outcome = 'refused'
+                time.sleep(0.01)
+            with lock:
+                counts[outcome] += 1
+
+    clients = [threading.Thread(target=client) for _ in range(threads)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+
+    return counts['done'], counts['refused']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--workers', type=int, default=2, help="PASSWORD_HASH_WORKERS")
+    parser.add_argument('--queue', type=int, default=2, help="PASSWORD_HASH_QUEUE")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.workers} hash workers, queue {args.queue}")
+    print(f"{'rounds':>6} {'threads':>8} {'logins/s':>10} {'refused/s':>10}")
+
+    for rounds in ROUNDS:
+        app = Flask(__name__)
+        app.config['BCRYPT_LOG_ROUNDS'] = rounds
+        app.config['PASSWORD_HASH_WORKERS'] = args.workers
+        app.config['PASSWORD_HASH_QUEUE'] = args.queue
+        hasher = PasswordHasher(app)
+        hashed = hasher.hash("password")
+
+        for threads in THREADS:
+            done, refused = run(hasher, hashed, threads, args.seconds)
+            print(f"{rounds:>6} {threads:>8} {done / args.seconds:>10.1f} {refused / args.seconds:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
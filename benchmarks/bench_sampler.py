@@ -0,0 +1,75 @@
+"""Benchmark the random recipe samplers against growing catalogs.
+
+Fills a scratch database with 10k, 100k and 1M recipes and times each
+sampler at every size. Latency of the `random_id` and `tablesample`
+samplers should stay flat while `order_by_random` grows with the table.
+
+run like:
+
+    BENCH_DATABASE_URL=postgresql:///tender-bench python benchmarks/bench_sampler.py
+
+Every table in that database is dropped and recreated.
+"""
+
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+
+from models import db, connect_db
+from sampling import SAMPLERS
+
+SIZES = [10_000, 100_000, 1_000_000]
+ROUNDS = 50
+SAMPLE_SIZE = 3
+
+
+def fill(n):
+    """Replace the recipes table with n rows, leaving some id gaps."""
+
+    # Lists and favorites reference recipes, so everything goes.
+    db.drop_all()
+    db.create_all()
+    db.session.execute(text("""
+        INSERT INTO recipes (id, source_id, title, image_url)
+        SELECT g, g, 'Recipe ' || g, 'https://example.com/' || g || '.jpg'
+        FROM generate_series(1, :n) AS g
+        WHERE g % 10 <> 0
+    """), {'n': n})
+    db.session.commit()
+    db.session.execute(text("ANALYZE recipes"))
+    db.session.commit()
+
+
+def time_sampler(sampler):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        sampler.sample(SAMPLE_SIZE)
+        timings.append((time.perf_counter() - start) * 1000)
+        db.session.rollback()
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+        'BENCH_DATABASE_URL', 'postgresql:///tender-bench')
+    connect_db(app)
+
+    with app.app_context():
+        print(f"{'rows':>10} {'sampler':>16} {'median ms':>10} {'max ms':>10}")
+        for size in SIZES:
+            fill(size)
+            for name, sampler_class in SAMPLERS.items():
+                median, worst = time_sampler(sampler_class())
+                print(f"{size:>10} {name:>16} {median:>10.2f} {worst:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark recipe title search against a 1M recipe catalog.
+
+Fills a scratch database with generated three-word titles, builds the search
+indexes, and times the Postgres full-text backend (with the trigram fallback
+on a misspelled query when pg_trgm is available) and the in-process inverted
+index. Index build time for the inverted index is reported separately.
+
+run like:
+
+    BENCH_DATABASE_URL=postgresql:///tender-bench python benchmarks/bench_search.py
+
+Every table in that database is dropped and recreated.
+"""
+
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+
+from models import db, connect_db
+from search import PostgresSearch, InvertedIndex
+
+SIZE = 1_000_000
+ROUNDS = 50
+QUERIES = ["chicken", "spicy beef", "lemon garlic pasta", "chiken"]
+WORDS = [
+    "chicken", "beef", "pork", "tofu", "salmon", "shrimp", "lemon", "garlic",
+    "spicy", "smoky", "roasted", "grilled", "pasta", "curry", "tacos", "salad",
+    "soup", "stew", "noodles", "rice", "burger", "pie", "cake", "bread",
+]
+
+
+def fill(n):
+    """Replace the recipes table with n generated titles and its indexes."""
+
+    # Lists and favorites reference recipes, so everything goes.
+    db.drop_all()
+    db.create_all()
+    db.session.execute(text("""
+        INSERT INTO recipes (id, source_id, title, image_url)
+        SELECT g, g,
+               initcap((:words)[1 + g % 24] || ' ' ||
+                       (:words)[1 + (g / 24) % 24] || ' ' ||
+                       (:words)[1 + (g / 576) % 24]),
+               'https://example.com/' || g || '.jpg'
+        FROM generate_series(1, :n) AS g
+    """), {'n': n, 'words': WORDS})
+    db.session.commit()
+    db.session.execute(text("ANALYZE recipes"))
+    db.session.commit()
+
+
+def time_search(backend, q):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        backend.search(q, limit=20)
+        timings.append((time.perf_counter() - start) * 1000)
+        db.session.rollback()
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+        'BENCH_DATABASE_URL', 'postgresql:///tender-bench')
+    connect_db(app)
+
+    with app.app_context():
+        fill(SIZE)
+
+        index = InvertedIndex()
+        start = time.perf_counter()
+        index.refresh()
+        print(f"inverted index built in {time.perf_counter() - start:.1f} s")
+
+        print(f"{'backend':>10} {'query':>20} {'median ms':>10} {'max ms':>10}")
+        for name, backend in [('postgres', PostgresSearch()), ('inverted', index)]:
+            for q in QUERIES:
+                median, worst = time_search(backend, q)
+                print(f"{name:>10} {q:>20} {median:>10.2f} {worst:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
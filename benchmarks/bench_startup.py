@@ -0,0 +1,56 @@
+"""Measure cold start and first-request latency.
+
+Each round runs a fresh interpreter that imports app.py, builds the app for
+a profile and serves one request, which is what a new gunicorn worker (or a
+recycled one, without --preload) pays before it's useful.
+
+run like:
+
+    python benchmarks/bench_startup.py [--rounds 5] [--path /signup]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+app = create_app(sys.argv[1])
+built = time.perf_counter()
+resp = app.test_client().get(sys.argv[2])
+done = time.perf_counter()
+print(json.dumps({
+    'startup': (built - start) * 1000,
+    'first_request': (done - built) * 1000,
+    'status': resp.status_code,
+    'heavy': sorted(m for m in ('numpy', 'scipy', 'PIL', 'flask_debugtoolbar') if m in sys.modules),
+}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--path', default='/signup')
+    args = parser.parse_args()
+
+    print(f"{'profile':>12} {'startup ms':>11} {'first req ms':>13}  loaded")
+    for profile in ('development', 'production'):
+        runs = [
+            json.loads(subprocess.check_output([sys.executable, '-c', PROBE, profile, args.path], cwd=ROOT))
+            for _ in range(args.rounds)
+        ]
+        startup = statistics.median(run['startup'] for run in runs)
+        first = statistics.median(run['first_request'] for run in runs)
+        print(f"{profile:>12} {startup:>11.0f} {first:>13.0f}  {', '.join(runs[0]['heavy']) or '-'}")
+
+
+if __name__ == '__main__':
+    main()
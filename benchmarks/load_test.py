@@ -0,0 +1,318 @@
+"""Load-test the app with scripted user journeys.
+
+Seeds a scratch database with synthetic data (see synthetic.py), then runs `--users`
+virtual users at once for `--seconds`. Each one signs up, then repeats a
+journey: open the homepage, swipe through a few windows of cards, favorite
+and unfavorite a recipe, add one to their list and view their lists and
+favorites. Reports p50/p95/p99 latency, throughput and errors per route.
+Signups that get a 503 because the password hasher is busy are retried after
+its Retry-After; a user who still can't sign up counts as a "signup" error and
+sits the run out.
+
+run like:
+
+    BENCH_DATABASE_URL=postgresql://postgres@localhost/tender-bench \\
+        python benchmarks/load_test.py [--users 8] [--seconds 30] [--recipes 100000]
+
+Journeys run against the app's test client in this process by default, or
+against a running server with --url (e.g. gunicorn with DATABASE_URL set to
+the same database). --save writes the results as a JSON baseline; --baseline
+compares a run against one and exits non-zero if any route's p95 got more
+than --threshold slower or its throughput dropped by as much:
+
+    python benchmarks/load_test.py --save benchmarks/baselines/local.json
+    python benchmarks/load_test.py --baseline benchmarks/baselines/local.json
+
+All tables in the scratch database are dropped and recreated unless
+--no-seed is given, so seeding refuses to run without BENCH_DATABASE_URL.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if 'BENCH_DATABASE_URL' in os.environ:
+    os.environ['DATABASE_URL'] = os.environ['BENCH_DATABASE_URL']
+os.environ.setdefault('FLASK_CONFIG', 'production')
+
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+LIST_LINK = re.compile(r'href="/lists/(\d+)"')
+PERCENTILES = (50, 95, 99)
+SIGNUP_ATTEMPTS = 10
+
+
+def seed(db, n):
+    """Recreate every table and fill it with n synthetic recipes and n / 10 users."""
+
+    from synthetic import generate
+
+    db.drop_all()
+    db.create_all()
+    generate(recipes=n, users=n // 10, log=lambda message: None)
+
+
+class InProcessClient:
+    """Sends a virtual user's requests through the app's test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, payload=None, form=None):
+        resp = self.client.open(path, method=method, json=payload, data=form)
+        return resp.status_code, resp.get_data(as_text=True), resp.headers
+
+
+class NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, *args):
+        return None
+
+
+class HTTPClient:
+    """Sends a virtual user's requests to a running server, keeping its cookies."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), NoRedirect())
+
+    def request(self, method, path, payload=None, form=None):
+        body, headers = None, {}
+        if payload is not None:
+            body, headers = json.dumps(payload).encode(), {'Content-Type': 'application/json'}
+        elif form is not None:
+            body, headers = urlencode(form).encode(), {'Content-Type': 'application/x-www-form-urlencoded'}
+
+        req = Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as resp:
+                return resp.status, resp.read().decode(), resp.headers
+        except HTTPError as e:
+            return e.code, e.read().decode(), e.headers
+
+
+class Recorder:
+    """Collects each route's latencies and errors across virtual users."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, route, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def results(self, elapsed):
+        results = {}
+        for route, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            result = {'requests': len(latencies),
+                      'errors': self.errors.get(route, 0),
+                      'rps': len(latencies) / elapsed}
+            for p in PERCENTILES:
+                index = min(len(latencies) - 1, int(len(latencies) * p / 100))
+                result[f'p{p}_ms'] = 1000 * latencies[index]
+            results[route] = result
+        return results
+
+
+class SignupFailed(Exception):
+    """A virtual user couldn't sign up, so it sits the run out."""
+
+
+class VirtualUser:
+    """One user's session, timing each request under its route's name."""
+
+    def __init__(self, client, recorder, name, rng):
+        self.client = client
+        self.recorder = recorder
+        self.name = name
+        self.rng = rng
+        self.list_id = None
+
+    def call(self, route, method, path, **kwargs):
+        start = time.perf_counter()
+        status, body, headers = self.client.request(method, path, **kwargs)
+        self.recorder.record(route, time.perf_counter() - start, status < 400)
+        return status, body, headers
+
+    def signup(self):
+        """Sign up and find the default list, retrying while logins are busy.
+
+        Signups hash a password, so a burst of them gets 503s with a
+        Retry-After once the hasher's queue is full. The whole signup is
+        also recorded as "signup", failing if the user never got in.
+        """
+
+        start = time.perf_counter()
+        try:
+            self._signup()
+        except SignupFailed:
+            self.recorder.record("signup", time.perf_counter() - start, False)
+            raise
+        self.recorder.record("signup", time.perf_counter() - start, True)
+
+    def _signup(self):
+        _, page, _ = self.call("GET /signup", 'GET', "/signup")
+        token = CSRF_TOKEN.search(page)
+        form = {'first_name': "Load", 'last_name': "Test", 'username': self.name,
+                'email': f"{self.name}@example.com", 'password': "password"}
+        if token:
+            form['csrf_token'] = token.group(1)
+
+        for _ in range(SIGNUP_ATTEMPTS):
+            status, _, headers = self.call("POST /signup", 'POST', "/signup", form=form)
+            if status != 503:
+                break
+            time.sleep(float(headers.get('Retry-After') or 1))
+        if status != 302:
+            raise SignupFailed(f"{self.name}: signup returned {status}")
+
+        _, page, _ = self.call("GET /lists", 'GET', "/lists")
+        link = LIST_LINK.search(page)
+        if not link:
+            raise SignupFailed(f"{self.name}: no list after signing up")
+        self.list_id = int(link.group(1))
+
+    def journey(self):
+        self.call("GET /", 'GET', "/")
+
+        recipe_ids = []
+        for _ in range(3):
+            status, body, _ = self.call("GET /api/recipes/next", 'GET', "/api/recipes/next?n=9")
+            if status == 200:
+                recipe_ids += [recipe['id'] for recipe in json.loads(body)['recipes']]
+        if not recipe_ids:
+            return
+
+        recipe_id = self.rng.choice(recipe_ids)
+        self.call("POST /favorites/add", 'POST', "/favorites/add", payload={'recipeId': recipe_id})
+        if self.rng.random() < 0.3:
+            self.call("POST /favorites/remove", 'POST', "/favorites/remove", payload={'recipeId': recipe_id})
+
+        self.call("POST /lists/add", 'POST', "/lists/add",
+                  payload={'listTitle': "My List", 'recipeId': self.rng.choice(recipe_ids)})
+        self.call("GET /lists", 'GET', "/lists")
+        self.call("GET /lists/<id>", 'GET', f"/lists/{self.list_id}")
+        self.call("GET /favorites", 'GET', "/favorites")
+
+
+def run(make_client, users, seconds, seed_value):
+    """Run `users` virtual users for `seconds`; return per-route results."""
+
+    recorder = Recorder()
+    run_id = secrets.token_hex(3)
+    deadline = time.perf_counter() + seconds
+    failures = []
+
+    def drive(i):
+        try:
+            user = VirtualUser(make_client(), recorder, f"load{run_id}u{i}", random.Random(seed_value + i))
+            user.signup()
+            while time.perf_counter() < deadline:
+                user.journey()
+        except SignupFailed:
+            # Already recorded as a "signup" error; the rest of the run goes on.
+            pass
+        except Exception as e:
+            failures.append(e)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=drive, args=(i,)) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if failures:
+        raise failures[0]
+
+    return recorder.results(time.perf_counter() - start)
+
+
+def regressions(results, baseline, threshold):
+    """Yield a message for each route that got slower or slower to serve than its baseline."""
+
+    for route, old in baseline['routes'].items():
+        new = results.get(route)
+        if new is None:
+            continue
+        if new['p95_ms'] > old['p95_ms'] * (1 + threshold):
+            yield f"{route}: p95 {old['p95_ms']:.1f} ms -> {new['p95_ms']:.1f} ms"
+        if new['rps'] < old['rps'] * (1 - threshold):
+            yield f"{route}: {old['rps']:.1f} -> {new['rps']:.1f} requests/s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=8, help="concurrent virtual users")
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--recipes', type=int, default=100_000, help="recipes to seed, with a tenth as many users")
+    parser.add_argument('--no-seed', action='store_true', help="keep the database's current data")
+    parser.add_argument('--url', help="base URL of a running server, instead of the test client")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for the journeys")
+    parser.add_argument('--save', help="write results to this JSON file")
+    parser.add_argument('--baseline', help="compare against this JSON file")
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed slowdown, as a fraction")
+    args = parser.parse_args()
+
+    # Seeding drops every table, so never let it fall back to DATABASE_URL.
+    if not args.no_seed and 'BENCH_DATABASE_URL' not in os.environ:
+        parser.error("seeding drops every table; set BENCH_DATABASE_URL to a scratch database, "
+                     "or pass --no-seed")
+
+    from app import app
+    from models import db
+
+    if not args.no_seed:
+        with app.app_context():
+            seed(db, args.recipes)
+
+    if args.url:
+        make_client = lambda: HTTPClient(args.url)
+    else:
+        make_client = lambda: InProcessClient(app)
+
+    results = run(make_client, args.users, args.seconds, args.seed)
+
+    print(f"{args.users} users for {args.seconds:g}s against {args.url or 'the test client'}")
+    print(f"{'route':<24} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, r in results.items():
+        print(f"{route:<24} {r['requests']:>8} {r['errors']:>6} {r['rps']:>8.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump({'users': args.users, 'seconds': args.seconds, 'url': args.url,
+                       'routes': results}, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline['users'], baseline['url']) != (args.users, args.url):
+            print(f"Warning: the baseline ran {baseline['users']} users against "
+                  f"{baseline['url'] or 'the test client'}")
+        found = list(regressions(results, baseline, args.threshold))
+        for message in found:
+            print(f"REGRESSION {message}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
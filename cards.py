@@ -0,0 +1,62 @@
+"""Recipe cards rendered once per recipe version.
+
+Every page of recipes shows the same card for a recipe, apart from the heart
+(favorited or not) and, on lists, a delete link. The `card` macro in
+templates/recipe_card.html is rendered once per (recipe id, updated_at) with
+placeholders for those per-user bits, split around them and kept in an LRU.
+A page of cards is then mostly cache hits joined with the user's bits.
+
+Templates call it as
+
+    {{ recipe_card(recipe, recipe.id in favorite_ids) }}
+"""
+
+import secrets
+
+from flask import get_template_attribute
+from markupsafe import Markup, escape
+
+from cache import TTLCache
+
+# Random per process, so no escaped recipe title can contain them.
+HEART = f"heart-{secrets.token_hex(8)}"
+EXTRA = f"extra-{secrets.token_hex(8)}"
+
+DELETE_LINK = '<a href="{}" class="btn btn-outline-danger btn-sm">Delete</a>'
+
+
+class RecipeCards:
+    """Renders recipe cards for a Flask app's templates, from an LRU of fragments."""
+
+    def __init__(self, app=None):
+        self.cache = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache = TTLCache(maxsize=app.config.get('CARD_CACHE_SIZE', 10000))
+        app.jinja_env.globals['recipe_card'] = self.render
+
+    def fragments(self, recipe):
+        """Return the card's HTML split around the heart class and the extras."""
+
+        key = (recipe.id, recipe.updated_at)
+        parts = self.cache.get(key)
+
+        if parts is None:
+            card = get_template_attribute('recipe_card.html', 'card')
+            html = str(card(recipe, HEART, Markup(EXTRA)))
+            before, rest = html.split(HEART)
+            middle, after = rest.split(EXTRA)
+            parts = (before, middle, after)
+            self.cache.set(key, parts)
+
+        return parts
+
+    def render(self, recipe, favorited, delete_url=None):
+        """Return a recipe's card with the current user's heart and links."""
+
+        before, middle, after = self.fragments(recipe)
+        extra = DELETE_LINK.format(escape(delete_url)) if delete_url else ''
+        return Markup(before + ('fas' if favorited else 'far') + middle + extra + after)
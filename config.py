@@ -0,0 +1,107 @@
+"""Configuration profiles for create_app().
+
+Every setting can be overridden from the environment (or a .env file). Pick
+a profile with FLASK_CONFIG=development|testing|production.
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+from dbpool import engine_options
+
+load_dotenv()
+
+
+def database_url(default_name):
+    """DATABASE_URL if it's set, else a local database built from DB_* parts."""
+
+    url = os.environ.get('DATABASE_URL')
+
+    if url:
+        # Some hosts still hand out the scheme SQLAlchemy dropped.
+        return url.replace('postgres://', 'postgresql://', 1)
+
+    username = os.environ.get('DB_USERNAME', 'postgres')
+    password = os.environ.get('DB_PASSWORD', '')
+    host = os.environ.get('DB_HOST', 'localhost')
+    port = os.environ.get('DB_PORT', '5432')
+    return f'postgresql://{username}:{password}@{host}:{port}/{default_name}'
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = database_url('tender')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+    # See dbpool.py.
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        pool_size=int(os.environ.get('DB_POOL_SIZE', 5)),
+        max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        pool_timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        pre_ping=os.environ.get('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        statement_timeout=int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000)),
+        pgbouncer=os.environ.get('DB_PGBOUNCER', 'false').lower() == 'true',
+    )
+    SECRET_KEY = os.environ.get('SECRET_KEY', "it's a secret")
+    # Bearer token for /internal/ endpoints; without one they're only served
+    # in debug or testing.
+    INTERNAL_TOKEN = os.environ.get('INTERNAL_TOKEN')
+
+    DEBUG_TB_ENABLED = False
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+
+    RECIPE_SAMPLER = os.environ.get('RECIPE_SAMPLER', 'random_id')
+    RECIPE_SAMPLE_SIZE = int(os.environ.get('RECIPE_SAMPLE_SIZE', 3))
+    RECIPE_DECKS = os.environ.get('RECIPE_DECKS', 'true').lower() == 'true'
+    RECIPE_PAGE_SIZE = int(os.environ.get('RECIPE_PAGE_SIZE', 30))
+
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
+    # Seconds a worker trusts its cached copy of a user before re-reading their
+    # version; changes made through other workers can take this long to show.
+    USER_CACHE_REVALIDATE = int(os.environ.get('USER_CACHE_REVALIDATE', 5))
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+    LIST_CACHE_TTL = int(os.environ.get('LIST_CACHE_TTL', 300))
+    # Rendered recipe cards kept per worker; see cards.py.
+    CARD_CACHE_SIZE = int(os.environ.get('CARD_CACHE_SIZE', 10000))
+
+    # Defaults to instance/images.
+    IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR')
+    IMAGE_MAX_AGE = int(os.environ.get('IMAGE_MAX_AGE', 30 * 24 * 60 * 60))
+
+    # Accounts with more saved recipes than this are purged in the background;
+    # see purge.py.
+    ACCOUNT_PURGE_THRESHOLD = int(os.environ.get('ACCOUNT_PURGE_THRESHOLD', 10000))
+    ACCOUNT_PURGE_BATCH = int(os.environ.get('ACCOUNT_PURGE_BATCH', 5000))
+
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    # Request threads per gunicorn worker (see gunicorn.conf.py). Logins may
+    # hold PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE of them; the rest keep
+    # serving. See passwords.py.
+    WEB_THREADS = int(os.environ.get('WEB_THREADS', 8))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 2))
+
+
+class DevelopmentConfig(Config):
+    DEBUG_TB_ENABLED = os.environ.get('DEBUG_TB_ENABLED', 'true').lower() == 'true'
+    SQLALCHEMY_ECHO = os.environ.get('SQLALCHEMY_ECHO', 'false').lower() == 'true'
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = database_url('tender-test')
+    WTF_CSRF_ENABLED = False
+    # Fast hashes; tests don't need them to be strong.
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 4))
+
+
+class ProductionConfig(Config):
+    pass
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
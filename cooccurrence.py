@@ -0,0 +1,133 @@
+"""Vectorized co-occurrence build for recommend.py.
+
+Kept apart from recommend.py so the web app, which only applies incremental
+updates, never imports NumPy or SciPy.
+"""
+
+import io
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import text
+
+from models import db
+from recommend import NEIGHBORS, PER_USER
+
+
+def nonzero_rows(matrix):
+    """Return the row of each entry of a CSR matrix's data."""
+
+    return np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+
+
+def top_k(matrix, k):
+    """Return the positions in matrix.data of the k largest entries of each CSR row."""
+
+    rows = nonzero_rows(matrix)
+    order = np.lexsort((matrix.indices, -matrix.data, rows))
+    rank = np.arange(len(order)) - matrix.indptr[rows[order]]
+    return order[rank < k]
+
+
+def load_baskets(conn):
+    """Return a CSR baskets x recipes matrix of every list and favorites set."""
+
+    favorites = np.array(conn.execute(text(
+        "SELECT user_id, recipe_id FROM users_favorites_recipes"
+    )).fetchall(), dtype=np.int64).reshape(-1, 2)
+    lists = np.array(conn.execute(text(
+        "SELECT list_id, recipe_id FROM lists_recipes"
+    )).fetchall(), dtype=np.int64).reshape(-1, 2)
+
+    # Lists are numbered after the users so the two kinds of basket don't collide.
+    offset = favorites[:, 0].max() + 1 if len(favorites) else 0
+    baskets = np.concatenate([favorites[:, 0], lists[:, 0] + offset])
+    recipes = np.concatenate([favorites[:, 1], lists[:, 1]])
+    n_recipes = recipes.max() + 1 if len(recipes) else 0
+
+    return sparse.csr_matrix(
+        (np.ones(len(baskets), dtype=np.float64), (baskets, recipes)),
+        shape=(baskets.max() + 1 if len(baskets) else 0, n_recipes),
+    )
+
+
+def load_saved(conn, n_recipes):
+    """Return a CSR users x recipes matrix of the recipes each user has saved."""
+
+    rows = np.array(conn.execute(text("""
+        SELECT user_id, recipe_id FROM users_favorites_recipes
+        UNION
+        SELECT lists.user_id, lists_recipes.recipe_id
+        FROM lists_recipes JOIN lists ON lists.id = lists_recipes.list_id
+    """)).fetchall(), dtype=np.int64).reshape(-1, 2)
+
+    return sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float64), (rows[:, 0], rows[:, 1])),
+        shape=(rows[:, 0].max() + 1 if len(rows) else 0, n_recipes),
+    )
+
+
+def neighbor_matrix(baskets, k=NEIGHBORS):
+    """Return (recipes, neighbors, counts, scores) arrays of each recipe's top k neighbors."""
+
+    counts = (baskets.T @ baskets).tocsr()
+    popularity = counts.diagonal()
+    counts.setdiag(0)
+    counts.eliminate_zeros()
+
+    rows = nonzero_rows(counts)
+    scores = counts.data / np.sqrt(popularity[rows] * popularity[counts.indices])
+
+    keep = top_k(sparse.csr_matrix((scores, counts.indices, counts.indptr), shape=counts.shape), k)
+    return rows[keep], counts.indices[keep], counts.data[keep], scores[keep]
+
+
+def recommendation_matrix(saved, neighbors, n=PER_USER):
+    """Return (users, recipes, scores) arrays of each user's top n unsaved neighbors."""
+
+    summed = (saved @ neighbors).tocsr()
+    summed = (summed - summed.multiply(saved)).tocsr()
+    summed.eliminate_zeros()
+
+    keep = top_k(summed, n)
+    return nonzero_rows(summed)[keep], summed.indices[keep], summed.data[keep]
+
+
+def copy_rows(cursor, table, columns, *arrays):
+    """COPY equal-length arrays into a table as CSV."""
+
+    out = io.StringIO()
+    np.savetxt(out, np.column_stack(arrays), delimiter=',',
+               fmt=['%d'] * (len(arrays) - 1) + ['%.9g'])
+    out.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", out)
+
+
+def build(neighbors=NEIGHBORS, per_user=PER_USER, log=print):
+    """Rebuild recipe_neighbors and user_recommendations from scratch."""
+
+    with db.engine.connect() as conn:
+        # Builds outlast the per-statement cap meant for web requests.
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        baskets = load_baskets(conn)
+        saved = load_saved(conn, baskets.shape[1])
+
+    rows, cols, counts, scores = neighbor_matrix(baskets, neighbors)
+    matrix = sparse.csr_matrix((scores, (rows, cols)), shape=(baskets.shape[1],) * 2)
+    users, recipes, totals = recommendation_matrix(saved, matrix, per_user)
+    log(f"{baskets.shape[0]} baskets, {len(rows)} neighbor pairs, {len(users)} recommendations")
+
+    # Readers keep seeing the old rows until the new ones are committed.
+    conn = db.engine.raw_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = 0")
+            cursor.execute("DELETE FROM recipe_neighbors")
+            copy_rows(cursor, 'recipe_neighbors', ['recipe_id', 'neighbor_id', 'count', 'score'],
+                      rows, cols, counts, scores)
+            cursor.execute("DELETE FROM user_recommendations")
+            copy_rows(cursor, 'user_recommendations', ['user_id', 'recipe_id', 'score'],
+                      users, recipes, totals)
+        conn.commit()
+    finally:
+        conn.close()
@@ -0,0 +1,139 @@
+"""Database connection pool settings and instrumentation.
+
+Each worker keeps its own pool of `DB_POOL_SIZE` connections, plus up to
+`DB_MAX_OVERFLOW` more under bursts, and waits at most `DB_POOL_TIMEOUT`
+seconds for one. Connections are pinged before use and replaced after
+`DB_POOL_RECYCLE` seconds, so a database failover costs one failed ping per
+stale connection rather than a failed request. Every statement is capped at
+`DB_STATEMENT_TIMEOUT` milliseconds.
+
+With DB_PGBOUNCER=true the app keeps no pool of its own (PgBouncer in
+transaction mode does the pooling) and sends no startup options, which
+PgBouncer rejects; set the statement timeout on the database role instead:
+
+    ALTER ROLE tender SET statement_timeout = '30s';
+
+To size workers, keep workers x (pool size + max overflow) below Postgres
+max_connections, minus what migrations and psql sessions need.
+"""
+
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+
+def engine_options(pool_size=5, max_overflow=10, pool_timeout=10, pool_recycle=1800,
+                   pre_ping=True, statement_timeout=30000, pgbouncer=False):
+    """Return SQLALCHEMY_ENGINE_OPTIONS for these pool settings."""
+
+    if pgbouncer:
+        return {'poolclass': NullPool}
+
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+        'pool_recycle': pool_recycle,
+        'pool_pre_ping': pre_ping,
+        'connect_args': {'options': f"-c statement_timeout={statement_timeout}"},
+    }
+
+
+class PoolStats:
+    """Counters for one worker's connection pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pool = None
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+
+    def waited(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def timed_out(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def connected(self, *args):
+        with self._lock:
+            self.connects += 1
+
+    def invalidated(self, *args):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        """Return the counters and the pool's current state as a dict."""
+
+        with self._lock:
+            stats = {
+                'checkouts': self.checkouts,
+                'wait_avg_ms': 1000 * self.wait_total / self.checkouts if self.checkouts else 0.0,
+                'wait_max_ms': 1000 * self.wait_max,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+            }
+
+        if isinstance(self.pool, QueuePool):
+            stats.update({
+                'size': self.pool.size(),
+                'checked_out': self.pool.checkedout(),
+                # Negative while the pool hasn't opened all its connections yet.
+                'overflow': max(self.pool.overflow(), 0),
+                'max_overflow': self.pool._max_overflow,
+            })
+
+        return stats
+
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool that reports how long each checkout waited."""
+
+    stats = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            if self.stats:
+                self.stats.timed_out()
+            raise
+        if self.stats:
+            self.stats.waited(time.perf_counter() - start)
+        return conn
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        if self.stats:
+            self.stats.pool = pool
+        return pool
+
+
+def instrument(engine):
+    """Attach a PoolStats to an engine's pool and return it."""
+
+    stats = PoolStats()
+    stats.pool = engine.pool
+
+    if isinstance(engine.pool, TimedQueuePool):
+        engine.pool.stats = stats
+
+    event.listen(engine, 'connect', stats.connected)
+    event.listen(engine, 'invalidate', stats.invalidated)
+    event.listen(engine, 'soft_invalidate', stats.invalidated)
+    return stats
@@ -0,0 +1,171 @@
+"""Per-user shuffled recipe decks.
+
+A deck deals recipes in a shuffled order without repeats until every recipe
+has been seen. The shuffle is never materialized: each segment of the id
+range is walked through a keyed permutation, so a deck only stores a seed and
+one (low, high, cursor) triple per segment, which fits in the session.
+
+Recipes added after the deck was shuffled get their own segment, which is
+merged into the remaining cards rather than reshuffling everything. Spent
+segments are dropped and untouched neighbours joined, and past MAX_SEGMENTS
+the two closest segments are folded into one fresh segment, so a long-lived
+session's deck stays small. Only a fold can deal a card twice.
+"""
+
+import hashlib
+import os
+import random
+
+from sqlalchemy import func
+
+from models import db, Recipe
+
+FEISTEL_ROUNDS = 4
+MAX_SEGMENTS = 8
+
+
+class Permutation:
+    """Keyed bijection on range(size), built from a small Feistel network.
+
+    Values that land outside range(size) are fed back in (cycle walking),
+    which keeps the mapping a permutation of range(size).
+    """
+
+    def __init__(self, key, size):
+        self.key = key
+        self.size = size
+        self.half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+        self.mask = (1 << self.half_bits) - 1
+
+    def _round(self, i, value):
+        digest = hashlib.blake2b(f"{i}:{value}".encode(), key=self.key, digest_size=8).digest()
+        return int.from_bytes(digest, 'big') & self.mask
+
+    def _encrypt(self, value):
+        left, right = value >> self.half_bits, value & self.mask
+        for i in range(FEISTEL_ROUNDS):
+            left, right = right, left ^ self._round(i, right)
+        return (left << self.half_bits) | right
+
+    def __getitem__(self, index):
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+
+class RecipeDeck:
+    """A shuffled, resumable deck of recipe ids.
+
+    `segments` is a list of [low, high, cursor] triples: ids low..high are
+    dealt in permuted order and `cursor` cards of that segment are used up.
+    `high` is the largest id the deck has covered, dealt or not. Ids that no
+    longer exist are skipped when dealt.
+    """
+
+    def __init__(self, seed, segments, high=None):
+        self.seed = seed
+        self.segments = segments
+        self.high = high if high is not None else max((s[1] for s in segments), default=None)
+
+    @classmethod
+    def shuffle(cls, low, high):
+        """Start a new deck over recipe ids low..high."""
+
+        segments = [[low, high, 0]] if low is not None else []
+        return cls(os.urandom(8).hex(), segments, high)
+
+    @classmethod
+    def from_session(cls, data):
+        return cls(data['seed'], [list(segment) for segment in data['segments']], data.get('high'))
+
+    def to_session(self):
+        return {'seed': self.seed, 'segments': self.segments, 'high': self.high}
+
+    @property
+    def remaining(self):
+        return sum(high - low + 1 - cursor for low, high, cursor in self.segments)
+
+    def merge(self, high):
+        """Add recipes with ids above the deck's current range."""
+
+        if high is None or (self.high is not None and high <= self.high):
+            return
+
+        self.segments.append([1 if self.high is None else self.high + 1, high, 0])
+        self.high = high
+        self._compact()
+
+    def _compact(self):
+        """Drop spent segments, join untouched neighbours and cap how many are kept."""
+
+        segments = []
+        for segment in self.segments:
+            low, high, cursor = segment
+            if cursor >= high - low + 1:
+                continue
+            if segments and segments[-1][2] == 0 and cursor == 0 and segments[-1][1] + 1 == low:
+                segments[-1][1] = high
+            else:
+                segments.append(segment)
+
+        while len(segments) > MAX_SEGMENTS:
+            # Fold the pair spanning the fewest ids; their dealt cards may come round again.
+            i = min(range(len(segments) - 1), key=lambda i: segments[i + 1][1] - segments[i][0])
+            segments[i:i + 2] = [[segments[i][0], segments[i + 1][1], 0]]
+
+        self.segments = segments
+
+    def _next_id(self):
+        """Take the next id off the deck, picking a segment by cards left."""
+
+        live = [s for s in self.segments if s[2] < s[1] - s[0] + 1]
+        pick = random.randrange(sum(s[1] - s[0] + 1 - s[2] for s in live))
+
+        for segment in live:
+            low, high, cursor = segment
+            left = high - low + 1 - cursor
+            if pick < left:
+                # Keyed by the whole range, so a folded segment gets a new order.
+                key = hashlib.blake2b(f"{self.seed}:{low}:{high}".encode(), digest_size=16).digest()
+                segment[2] += 1
+                return low + Permutation(key, high - low + 1)[cursor]
+            pick -= left
+
+    def deal(self, n):
+        """Return up to n recipes that haven't been dealt from this deck.
+
+        Candidate ids are fetched in batches with one primary key lookup per
+        batch; ids that were deleted are skipped.
+        """
+
+        dealt = []
+
+        while len(dealt) < n and self.remaining:
+            batch = [self._next_id() for _ in range(min(self.remaining, (n - len(dealt)) * 2))]
+            found = {r.id: r for r in Recipe.query.filter(Recipe.id.in_(batch)).all()}
+            hits = [found[i] for i in batch if i in found]
+
+            # Put back the cards we drew but don't need, so they are dealt later.
+            extra = hits[n - len(dealt):]
+            dealt.extend(hits[:n - len(dealt)])
+            if extra:
+                self._put_back(batch, batch.index(extra[0].id))
+
+        self._compact()
+        return dealt
+
+    def _put_back(self, batch, start):
+        """Undo the draws of batch[start:]."""
+
+        for recipe_id in reversed(batch[start:]):
+            for segment in self.segments:
+                if segment[0] <= recipe_id <= segment[1]:
+                    segment[2] -= 1
+                    break
+
+
+def get_recipe_bounds():
+    """Return the smallest and largest recipe id (index-only lookups)."""
+
+    return db.session.query(func.min(Recipe.id), func.max(Recipe.id)).one()
@@ -0,0 +1,12 @@
+"""gunicorn settings; see "Running" in README.md."""
+
+import os
+
+# Build the app once, before forking (see create_app).
+preload_app = True
+
+# Threaded workers, so a login waiting on bcrypt doesn't hold the whole
+# worker; passwords.py bounds how many threads hashing may take.
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('WEB_THREADS', 8))
@@ -0,0 +1,169 @@
+"""Local cache of recipe images.
+
+Each recipe's image is fetched from its origin once, stored on disk under
+the SHA-256 of its bytes, and resized into a few fixed variants. A small
+index file per recipe maps it to its digest, so serving a cached image needs
+neither the database nor the origin. Concurrent misses for the same recipe
+wait for a single fetch.
+
+Pages link to `image_path(recipe, size)`, which carries a digest of the
+recipe's image URL. A cached image is only served without asking the database
+when that digest matches, so a recipe whose image changes gets the new one.
+Only http(s) origins are fetched.
+
+Resizing needs Pillow; without it every size serves the original image.
+"""
+
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import threading
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from urllib.request import HTTPRedirectHandler, build_opener
+
+# Pillow is only imported on the first resize.
+HAVE_PILLOW = importlib.util.find_spec('PIL') is not None
+
+# Longest side in pixels; None keeps the original.
+SIZES = {
+    'thumb': 160,
+    'card': 480,
+    'full': None,
+}
+
+MAX_BYTES = 10 * 1024 * 1024
+LOCK_STRIPES = 64
+SCHEMES = ('http', 'https')
+
+
+class ImageFetchError(Exception):
+    """The origin didn't return a usable image."""
+
+
+def is_remote(url):
+    """Is `url` an http(s) URL we may fetch or redirect to?"""
+
+    return bool(url) and urlsplit(url).scheme in SCHEMES
+
+
+def url_version(url):
+    """A short digest of an image URL, to tell cached images from stale ones."""
+
+    return hashlib.sha256(url.encode()).hexdigest()[:12]
+
+
+def image_path(recipe, size):
+    """The local URL of a size of a recipe's image."""
+
+    return f"/img/{recipe.id}/{size}?v={url_version(recipe.image_url)}"
+
+
+class RemoteRedirects(HTTPRedirectHandler):
+    """Follow redirects only to other http(s) URLs."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not is_remote(newurl):
+            raise HTTPError(newurl, code, "redirect to a non-http(s) URL", headers, fp)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+class ImageStore:
+    """Content-addressed image files under `root`.
+
+    Layout:
+        index/<recipe_id>.json     {"url", "digest", "content_type"}
+        objects/<digest>           original bytes
+        variants/<digest>-<size>   resized JPEGs
+    """
+
+    def __init__(self, root, timeout=10):
+        self.root = root
+        self.timeout = timeout
+        self._opener = build_opener(RemoteRedirects)
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _lock(self, key):
+        # Striped so that equal keys share a lock without keeping one per key.
+        return self._locks[hash(key) % LOCK_STRIPES]
+
+    def cached(self, recipe_id):
+        """Return the index entry for a recipe, or None if it isn't cached."""
+
+        try:
+            with open(self._path('index', f"{recipe_id}.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def fetch(self, recipe_id, url):
+        """Download and store a recipe's image, once per recipe at a time."""
+
+        with self._lock(recipe_id):
+            entry = self.cached(recipe_id)
+            if entry is not None and entry['url'] == url:
+                return entry
+
+            if not is_remote(url):
+                raise ImageFetchError(f"{url!r} isn't an http(s) URL")
+
+            try:
+                with self._opener.open(url, timeout=self.timeout) as resp:
+                    data = resp.read(MAX_BYTES + 1)
+                    content_type = resp.headers.get_content_type()
+            except OSError as e:
+                raise ImageFetchError(f"Couldn't fetch {url}: {e}")
+
+            if len(data) > MAX_BYTES or not content_type.startswith('image/'):
+                raise ImageFetchError(f"{url} isn't an image we can cache")
+
+            digest = hashlib.sha256(data).hexdigest()
+            if not os.path.exists(self._path('objects', digest)):
+                self._write(self._path('objects', digest), data)
+
+            entry = {'url': url, 'digest': digest, 'content_type': content_type}
+            self._write(self._path('index', f"{recipe_id}.json"), json.dumps(entry).encode())
+            return entry
+
+    def variant(self, entry, size):
+        """Return (path, content_type, etag) for a size of a stored image."""
+
+        digest = entry['digest']
+        original = self._path('objects', digest)
+
+        if SIZES[size] is None or not HAVE_PILLOW:
+            return original, entry['content_type'], digest
+
+        path = self._path('variants', f"{digest}-{size}")
+        if not os.path.exists(path):
+            with self._lock((digest, size)):
+                if not os.path.exists(path):
+                    try:
+                        self._write(path, self._resize(original, SIZES[size]))
+                    except OSError:
+                        # Pillow can't read it; the browser may still manage.
+                        return original, entry['content_type'], digest
+
+        return path, 'image/jpeg', f"{digest}-{size}"
+
+    def _resize(self, path, longest):
+        from PIL import Image
+
+        with Image.open(path) as image:
+            image = image.convert('RGB')
+            image.thumbnail((longest, longest))
+            out = io.BytesIO()
+            image.save(out, 'JPEG', quality=85, optimize=True)
+            return out.getvalue()
@@ -0,0 +1,180 @@
+"""Load recipes from the Spoonacular API into the recipes table.
+
+Pages of search results are fetched a few at a time in parallel and upserted
+on `source_id` in large batches, so re-running the command updates recipes
+instead of failing on duplicates. After each batch is committed the next
+offset is written to a checkpoint file, and an interrupted run picks up from
+there.
+
+run like:
+
+    API_KEY=... python ingest.py [--limit 5000] [--concurrency 4]
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Recipe
+
+API_URL = "https://api.spoonacular.com"
+PAGE_SIZE = 100
+RETRIES = 3
+BACKOFF = 1
+
+
+class Checkpoint:
+    """The offset of the first page that hasn't been committed yet."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)['next_offset']
+        except FileNotFoundError:
+            return 0
+
+    def save(self, next_offset):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'next_offset': next_offset}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def fetch_page(base_url, api_key, offset, number=PAGE_SIZE, timeout=30):
+    """Fetch one page of search results, retrying on server errors."""
+
+    query = urlencode({'apiKey': api_key, 'offset': offset, 'number': number})
+
+    for attempt in range(RETRIES):
+        try:
+            with urlopen(f"{base_url}/recipes/complexSearch?{query}", timeout=timeout) as resp:
+                return json.load(resp)
+        except HTTPError as e:
+            if e.code != 429 and e.code < 500 or attempt == RETRIES - 1:
+                raise
+        except URLError:
+            if attempt == RETRIES - 1:
+                raise
+        time.sleep(BACKOFF * 2 ** attempt)
+
+
+def upsert_recipes(results):
+    """Insert or update a batch of API results on source_id."""
+
+    rows = {
+        r['id']: {'source_id': r['id'], 'title': r['title'], 'image_url': r.get('image', '')}
+        for r in results
+    }
+
+    if not rows:
+        return
+
+    stmt = insert(Recipe).values(list(rows.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Recipe.source_id],
+        set_={
+            'title': stmt.excluded.title,
+            'image_url': stmt.excluded.image_url,
+            'updated_at': case(
+                (Recipe.title.is_distinct_from(stmt.excluded.title)
+                 | Recipe.image_url.is_distinct_from(stmt.excluded.image_url), func.now()),
+                else_=Recipe.updated_at,
+            ),
+        },
+    )
+    db.session.execute(stmt)
+    db.session.commit()
+
+
+def ingest(base_url, api_key, checkpoint, limit=None, concurrency=4, batch_size=1000, log=print):
+    """Page through the API from the checkpoint, upserting as we go.
+
+    Returns the number of recipes written.
+    """
+
+    offset = checkpoint.load()
+    number = PAGE_SIZE if limit is None else min(PAGE_SIZE, limit - offset)
+
+    if number <= 0:
+        checkpoint.clear()
+        return 0
+
+    first = fetch_page(base_url, api_key, offset, number)
+    total = first['totalResults'] if limit is None else min(limit, first['totalResults'])
+
+    def fetch(page_offset):
+        return fetch_page(base_url, api_key, page_offset, min(PAGE_SIZE, total - page_offset))
+
+    offsets = iter(range(offset + PAGE_SIZE, total, PAGE_SIZE))
+    pending = deque()
+    batch = list(first['results'])
+    next_offset = offset + PAGE_SIZE
+    written = 0
+
+    def flush():
+        nonlocal batch, written
+        upsert_recipes(batch)
+        checkpoint.save(min(next_offset, total))
+        written += len(batch)
+        log(f"Committed {written} recipes, next offset {min(next_offset, total)} of {total}")
+        batch = []
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Keep a bounded window of requests in flight and consume them in
+        # order, so the checkpoint only ever covers committed pages.
+        for page_offset in offsets:
+            pending.append(pool.submit(fetch, page_offset))
+            if len(pending) >= concurrency * 2:
+                break
+
+        while pending:
+            page = pending.popleft().result()
+            batch.extend(page['results'])
+            next_offset += PAGE_SIZE
+
+            page_offset = next(offsets, None)
+            if page_offset is not None:
+                pending.append(pool.submit(fetch, page_offset))
+
+            if len(batch) >= batch_size:
+                flush()
+
+    flush()
+    checkpoint.clear()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--limit', type=int, help="stop after this many recipes")
+    parser.add_argument('--concurrency', type=int, default=4, help="requests in flight")
+    parser.add_argument('--batch-size', type=int, default=1000, help="recipes per upsert")
+    parser.add_argument('--checkpoint', default='.ingest-checkpoint.json')
+    parser.add_argument('--api-url', default=os.environ.get('API_URL', API_URL))
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        ingest(args.api_url, os.environ["API_KEY"], Checkpoint(args.checkpoint),
+               limit=args.limit, concurrency=args.concurrency, batch_size=args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Per-route latency and SQL instrumentation, exported for Prometheus.
+
+Every request records its latency, how many SQL statements it ran and how
+long they took, labelled by endpoint. `/metrics` serves the totals (and the
+connection pool counters from dbpool.py) in Prometheus text format.
+
+Like the caches, the counters live in each gunicorn worker, so scrape every
+worker (or run one per container) rather than the load-balanced address.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def format_labels(labels):
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    """Cumulative bucket counts, a sum and a count, as Prometheus keeps them."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        for bound, count in zip(self.buckets, self.counts):
+            yield f"{name}_bucket{format_labels(labels + [('le', bound)])} {count}"
+        yield f"{name}_bucket{format_labels(labels + [('le', '+Inf')])} {self.count}"
+        yield f"{name}_sum{format_labels(labels)} {self.sum}"
+        yield f"{name}_count{format_labels(labels)} {self.count}"
+
+
+class Metrics:
+    """Records request and SQL metrics for a Flask app and its engine."""
+
+    def __init__(self, app=None, engine=None):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.latency = {}
+        self.queries = {}
+        self.db_seconds = {}
+
+        if app is not None:
+            self.init_app(app, engine)
+
+    def init_app(self, app, engine):
+        app.before_request(self._start)
+        app.after_request(self._status)
+        # Teardown runs even when a view raises, so 500s are counted too.
+        app.teardown_request(self._finish)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    def _start(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_db_seconds = 0.0
+
+    def _status(self, response):
+        g.metrics_status = response.status_code
+        return response
+
+    def _finish(self, exc):
+        if 'metrics_start' not in g:
+            return
+
+        elapsed = time.perf_counter() - g.metrics_start
+        endpoint = request.endpoint or 'unmatched'
+        # No response was made if the view raised.
+        status = g.get('metrics_status', 500)
+
+        with self._lock:
+            key = (endpoint, request.method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.latency.setdefault((endpoint, request.method), Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self.queries.setdefault(endpoint, Histogram(QUERY_BUCKETS)).observe(g.metrics_queries)
+            self.db_seconds[endpoint] = self.db_seconds.get(endpoint, 0.0) + g.metrics_db_seconds
+
+    # Statements from background threads (e.g. recommendation updates) have
+    # no request to charge them to, so they aren't counted.
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'metrics_start' in g:
+            conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('metrics_started')
+        if started and has_request_context() and 'metrics_start' in g:
+            g.metrics_queries += 1
+            g.metrics_db_seconds += time.perf_counter() - started.pop()
+
+    def _handle_error(self, context):
+        # A failed statement never reaches after_cursor_execute; drop its start
+        # time so it doesn't skew the next statement on this connection.
+        conn = context.connection
+        started = conn.info.get('metrics_started') if conn is not None else None
+        if started and has_request_context() and 'metrics_start' in g:
+            g.metrics_queries += 1
+            g.metrics_db_seconds += time.perf_counter() - started.pop()
+
+    def render(self, pool_stats=None):
+        """Return every metric in Prometheus text format."""
+
+        lines = []
+
+        with self._lock:
+            lines += ["# HELP tender_http_requests_total Requests served.",
+                      "# TYPE tender_http_requests_total counter"]
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                labels = [('endpoint', endpoint), ('method', method), ('status', status)]
+                lines.append(f"tender_http_requests_total{format_labels(labels)} {count}")
+
+            lines += ["# HELP tender_http_request_duration_seconds Request latency.",
+                      "# TYPE tender_http_request_duration_seconds histogram"]
+            for (endpoint, method), histogram in sorted(self.latency.items()):
+                lines += histogram.lines('tender_http_request_duration_seconds',
+                                         [('endpoint', endpoint), ('method', method)])
+
+            lines += ["# HELP tender_db_statements_per_request SQL statements run by one request.",
+                      "# TYPE tender_db_statements_per_request histogram"]
+            for endpoint, histogram in sorted(self.queries.items()):
+                lines += histogram.lines('tender_db_statements_per_request', [('endpoint', endpoint)])
+
+            lines += ["# HELP tender_db_seconds_total Time spent in SQL statements.",
+                      "# TYPE tender_db_seconds_total counter"]
+            for endpoint, seconds in sorted(self.db_seconds.items()):
+                lines.append(f"tender_db_seconds_total{format_labels([('endpoint', endpoint)])} {seconds}")
+
+        if pool_stats is not None:
+            for name, value in pool_stats.snapshot().items():
+                kind = 'counter' if name in ('checkouts', 'timeouts', 'connects', 'invalidations') else 'gauge'
+                metric = f"tender_db_pool_{name}" + ('_total' if kind == 'counter' else '')
+                lines += [f"# TYPE {metric} {kind}", f"{metric} {value}"]
+
+        return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def query_budget(engine, budget):
+    """Fail if the code in this block runs more than `budget` SQL statements.
+
+    Only the calling thread's statements count. Yields the statement list.
+    """
+
+    thread = threading.current_thread()
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        if threading.current_thread() is thread:
+            statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    if len(statements) > budget:
+        raise AssertionError(f"{len(statements)} statements, over the budget of {budget}:\n\n"
+                             + "\n\n".join(statements))
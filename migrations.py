@@ -0,0 +1,216 @@
+"""Versioned schema migrations for an existing database.
+
+`db.create_all()` only creates missing tables, so changes to tables that
+already exist (new indexes, new columns) are applied here instead. Applied
+versions are recorded in the schema_migrations table, and every step is
+written so that re-running it is harmless. Indexes are built CONCURRENTLY and
+big updates run in small batches so the app can keep serving while a
+migration runs.
+
+A migration's `done` query tells whether the schema already has its change,
+as in a database just made by create_all(); such migrations are recorded
+without running their steps.
+
+run like:
+
+    python migrations.py [target_version]
+"""
+
+import sys
+from collections import namedtuple
+
+from sqlalchemy import text
+
+BATCH_SIZE = 5000
+
+# A step is either a SQL string or a callable taking an autocommit connection.
+Migration = namedtuple('Migration', ['version', 'description', 'done', 'steps'])
+
+
+def column_exists(table, column):
+    return (f"SELECT EXISTS (SELECT 1 FROM information_schema.columns "
+            f"WHERE table_name = '{table}' AND column_name = '{column}')")
+
+
+def backfill_list_user_ids(conn):
+    """Copy each list's owner id over from its username, a batch at a time."""
+
+    while True:
+        result = conn.execute(text("""
+            UPDATE lists SET user_id = users.id
+            FROM users
+            WHERE lists.username = users.username
+              AND lists.id IN (
+                  SELECT lists.id FROM lists JOIN users ON users.username = lists.username
+                  WHERE lists.user_id IS NULL
+                  LIMIT :batch
+              )
+        """), {'batch': BATCH_SIZE})
+        if result.rowcount == 0:
+            break
+
+
+def add_trigram_index(conn):
+    """Install pg_trgm and index titles with it, if the server ships it."""
+
+    available = conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')"
+    )).scalar()
+
+    if available:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_recipes_title_trgm "
+                          "ON recipes USING gin (title gin_trgm_ops)"))
+
+
+MIGRATIONS = [
+    Migration(1, "Add secondary indexes for list and recipe lookups",
+              "SELECT to_regclass('ix_lists_recipes_recipe_id') IS NOT NULL", [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_lists_username_title "
+        "ON lists (username, title)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_lists_recipes_recipe_id "
+        "ON lists_recipes (recipe_id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_favorites_recipes_recipe_id "
+        "ON users_favorites_recipes (recipe_id)",
+    ]),
+
+    # Lists move from a text username FK to an integer user id. Run 2, deploy
+    # code that uses lists.user_id, then run 3. Between the two, a trigger
+    # fills user_id for rows that are still written by username.
+    Migration(2, "Add lists.user_id and backfill it from lists.username",
+              f"SELECT NOT ({column_exists('lists', 'username')})", [
+        "SET lock_timeout = '5s'",
+        "ALTER TABLE lists ADD COLUMN IF NOT EXISTS user_id integer",
+        "ALTER TABLE lists ALTER COLUMN username DROP NOT NULL",
+        """
+        CREATE OR REPLACE FUNCTION lists_fill_user_id() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.user_id IS NULL THEN
+                SELECT id INTO NEW.user_id FROM users WHERE username = NEW.username;
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS lists_fill_user_id ON lists",
+        "CREATE TRIGGER lists_fill_user_id BEFORE INSERT OR UPDATE ON lists "
+        "FOR EACH ROW EXECUTE FUNCTION lists_fill_user_id()",
+        backfill_list_user_ids,
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'lists_user_id_fkey') THEN
+                ALTER TABLE lists ADD CONSTRAINT lists_user_id_fkey
+                    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE NOT VALID;
+            END IF;
+        END
+        $$
+        """,
+        "ALTER TABLE lists VALIDATE CONSTRAINT lists_user_id_fkey",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_lists_user_id_title ON lists (user_id, title)",
+    ]),
+
+    Migration(3, "Make lists.user_id required and drop lists.username",
+              f"SELECT NOT ({column_exists('lists', 'username')})", [
+        "SET lock_timeout = '5s'",
+        backfill_list_user_ids,
+        # A validated CHECK lets SET NOT NULL skip its full-table scan.
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'lists_user_id_not_null') THEN
+                ALTER TABLE lists ADD CONSTRAINT lists_user_id_not_null
+                    CHECK (user_id IS NOT NULL) NOT VALID;
+            END IF;
+        END
+        $$
+        """,
+        "ALTER TABLE lists VALIDATE CONSTRAINT lists_user_id_not_null",
+        "ALTER TABLE lists ALTER COLUMN user_id SET NOT NULL",
+        "ALTER TABLE lists DROP CONSTRAINT lists_user_id_not_null",
+        "DROP TRIGGER IF EXISTS lists_fill_user_id ON lists",
+        "DROP FUNCTION IF EXISTS lists_fill_user_id()",
+        "DROP INDEX CONCURRENTLY IF EXISTS ix_lists_username_title",
+        "ALTER TABLE lists DROP COLUMN username",
+    ]),
+
+    # Adding a stored generated column rewrites recipes under an exclusive
+    # lock (about 8 s per million rows), so run this one off-peak.
+    Migration(4, "Add title search column and indexes", column_exists('recipes', 'title_tsv'), [
+        "ALTER TABLE recipes ADD COLUMN IF NOT EXISTS title_tsv tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', title)) STORED",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_recipes_title_tsv ON recipes USING gin (title_tsv)",
+        add_trigram_index,
+    ]),
+
+    # A constant default doesn't rewrite the table, so these are instant.
+    Migration(5, "Add user and list version counters", column_exists('lists', 'version'), [
+        "SET lock_timeout = '5s'",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1",
+        "ALTER TABLE lists ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1",
+    ]),
+
+    # now() is evaluated once for the existing rows, so this doesn't rewrite
+    # the table either.
+    Migration(6, "Add recipes.updated_at", column_exists('recipes', 'updated_at'), [
+        "SET lock_timeout = '5s'",
+        "ALTER TABLE recipes ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now()",
+    ]),
+]
+
+
+def current_version(conn):
+    """Return the highest applied migration version, creating the table if needed."""
+
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version integer PRIMARY KEY,
+            description text NOT NULL,
+            applied_at timestamptz NOT NULL DEFAULT now()
+        )
+    """))
+
+    return conn.execute(text("SELECT coalesce(max(version), 0) FROM schema_migrations")).scalar()
+
+
+def migrate(engine, target=None, log=print):
+    """Apply every migration newer than the database's version, up to `target`."""
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # Index builds and backfills outlast the cap meant for web requests.
+        conn.execute(text("SET statement_timeout = 0"))
+        try:
+            version = current_version(conn)
+
+            for migration in MIGRATIONS:
+                if migration.version <= version:
+                    continue
+                if target is not None and migration.version > target:
+                    break
+
+                if conn.execute(text(migration.done)).scalar():
+                    log(f"Recording migration {migration.version}: {migration.description}")
+                else:
+                    log(f"Applying migration {migration.version}: {migration.description}")
+                    for step in migration.steps:
+                        if callable(step):
+                            step(conn)
+                        else:
+                            conn.execute(text(step))
+
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, description) VALUES (:v, :d)"),
+                    {'v': migration.version, 'd': migration.description},
+                )
+        finally:
+            # Steps may SET lock_timeout too; don't leave either on a pooled connection.
+            conn.execute(text("RESET statement_timeout"))
+            conn.execute(text("RESET lock_timeout"))
+
+
+if __name__ == '__main__':
+    from app import app, db
+
+    with app.app_context():
+        db.create_all()
+        migrate(db.engine, int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -1,9 +1,13 @@
 import pdb
+from collections import namedtuple
 
-from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event, literal, select, text
+from sqlalchemy.dialects.postgresql import insert
+
+from dbpool import instrument
+from passwords import hasher
 
-bcrypt = Bcrypt()
 db = SQLAlchemy()
 
 def connect_db(app):
@@ -15,6 +19,24 @@ def connect_db(app):
     db.app = app
     db.init_app(app)
 
+    with app.app_context():
+        app.extensions['pool_stats'] = instrument(db.engine)
+
+
+# The columns of a user that pages need, without the password hash.
+UserProjection = namedtuple('UserProjection', ['id', 'username', 'email', 'first_name', 'last_name'])
+
+# Just enough of a list to link to it.
+ListProjection = namedtuple('ListProjection', ['id', 'title'])
+
+
+def trigram_available(ddl, target, bind, **kw):
+    """Can the pg_trgm extension be used on this connection?"""
+
+    return bind.dialect.name == 'postgresql' and bind.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')")
+    ).scalar()
+
 
 class User(db.Model):
     """User model"""
@@ -53,13 +75,40 @@ class User(db.Model):
         nullable=False,
     )
 
-    favorites = db.relationship('Recipe', secondary='users_favorites_recipes', backref='user')
+    # Bumped by every change that shows on the user's pages; see app.conditional.
+    version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+        server_default='1',
+    )
 
-    lists = db.relationship('List', backref='user')
+    # Deletes cascade in the database (see purge.py), so the ORM never loads
+    # these collections just to delete their rows.
+    favorites = db.relationship('Recipe', secondary='users_favorites_recipes', passive_deletes=True,
+                                backref=db.backref('user', passive_deletes=True))
+
+    lists = db.relationship('List', backref='user', cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return f"<User #{self.id}: {self.username}, {self.email}>"
 
+    @classmethod
+    def get_projection(cls, user_id):
+        """Load a UserProjection for `user_id`, or None if there is no such user."""
+
+        row = (db.session.query(cls.id, cls.username, cls.email, cls.first_name, cls.last_name)
+               .filter(cls.id == user_id)
+               .first())
+
+        return UserProjection(*row) if row else None
+
+    @classmethod
+    def bump_version(cls, user_id):
+        """Mark the user's pages as changed."""
+
+        db.session.execute(db.update(cls).where(cls.id == user_id).values(version=cls.version + 1))
+
     @classmethod
     def signup(cls, first_name, last_name, username, email, password):
         """Sign up user.
@@ -67,7 +116,7 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = hasher.hash(password)
 
         user = User(
             first_name=first_name,
@@ -89,22 +138,36 @@ class User(db.Model):
         and, if it finds such a user, returns that user object.
 
         If can't find matching user (or if password is wrong), returns False.
+
+        A hash made with an old work factor is replaced; the caller commits.
         """
 
         user = cls.query.filter_by(username=username).first()
 
-        if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
-            if is_auth:
-                return user
+        if user and user.check_password(password):
+            return user
 
         return False
 
+    def check_password(self, password):
+        """Does `password` match? Rehashes it if the work factor has changed."""
+
+        if not hasher.check(self.password, password):
+            return False
+
+        if hasher.needs_rehash(self.password):
+            self.password = hasher.hash(password)
+
+        return True
+
 
 class List(db.Model):
     """List model"""
 
     __tablename__ = 'lists'
+    __table_args__ = (
+        db.Index('ix_lists_user_id_title', 'user_id', 'title'),
+    )
 
     id = db.Column(
         db.Integer,
@@ -121,22 +184,55 @@ class List(db.Model):
         nullable=False,
     )
 
-    username = db.Column(
-        db.Text,
-        db.ForeignKey('users.username', ondelete='CASCADE', onupdate='CASCADE'),
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        nullable=False,
+    )
+
+    # Bumped whenever the list's recipes change.
+    version = db.Column(
+        db.Integer,
         nullable=False,
+        default=1,
+        server_default='1',
     )
 
-    recipes = db.relationship('Recipe', secondary='lists_recipes', backref='lists')
+    recipes = db.relationship('Recipe', secondary='lists_recipes', passive_deletes=True,
+                              backref=db.backref('lists', passive_deletes=True))
 
     def __repr__(self):
-        return f"<List #{self.id}: {self.title}, {self.username}>"
+        return f"<List #{self.id}: {self.title}, {self.user_id}>"
+
+    @classmethod
+    def get_projections(cls, user_id):
+        """Return ListProjections of a user's lists, oldest first."""
+
+        rows = (db.session.query(cls.id, cls.title)
+                .filter(cls.user_id == user_id)
+                .order_by(cls.id))
+
+        return tuple(ListProjection(*row) for row in rows)
+
+    @classmethod
+    def bump_version(cls, list_id):
+        """Mark the list's page as changed."""
+
+        db.session.execute(db.update(cls).where(cls.id == list_id).values(version=cls.version + 1))
 
 
 class Recipe(db.Model):
     """Recipe model"""
 
     __tablename__ = 'recipes'
+    __table_args__ = (
+        db.Index(
+            'ix_recipes_title_trgm',
+            'title',
+            postgresql_using='gin',
+            postgresql_ops={'title': 'gin_trgm_ops'},
+        ).ddl_if(callable_=trigram_available),
+    )
 
     id = db.Column(
         db.Integer,
@@ -159,14 +255,68 @@ class Recipe(db.Model):
         nullable=False,
     )
 
+    # Rendered cards are cached by (id, updated_at); see cards.py.
+    updated_at = db.Column(
+        db.DateTime(timezone=True),
+        nullable=False,
+        server_default=db.func.now(),
+        onupdate=db.func.now(),
+    )
+
     def __repr__(self):
         return f"<Recipe #{self.id}: {self.title}>"
 
 
+# Title search (see search.py). On Postgres, recipes get a stored generated
+# title_tsv column with a GIN index. It's left out of the model so the ORM
+# never loads it and the table can still be created on other engines. pg_trgm
+# and its index are only created on servers that ship it.
+event.listen(
+    Recipe.__table__, 'before_create',
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(callable_=trigram_available),
+)
+event.listen(
+    Recipe.__table__, 'after_create',
+    DDL("ALTER TABLE recipes ADD COLUMN title_tsv tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', title)) STORED").execute_if(dialect='postgresql'),
+)
+event.listen(
+    Recipe.__table__, 'after_create',
+    DDL("CREATE INDEX ix_recipes_title_tsv ON recipes USING gin (title_tsv)").execute_if(dialect='postgresql'),
+)
+
+
+def recipe_page(association, owner_column, owner_id, after=None, limit=30):
+    """Return one keyset page of the recipes linked to an owner.
+
+    `association` is a link table with a (owner, recipe_id) primary key, so a
+    page is a range scan on that index no matter how many rows the owner has.
+    Returns (recipes, cursor); pass the cursor as `after` for the next page.
+    It is None on the last page.
+    """
+
+    query = (Recipe.query
+             .join(association, association.recipe_id == Recipe.id)
+             .filter(owner_column == owner_id))
+
+    if after is not None:
+        query = query.filter(association.recipe_id > after)
+
+    recipes = query.order_by(association.recipe_id).limit(limit + 1).all()
+
+    if len(recipes) > limit:
+        return recipes[:limit], recipes[limit - 1].id
+
+    return recipes, None
+
+
 class UsersFavoritesRecipes(db.Model):
     """UsersFavoritesRecipes model"""
 
     __tablename__ = 'users_favorites_recipes'
+    __table_args__ = (
+        db.Index('ix_users_favorites_recipes_recipe_id', 'recipe_id'),
+    )
 
     user_id = db.Column(
         db.Integer,
@@ -180,12 +330,60 @@ class UsersFavoritesRecipes(db.Model):
         primary_key=True,
     )
 
+    @classmethod
+    def page(cls, user_id, after=None, limit=30):
+        """Return a keyset page of a user's favorite recipes. See recipe_page."""
+
+        return recipe_page(cls, cls.user_id, user_id, after, limit)
+
+    @staticmethod
+    def bump_if_changed(changed):
+        """Wrap a change RETURNING user_id so the same statement bumps the user's version."""
+
+        changed = changed.cte('changed')
+        return (db.update(User)
+                .where(User.id.in_(select(changed.c.user_id)))
+                .values(version=User.version + 1)
+                .returning(User.id)
+                .execution_options(synchronize_session=False))
+
+    @classmethod
+    def add(cls, user_id, recipe_id):
+        """Favorite a recipe (and bump the user's version) in one statement.
+
+        Returns False if it already was a favorite. Raises IntegrityError if
+        there is no such recipe.
+        """
+
+        stmt = cls.bump_if_changed(insert(cls)
+                                   .values(user_id=user_id, recipe_id=recipe_id)
+                                   .on_conflict_do_nothing()
+                                   .returning(cls.user_id))
+
+        return db.session.scalar(stmt) is not None
+
+    @classmethod
+    def remove(cls, user_id, recipe_id):
+        """Unfavorite a recipe (and bump the user's version) in one statement.
+
+        Returns False if it wasn't a favorite.
+        """
+
+        stmt = cls.bump_if_changed(db.delete(cls)
+                                   .where(cls.user_id == user_id, cls.recipe_id == recipe_id)
+                                   .returning(cls.user_id))
+
+        return db.session.scalar(stmt) is not None
+
     
 class ListsRecipes(db.Model):
     """ListsRecipes model"""
 
     __tablename__ = 'lists_recipes'
-    
+    __table_args__ = (
+        db.Index('ix_lists_recipes_recipe_id', 'recipe_id'),
+    )
+
     list_id = db.Column(
         db.Integer,
         db.ForeignKey('lists.id', ondelete='CASCADE'),
@@ -198,3 +396,112 @@ class ListsRecipes(db.Model):
         primary_key=True,
     )
 
+    @classmethod
+    def page(cls, list_id, after=None, limit=30):
+        """Return a keyset page of a list's recipes. See recipe_page."""
+
+        return recipe_page(cls, cls.list_id, list_id, after, limit)
+
+    @classmethod
+    def add_many(cls, list_id, recipe_ids):
+        """Add recipes to a list in one statement, skipping ones already on it.
+
+        Ids that don't match a recipe are ignored. Returns the set of recipe
+        ids that were newly added.
+        """
+
+        stmt = (insert(cls)
+                .from_select(['list_id', 'recipe_id'],
+                             select(literal(list_id), Recipe.id).where(Recipe.id.in_(recipe_ids)))
+                .on_conflict_do_nothing()
+                .returning(cls.recipe_id))
+
+        return set(db.session.scalars(stmt))
+
+    @classmethod
+    def remove_many(cls, list_id, recipe_ids):
+        """Remove recipes from a list in one statement.
+
+        Returns the set of recipe ids that were on the list.
+        """
+
+        stmt = (db.delete(cls)
+                .where(cls.list_id == list_id, cls.recipe_id.in_(recipe_ids))
+                .returning(cls.recipe_id))
+
+        return set(db.session.scalars(stmt))
+
+
+class RecipeNeighbor(db.Model):
+    """A recipe's top neighbors by co-occurrence in lists and favorites.
+
+    Built by recommend.py: `count` is how many lists or favorites hold both
+    recipes, `score` their cosine similarity.
+    """
+
+    __tablename__ = 'recipe_neighbors'
+    __table_args__ = (
+        db.Index('ix_recipe_neighbors_neighbor_id', 'neighbor_id'),
+    )
+
+    recipe_id = db.Column(
+        db.Integer,
+        db.ForeignKey('recipes.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    neighbor_id = db.Column(
+        db.Integer,
+        db.ForeignKey('recipes.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    count = db.Column(db.Integer, nullable=False)
+
+    score = db.Column(db.Float, nullable=False)
+
+
+class UserRecommendation(db.Model):
+    """A recipe recommended to a user, precomputed by recommend.py."""
+
+    __tablename__ = 'user_recommendations'
+    __table_args__ = (
+        db.Index('ix_user_recommendations_recipe_id', 'recipe_id'),
+    )
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey('users.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    recipe_id = db.Column(
+        db.Integer,
+        db.ForeignKey('recipes.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+
+    score = db.Column(db.Float, nullable=False)
+
+    @classmethod
+    def page(cls, user_id, after=None, limit=3):
+        """Return a page of a user's recommended recipes, best first, and the next cursor.
+
+        The cursor is the (score, recipe_id) of the page's last recipe, so the
+        scores recommend.py rewrites after each save don't shift the pages.
+        """
+
+        query = (db.session.query(Recipe, cls.score)
+                 .join(cls, cls.recipe_id == Recipe.id)
+                 .filter(cls.user_id == user_id))
+
+        if after is not None:
+            last_score, last_id = after
+            query = query.filter(db.or_(cls.score < last_score,
+                                        db.and_(cls.score == last_score, cls.recipe_id > last_id)))
+
+        rows = query.order_by(cls.score.desc(), cls.recipe_id).limit(limit).all()
+        recipes = [recipe for recipe, _ in rows]
+        cursor = (rows[-1][1], rows[-1][0].id) if rows else after
+
+        return recipes, cursor
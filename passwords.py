@@ -0,0 +1,103 @@
+"""Password hashing in a bounded thread pool.
+
+bcrypt is slow on purpose, so a burst of logins can keep every request
+thread busy hashing. Hashes run in a small pool per worker process, and once
+`PASSWORD_HASH_QUEUE` hashes are already waiting for it, new ones are refused
+with PasswordHasherBusy (a 503) instead of piling up behind them.
+
+The request thread still waits for its hash, so this only bounds anything
+with several request threads per process: gunicorn.conf.py runs gthread
+workers with WEB_THREADS threads, and PASSWORD_HASH_WORKERS plus
+PASSWORD_HASH_QUEUE must stay below that, leaving threads free for everything
+else. bcrypt releases the GIL, so those threads keep serving while it runs.
+
+The work factor is BCRYPT_LOG_ROUNDS. Hashes made with another factor still
+verify; `needs_rehash` tells the caller to upgrade them.
+
+Each app keeps its own hasher (and pool) in app.extensions['password_hasher'];
+`hasher` is a proxy to the current app's.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from flask import current_app, has_app_context
+from werkzeug.local import LocalProxy
+
+
+class PasswordHasherBusy(Exception):
+    """Too many hashes are already waiting for the pool."""
+
+
+class PasswordHasher:
+    """Hashes and checks passwords for a Flask app.
+
+    Without init_app, hashing runs on the calling thread with the default
+    work factor.
+    """
+
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.pool = None
+        self._slots = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', 12)
+        workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+        queue = app.config.get('PASSWORD_HASH_QUEUE', 2)
+        threads = app.config.get('WEB_THREADS')
+
+        if threads is not None and workers + queue >= threads:
+            raise ValueError(f"PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE ({workers + queue}) "
+                             f"must be below WEB_THREADS ({threads}).")
+
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+    def _run(self, func, *args):
+        if self.pool is None:
+            return func(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy()
+        try:
+            return self.pool.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        """Return a bcrypt hash of `password` as text."""
+
+        if not password:
+            raise ValueError("Password must be non-empty.")
+
+        salt = bcrypt.gensalt(self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('UTF-8'), salt).decode('UTF-8')
+
+    def check(self, hashed, password):
+        """Does `password` match the bcrypt hash `hashed`?"""
+
+        return self._run(bcrypt.checkpw, password.encode('UTF-8'), hashed.encode('UTF-8'))
+
+    def needs_rehash(self, hashed):
+        """Was `hashed` made with a different work factor than the current one?"""
+
+        # Hashes look like $2b$12$<salt and hash>.
+        return int(hashed.split('$')[2]) != self.rounds
+
+
+# Outside an app, hash on the calling thread with the default work factor.
+_default = PasswordHasher()
+
+
+def _current_hasher():
+    if has_app_context():
+        return current_app.extensions.get('password_hasher', _default)
+    return _default
+
+
+hasher = LocalProxy(_current_hasher)
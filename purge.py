@@ -0,0 +1,128 @@
+"""Deleting accounts.
+
+Every table that refers to a user, list or recipe does so with ON DELETE
+CASCADE, so deleting a user is one DELETE and Postgres removes their lists,
+list entries, favorites and recommendations with it. For very large accounts
+that one statement would still hold a worker (and row locks) for seconds, so
+accounts with more than ACCOUNT_PURGE_THRESHOLD saved recipes are instead
+closed at once (renamed and given a password nothing matches) and purged a
+batch at a time in the background.
+
+If a worker stops mid-purge, finish the job with:
+
+    python purge.py
+"""
+
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, User
+
+BATCH_SIZE = 5000
+
+# No bcrypt hash looks like this, so no password matches a closed account.
+CLOSED_PASSWORD = '!'
+
+ACCOUNT_SIZE = """
+    SELECT (SELECT count(*) FROM (
+                SELECT 1 FROM users_favorites_recipes WHERE user_id = :user_id LIMIT :limit
+            ) AS favorites)
+         + (SELECT count(*) FROM (
+                SELECT 1 FROM lists_recipes JOIN lists ON lists.id = lists_recipes.list_id
+                WHERE lists.user_id = :user_id LIMIT :limit
+            ) AS list_recipes)
+"""
+
+BATCHES = [
+    """
+    DELETE FROM users_favorites_recipes WHERE (user_id, recipe_id) IN (
+        SELECT user_id, recipe_id FROM users_favorites_recipes WHERE user_id = :user_id LIMIT :limit
+    )
+    """,
+    """
+    DELETE FROM lists_recipes WHERE (list_id, recipe_id) IN (
+        SELECT list_id, recipe_id FROM lists_recipes
+        WHERE list_id IN (SELECT id FROM lists WHERE user_id = :user_id) LIMIT :limit
+    )
+    """,
+    "DELETE FROM lists WHERE id IN (SELECT id FROM lists WHERE user_id = :user_id LIMIT :limit)",
+]
+
+
+def is_large(user_id, threshold):
+    """Does the user have more than `threshold` saved recipes? Counts at most that many."""
+
+    params = {'user_id': user_id, 'limit': threshold + 1}
+    return db.session.execute(text(ACCOUNT_SIZE), params).scalar() > threshold
+
+
+def delete_user(user_id):
+    """Delete a user and, by cascade, everything of theirs in one statement."""
+
+    db.session.execute(db.delete(User).where(User.id == user_id))
+
+
+def close_user(user_id):
+    """Free the user's username and email and lock them out, ahead of a purge."""
+
+    tombstone = f"deleted-{secrets.token_hex(8)}"
+    db.session.execute(db.update(User).where(User.id == user_id).values(
+        username=tombstone, email=f"{tombstone}@invalid", password=CLOSED_PASSWORD,
+        version=User.version + 1))
+
+
+def purge_user(user_id, batch_size=BATCH_SIZE):
+    """Delete a user's rows a batch (and a transaction) at a time, then the user."""
+
+    params = {'user_id': user_id, 'limit': batch_size}
+
+    for statement in BATCHES:
+        while True:
+            deleted = db.session.execute(text(statement), params).rowcount
+            db.session.commit()
+            if deleted < batch_size:
+                break
+
+    delete_user(user_id)
+    db.session.commit()
+
+
+class Purger:
+    """Purges closed accounts on one background thread, in order."""
+
+    def __init__(self, app):
+        self.app = app
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='purge')
+
+    def submit(self, user_id):
+        return self.pool.submit(self._purge, user_id)
+
+    def _purge(self, user_id):
+        with self.app.app_context():
+            try:
+                purge_user(user_id, self.app.config.get('ACCOUNT_PURGE_BATCH', BATCH_SIZE))
+            except SQLAlchemyError:
+                db.session.rollback()
+                self.app.logger.exception("Couldn't purge user %s; run purge.py to finish", user_id)
+
+    def drain(self):
+        """Wait for every queued purge to finish."""
+
+        self.pool.submit(lambda: None).result()
+
+
+def main():
+    from app import app
+
+    with app.app_context():
+        closed = db.session.scalars(db.select(User.id).where(User.password == CLOSED_PASSWORD)).all()
+        for user_id in closed:
+            purge_user(user_id)
+            print(f"Purged user {user_id}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Item-to-item recipe recommendations.
+
+Two recipes are related when people save them together, in the same list or
+among the same user's favorites. `cooccurrence.build()` loads every such
+basket into a sparse baskets x recipes matrix, multiplies it by its transpose
+to count how often each pair of recipes shares a basket, scores pairs by
+cosine similarity and keeps each recipe's top neighbors in recipe_neighbors.
+Every user's recommendations (the summed neighbor scores of the recipes
+they've saved, minus those recipes) are then written to user_recommendations,
+so the homepage pages through them with a single indexed query.
+
+Between builds, saves and unsaves are folded in incrementally by `Updater`:
+the pair counts between the changed recipes and the rest of their basket are
+adjusted and rescored, each touched recipe is trimmed back to its top
+neighbors, and the user's recommendations are recomputed from the neighbor
+table. Pairs trimmed away lose their counts until the next build, so the
+incremental scores drift a little from a full build.
+
+run like (e.g. nightly):
+
+    python recommend.py [--neighbors 50] [--per-user 200]
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db
+
+NEIGHBORS = 50
+PER_USER = 200
+
+# Each basket is keyed by its kind and owner.
+BASKETS = {
+    'favorites': "SELECT recipe_id FROM users_favorites_recipes WHERE user_id = :owner_id",
+    'list': "SELECT recipe_id FROM lists_recipes WHERE list_id = :owner_id",
+}
+
+SAVED_BY_USER = """
+    SELECT recipe_id FROM users_favorites_recipes WHERE user_id = :user_id
+    UNION
+    SELECT lists_recipes.recipe_id
+    FROM lists_recipes JOIN lists ON lists.id = lists_recipes.list_id
+    WHERE lists.user_id = :user_id
+"""
+
+
+def record_saves(basket, owner_id, recipe_ids, removed=False, k=NEIGHBORS):
+    """Adjust neighbor counts for recipes just added to (or removed from) a basket."""
+
+    pairs = f"""
+        WITH changed AS (SELECT unnest(CAST(:recipe_ids AS integer[])) AS id),
+        basket AS ({BASKETS[basket]} UNION SELECT id FROM changed),
+        pairs AS (
+            SELECT changed.id AS a, basket.recipe_id AS b
+            FROM changed JOIN basket ON basket.recipe_id <> changed.id
+            UNION
+            SELECT basket.recipe_id, changed.id
+            FROM changed JOIN basket ON basket.recipe_id <> changed.id
+        )
+    """
+    params = {'owner_id': owner_id, 'recipe_ids': list(recipe_ids), 'k': k}
+
+    if removed:
+        db.session.execute(text(pairs + """
+            UPDATE recipe_neighbors SET count = count - 1
+            FROM pairs WHERE recipe_id = pairs.a AND neighbor_id = pairs.b
+        """), params)
+        db.session.execute(text(pairs + """
+            DELETE FROM recipe_neighbors USING pairs
+            WHERE recipe_id = pairs.a AND neighbor_id = pairs.b AND count <= 0
+        """), params)
+    else:
+        db.session.execute(text(pairs + """
+            INSERT INTO recipe_neighbors (recipe_id, neighbor_id, count, score)
+            SELECT a, b, 1, 0 FROM pairs
+            ON CONFLICT (recipe_id, neighbor_id) DO UPDATE SET count = recipe_neighbors.count + 1
+        """), params)
+
+    db.session.execute(text(pairs + """,
+        touched AS (SELECT a AS id FROM pairs UNION SELECT b FROM pairs),
+        popularity AS (
+            SELECT id,
+                   (SELECT count(*) FROM users_favorites_recipes WHERE recipe_id = id)
+                   + (SELECT count(*) FROM lists_recipes WHERE recipe_id = id) AS n
+            FROM touched
+        )
+        UPDATE recipe_neighbors SET score = count / sqrt(greatest(pa.n * pb.n, 1))
+        FROM pairs
+        JOIN popularity pa ON pa.id = pairs.a
+        JOIN popularity pb ON pb.id = pairs.b
+        WHERE recipe_id = pairs.a AND neighbor_id = pairs.b
+    """), params)
+
+    db.session.execute(text(pairs + """,
+        ranked AS (
+            SELECT recipe_id, neighbor_id,
+                   row_number() OVER (PARTITION BY recipe_id ORDER BY score DESC, neighbor_id) AS rank
+            FROM recipe_neighbors
+            WHERE recipe_id IN (SELECT a FROM pairs)
+        )
+        DELETE FROM recipe_neighbors USING ranked
+        WHERE recipe_neighbors.recipe_id = ranked.recipe_id
+          AND recipe_neighbors.neighbor_id = ranked.neighbor_id
+          AND ranked.rank > :k
+    """), params)
+
+
+def refresh_user(user_id, n=PER_USER):
+    """Recompute one user's recommendations from the neighbor table."""
+
+    params = {'user_id': user_id, 'n': n}
+
+    db.session.execute(text("DELETE FROM user_recommendations WHERE user_id = :user_id"), params)
+    db.session.execute(text(f"""
+        WITH saved AS ({SAVED_BY_USER})
+        INSERT INTO user_recommendations (user_id, recipe_id, score)
+        SELECT :user_id, neighbor_id, sum(score)
+        FROM recipe_neighbors
+        WHERE recipe_id IN (SELECT recipe_id FROM saved)
+          AND neighbor_id NOT IN (SELECT recipe_id FROM saved)
+        GROUP BY neighbor_id
+        ORDER BY sum(score) DESC, neighbor_id
+        LIMIT :n
+    """), params)
+
+
+class Updater:
+    """Applies incremental updates on one background thread, in order.
+
+    Requests only queue their changes, so saving a recipe doesn't wait on
+    the neighbor table.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='recommend')
+
+    def submit(self, user_id, basket=None, owner_id=None, recipe_ids=(), removed=False):
+        """Queue a change to one of a user's baskets.
+
+        With no recipe_ids (e.g. after deleting a list) only the user's
+        recommendations are refreshed.
+        """
+
+        return self.pool.submit(self._apply, user_id, basket, owner_id, list(recipe_ids), removed)
+
+    def _apply(self, user_id, basket, owner_id, recipe_ids, removed):
+        with self.app.app_context():
+            try:
+                if recipe_ids:
+                    record_saves(basket, owner_id, recipe_ids, removed)
+                refresh_user(user_id)
+                db.session.commit()
+            except SQLAlchemyError:
+                # The user or recipes may be gone already; the next build catches up.
+                db.session.rollback()
+                self.app.logger.exception("Couldn't update recommendations for user %s", user_id)
+
+    def drain(self):
+        """Wait for every queued update to finish."""
+
+        self.pool.submit(lambda: None).result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--neighbors', type=int, default=NEIGHBORS, help="neighbors kept per recipe")
+    parser.add_argument('--per-user', type=int, default=PER_USER, help="recommendations kept per user")
+    args = parser.parse_args()
+
+    from app import app
+    from cooccurrence import build
+
+    with app.app_context():
+        build(args.neighbors, args.per_user)
+
+
+if __name__ == '__main__':
+    main()
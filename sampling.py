@@ -0,0 +1,120 @@
+"""Random recipe samplers.
+
+The homepage shows a handful of random recipes on every visit. Sorting the
+whole recipes table with ORDER BY random() gets slower as the catalog grows,
+so these samplers pick rows without touching the whole table.
+"""
+
+import random
+
+from sqlalchemy import func, tablesample, text
+from sqlalchemy.orm import aliased
+
+from models import db, Recipe
+
+
+class RecipeSampler:
+    """Base class for recipe samplers.
+
+    Subclasses implement `sample(n)`, returning up to `n` distinct recipes.
+    """
+
+    def sample(self, n):
+        raise NotImplementedError
+
+
+class OrderByRandomSampler(RecipeSampler):
+    """Sort the whole table randomly. Simple, but O(rows) per call."""
+
+    def sample(self, n):
+        return Recipe.query.order_by(func.random()).limit(n).all()
+
+
+class RandomIdSampler(RecipeSampler):
+    """Probe random ids between the smallest and largest recipe id.
+
+    Gaps in `Recipe.id` (deleted rows) are handled by oversampling: each round
+    asks for several candidate ids at once with a primary key lookup, keeps
+    the ones that exist and tries again for the rest. Every existing recipe is
+    equally likely to be picked. If the table is too sparse to fill the sample
+    after `max_rounds`, it falls back to ORDER BY random().
+    """
+
+    def __init__(self, oversample=3, max_rounds=4):
+        self.oversample = oversample
+        self.max_rounds = max_rounds
+
+    def sample(self, n):
+        low, high = db.session.query(func.min(Recipe.id), func.max(Recipe.id)).one()
+
+        if low is None:
+            return []
+
+        span = high - low + 1
+        if span <= n * self.oversample:
+            return OrderByRandomSampler().sample(n)
+
+        found = {}
+        for _ in range(self.max_rounds):
+            wanted = (n - len(found)) * self.oversample
+            probes = {random.randint(low, high) for _ in range(wanted)} - found.keys()
+            for recipe in Recipe.query.filter(Recipe.id.in_(probes)).all():
+                if len(found) < n:
+                    found[recipe.id] = recipe
+            if len(found) >= n:
+                return list(found.values())
+
+        rest = (Recipe.query
+                .filter(Recipe.id.notin_(found.keys()))
+                .order_by(func.random())
+                .limit(n - len(found))
+                .all())
+        return list(found.values()) + rest
+
+
+class TableSampleSampler(RecipeSampler):
+    """Use PostgreSQL's TABLESAMPLE SYSTEM to read a few random pages.
+
+    The sampling percentage is derived from the planner's row and page
+    estimates so that at least `pages` pages and roughly `oversample * n` rows
+    are read. Small tables (or stale estimates) fall back to ORDER BY random().
+    """
+
+    def __init__(self, oversample=10, pages=4, max_rounds=3):
+        self.oversample = oversample
+        self.pages = pages
+        self.max_rounds = max_rounds
+
+    def sample(self, n):
+        rows, pages = db.session.execute(
+            text("SELECT reltuples, relpages FROM pg_class WHERE oid = 'recipes'::regclass")
+        ).one()
+
+        if rows < n * self.oversample * 10 or pages < self.pages * 10:
+            return OrderByRandomSampler().sample(n)
+
+        percent = max(100.0 * n * self.oversample / rows, 100.0 * self.pages / pages)
+        sampled = aliased(Recipe, tablesample(Recipe.__table__, func.system(percent)))
+
+        for _ in range(self.max_rounds):
+            recipes = db.session.query(sampled).order_by(func.random()).limit(n).all()
+            if len(recipes) == n:
+                return recipes
+
+        return OrderByRandomSampler().sample(n)
+
+
+SAMPLERS = {
+    'order_by_random': OrderByRandomSampler,
+    'random_id': RandomIdSampler,
+    'tablesample': TableSampleSampler,
+}
+
+
+def get_sampler(name):
+    """Return a sampler instance by its config name."""
+
+    try:
+        return SAMPLERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown recipe sampler: {name}")
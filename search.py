@@ -0,0 +1,216 @@
+"""Recipe title search.
+
+On PostgreSQL titles are matched with full-text search against the stored
+title_tsv column and its GIN index, ranked by ts_rank. If that
+finds nothing and the pg_trgm extension is installed, a trigram similarity
+search catches typos. Other engines use an in-process inverted index.
+
+Ranking reads every row it ranks, so only the MAX_CANDIDATES matches with
+the lowest ids are ranked; a common term costs little more than a rare one.
+Searches that matched more say so, so the page can ask for more words
+instead of quietly leaving recipes out.
+
+Results are keyset-paginated: each page returns an opaque cursor to pass
+back as `after`.
+"""
+
+import difflib
+import re
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import Numeric, and_, func, literal_column, or_, text, union_all
+
+from models import db, Recipe
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+MAX_CANDIDATES = 1000
+PROBE_CANDIDATES = 10 * MAX_CANDIDATES
+
+
+# Generated column added outside the model; see models.py.
+TITLE_TSV = literal_column("recipes.title_tsv")
+
+
+def candidates(condition):
+    """The MAX_CANDIDATES recipes matching `condition` with the lowest ids.
+
+    Up to PROBE_CANDIDATES matches are read off the index in any order and
+    sorted. If there were more, the term is common enough that walking the
+    primary key finds the lowest ids sooner than reading every match would.
+    Returns the query and a column that is true if more recipes matched.
+    """
+
+    probe = db.select(Recipe.id).where(condition).limit(PROBE_CANDIDATES + 1).cte('probe')
+    matched = db.select(func.count()).select_from(probe).scalar_subquery()
+
+    few = (db.select(probe.c.id).where(matched <= PROBE_CANDIDATES)
+           .order_by(probe.c.id).limit(MAX_CANDIDATES).subquery())
+    many = db.select(Recipe.id).where(condition).order_by(Recipe.id).limit(MAX_CANDIDATES).subquery()
+    ids = union_all(db.select(few.c.id), db.select(many.c.id).where(matched > PROBE_CANDIDATES))
+
+    return Recipe.query.filter(Recipe.id.in_(ids)), matched > MAX_CANDIDATES
+
+
+def keyset(query, score, truncated, after, limit):
+    """Order by (score desc, id) and return one page, the next cursor and `truncated`."""
+
+    if after is not None:
+        last_score, last_id = after
+        query = query.filter(or_(score < last_score, and_(score == last_score, Recipe.id > last_id)))
+
+    rows = query.add_columns(score, truncated).order_by(score.desc(), Recipe.id).limit(limit + 1).all()
+    recipes = [recipe for recipe, _, _ in rows]
+    more = bool(rows) and rows[0][2]
+
+    if len(rows) > limit:
+        recipe, last_score, _ = rows[limit - 1]
+        return recipes[:limit], (last_score, recipe.id), more
+
+    return recipes, None, more
+
+
+class PostgresSearch:
+    """Full-text search with a trigram fallback."""
+
+    def __init__(self):
+        self._trigram = None
+
+    def trigram(self):
+        if self._trigram is None:
+            self._trigram = db.session.execute(
+                text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+            ).scalar()
+        return self._trigram
+
+    def search(self, q, after=None, limit=20):
+        mode, position = parse_cursor(after)
+
+        if mode in (None, 'f'):
+            tsquery = func.websearch_to_tsquery('english', q)
+            rank = func.round(func.ts_rank(TITLE_TSV, tsquery).cast(Numeric), 6)
+            query, truncated = candidates(TITLE_TSV.op('@@')(tsquery))
+            recipes, cursor, truncated = keyset(query, rank, truncated, position, limit)
+
+            if recipes or mode == 'f' or not self.trigram():
+                return recipes, format_cursor('f', cursor), truncated
+
+        similarity = func.round(func.similarity(Recipe.title, q).cast(Numeric), 6)
+        query, truncated = candidates(Recipe.title.op('%')(q))
+        recipes, cursor, truncated = keyset(query, similarity, truncated,
+                                            position if mode == 't' else None, limit)
+        return recipes, format_cursor('t', cursor), truncated
+
+
+class InvertedIndex:
+    """In-process token -> recipe id index for engines without full-text search.
+
+    New recipes are picked up incrementally by id on each search; the index
+    is rebuilt from scratch every `rebuild_every` seconds to catch edits and
+    deletes. Query tokens missing from the vocabulary are replaced by close
+    spellings. The lock covers lookups as well as updates, since both touch
+    the same sets.
+    """
+
+    def __init__(self, rebuild_every=3600):
+        self.rebuild_every = rebuild_every
+        self.postings = defaultdict(set)
+        self.max_id = 0
+        self.built_at = None
+        self._lock = threading.Lock()
+
+    def add(self, recipe_id, title):
+        for token in TOKEN.findall(title.lower()):
+            self.postings[token].add(recipe_id)
+        self.max_id = max(self.max_id, recipe_id)
+
+    def refresh(self):
+        with self._lock:
+            if self.built_at is None or time.monotonic() - self.built_at > self.rebuild_every:
+                self.postings = defaultdict(set)
+                self.max_id = 0
+                self.built_at = time.monotonic()
+
+            rows = (db.session.query(Recipe.id, Recipe.title)
+                    .filter(Recipe.id > self.max_id)
+                    .order_by(Recipe.id)
+                    .yield_per(10000))
+            for recipe_id, title in rows:
+                self.add(recipe_id, title)
+
+    def matches(self, token):
+        if token in self.postings:
+            return self.postings[token]
+
+        close = difflib.get_close_matches(token, self.postings.keys(), n=3, cutoff=0.8)
+        return set().union(*(self.postings[c] for c in close))
+
+    def search(self, q, after=None, limit=20):
+        self.refresh()
+
+        tokens = TOKEN.findall(q.lower())
+        if not tokens:
+            return [], None, False
+
+        with self._lock:
+            ids = set.intersection(*(self.matches(token) for token in tokens))
+
+        _, position = parse_cursor(after)
+        if position is not None:
+            ids = {i for i in ids if i > position[1]}
+
+        page = sorted(ids)[:limit + 1]
+        recipes = Recipe.query.filter(Recipe.id.in_(page[:limit])).order_by(Recipe.id).all()
+
+        if len(page) > limit:
+            return recipes, format_cursor('m', (0, page[limit - 1])), False
+
+        return recipes, None, False
+
+
+def parse_cursor(cursor):
+    """Split a cursor like 'f:0.0608:42' into ('f', (score, id)).
+
+    Malformed cursors, including scores outside ts_rank's and similarity's
+    range of 0 to 1, start from the first page.
+    """
+
+    if not cursor:
+        return None, None
+
+    try:
+        mode, score, recipe_id = cursor.split(':')
+        score = Decimal(score)
+        if not score.is_finite() or not 0 <= score <= 1:
+            return None, None
+        return mode, (score, int(recipe_id))
+    except (ValueError, InvalidOperation):
+        return None, None
+
+
+def format_cursor(mode, position):
+    if position is None:
+        return None
+
+    score, recipe_id = position
+    return f"{mode}:{score}:{recipe_id}"
+
+
+_postgres_search = PostgresSearch()
+_inverted_index = InvertedIndex()
+
+
+def search_recipes(q, after=None, limit=20):
+    """Search recipe titles with the best backend for the current engine.
+
+    Returns a page of recipes, the cursor for the next page and whether more
+    recipes matched than were ranked.
+    """
+
+    if db.engine.dialect.name == 'postgresql':
+        return _postgres_search.search(q, after, limit)
+
+    return _inverted_index.search(q, after, limit)
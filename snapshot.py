@@ -0,0 +1,286 @@
+"""Export the recipe catalog to a snapshot and load it back elsewhere.
+
+A snapshot is a directory with one gzipped CSV or JSONL file per table. Rows
+refer to each other by natural keys (recipe source_id, username, list title)
+rather than ids, so a snapshot can be loaded into a database with different
+ids. Loading COPYs each file into a temporary staging table and merges it
+from there; recipes are merged on source_id. Both directions stream, so
+memory use doesn't grow with the snapshot.
+
+Users travel without their emails or password hashes. They're loaded with a
+placeholder email (see SNAPSHOT_EMAIL) and a password nobody knows, and
+lists and favorites only join users that were loaded this way. A username
+already taken in the target database by someone else is skipped, and so are
+that user's lists and favorites.
+
+run like:
+
+    python snapshot.py export snapshots/2024-06-01 [--format jsonl] [--with-lists]
+    python snapshot.py import snapshots/2024-06-01
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import secrets
+from collections import namedtuple
+
+from models import db, hasher
+
+FETCH_SIZE = 5000
+
+# `query` selects the rows to export, `staging` declares the staging table's
+# columns (in the same order), `merge` moves staged rows into place and
+# `skipped`, if given, counts staged rows the merge refused.
+SnapshotTable = namedtuple('SnapshotTable', ['name', 'query', 'staging', 'merge', 'skipped'],
+                           defaults=[None])
+
+# The email of a user loaded from a snapshot; only such users get lists and
+# favorites from one. .invalid never resolves, so no one can sign up with it.
+SNAPSHOT_EMAIL = "staging.username || '@snapshot.invalid'"
+
+RECIPES = SnapshotTable(
+    'recipes',
+    "SELECT source_id, title, image_url FROM recipes ORDER BY source_id",
+    "source_id integer, title text, image_url text",
+    """
+    INSERT INTO recipes (source_id, title, image_url)
+    SELECT source_id, title, image_url FROM staging
+    ON CONFLICT (source_id) DO UPDATE
+    SET title = EXCLUDED.title, image_url = EXCLUDED.image_url,
+        updated_at = CASE
+            WHEN (recipes.title, recipes.image_url) IS DISTINCT FROM (EXCLUDED.title, EXCLUDED.image_url)
+            THEN now() ELSE recipes.updated_at
+        END
+    """,
+)
+
+# Lists need their owners, so they travel together with users.
+LIST_TABLES = [
+    SnapshotTable(
+        'users',
+        "SELECT username, first_name, last_name FROM users ORDER BY id",
+        "username text, first_name text, last_name text",
+        f"""
+        INSERT INTO users (username, first_name, last_name, email, password)
+        SELECT username, first_name, last_name, {SNAPSHOT_EMAIL}, %(password)s FROM staging
+        ON CONFLICT DO NOTHING
+        """,
+        f"""
+        SELECT count(*) FROM staging JOIN users ON users.username = staging.username
+        WHERE users.email <> {SNAPSHOT_EMAIL}
+        """,
+    ),
+    SnapshotTable(
+        'lists',
+        """
+        SELECT users.username, lists.title, lists.description
+        FROM lists JOIN users ON users.id = lists.user_id
+        ORDER BY lists.id
+        """,
+        "username text, title text, description text",
+        f"""
+        INSERT INTO lists (user_id, title, description)
+        SELECT users.id, staging.title, staging.description
+        FROM staging JOIN users ON users.username = staging.username AND users.email = {SNAPSHOT_EMAIL}
+        WHERE NOT EXISTS (
+            SELECT 1 FROM lists WHERE lists.user_id = users.id AND lists.title = staging.title
+        )
+        """,
+    ),
+    SnapshotTable(
+        'lists_recipes',
+        """
+        SELECT users.username, lists.title, recipes.source_id
+        FROM lists_recipes
+        JOIN lists ON lists.id = lists_recipes.list_id
+        JOIN users ON users.id = lists.user_id
+        JOIN recipes ON recipes.id = lists_recipes.recipe_id
+        """,
+        "username text, list_title text, recipe_source_id integer",
+        f"""
+        INSERT INTO lists_recipes (list_id, recipe_id)
+        SELECT lists.id, recipes.id
+        FROM staging
+        JOIN users ON users.username = staging.username AND users.email = {SNAPSHOT_EMAIL}
+        JOIN lists ON lists.user_id = users.id AND lists.title = staging.list_title
+        JOIN recipes ON recipes.source_id = staging.recipe_source_id
+        ON CONFLICT DO NOTHING
+        """,
+    ),
+    SnapshotTable(
+        'users_favorites_recipes',
+        """
+        SELECT users.username, recipes.source_id
+        FROM users_favorites_recipes
+        JOIN users ON users.id = users_favorites_recipes.user_id
+        JOIN recipes ON recipes.id = users_favorites_recipes.recipe_id
+        """,
+        "username text, recipe_source_id integer",
+        f"""
+        INSERT INTO users_favorites_recipes (user_id, recipe_id)
+        SELECT users.id, recipes.id
+        FROM staging
+        JOIN users ON users.username = staging.username AND users.email = {SNAPSHOT_EMAIL}
+        JOIN recipes ON recipes.source_id = staging.recipe_source_id
+        ON CONFLICT DO NOTHING
+        """,
+    ),
+]
+
+EXTENSIONS = {'csv': '.csv.gz', 'jsonl': '.jsonl.gz'}
+
+
+def csv_field(value):
+    """Quote a value for COPY's CSV format, where only an unquoted empty field is NULL."""
+
+    if value is None:
+        return ''
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class JSONLToCSV(io.RawIOBase):
+    """Read a JSONL stream as CSV, a line at a time, for COPY FROM."""
+
+    def __init__(self, lines, columns):
+        self.lines = lines
+        self.columns = columns
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while len(self.buffer) < len(b):
+            line = next(self.lines, None)
+            if line is None:
+                break
+            row = json.loads(line)
+            fields = [csv_field(row[column]) for column in self.columns]
+            self.buffer += (",".join(fields) + "\n").encode()
+
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+
+def staging_columns(table):
+    return [column.split()[0] for column in table.staging.split(',')]
+
+
+def export_table(conn, table, path, format):
+    """Stream one table to a gzipped snapshot file."""
+
+    with gzip.open(path, 'wt', newline='') as f:
+        if format == 'csv':
+            with conn.cursor() as cursor:
+                cursor.copy_expert(f"COPY ({table.query}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+        else:
+            columns = staging_columns(table)
+            with conn.cursor(name=f"snapshot_{table.name}") as cursor:
+                cursor.itersize = FETCH_SIZE
+                cursor.execute(table.query)
+                for row in cursor:
+                    f.write(json.dumps(dict(zip(columns, row))) + "\n")
+
+
+def import_table(conn, table, path, params):
+    """COPY one snapshot file into a staging table and merge it.
+
+    Returns the number of rows merged and the number skipped.
+    """
+
+    columns = ", ".join(staging_columns(table))
+
+    with conn.cursor() as cursor:
+        cursor.execute("SET LOCAL statement_timeout = 0")
+        cursor.execute(f"CREATE TEMP TABLE staging ({table.staging}) ON COMMIT DROP")
+
+        with gzip.open(path, 'rb') as f:
+            if path.endswith(EXTENSIONS['csv']):
+                cursor.copy_expert(f"COPY staging ({columns}) FROM STDIN WITH (FORMAT csv, HEADER)", f)
+            else:
+                stream = io.BufferedReader(JSONLToCSV(iter(f), staging_columns(table)))
+                cursor.copy_expert(f"COPY staging ({columns}) FROM STDIN WITH (FORMAT csv)", stream)
+
+        skipped = 0
+        if table.skipped:
+            cursor.execute(table.skipped)
+            skipped = cursor.fetchone()[0]
+
+        cursor.execute(table.merge, params)
+        merged = cursor.rowcount
+
+    conn.commit()
+    return merged, skipped
+
+
+def export_snapshot(directory, format='csv', with_lists=False, log=print):
+    """Write a snapshot of the catalog (and optionally lists) to `directory`."""
+
+    os.makedirs(directory, exist_ok=True)
+    tables = [RECIPES] + (LIST_TABLES if with_lists else [])
+
+    conn = db.engine.raw_connection()
+    try:
+        # Large tables outlast the per-statement cap meant for web requests.
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = 0")
+        for table in tables:
+            path = os.path.join(directory, table.name + EXTENSIONS[format])
+            export_table(conn, table, path, format)
+            log(f"Exported {table.name} to {path}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+def import_snapshot(directory, log=print):
+    """Load every table file found in a snapshot directory."""
+
+    # Loaded users can't log in until someone sets their password.
+    params = {'password': hasher.hash(secrets.token_urlsafe())}
+
+    conn = db.engine.raw_connection()
+    try:
+        for table in [RECIPES] + LIST_TABLES:
+            for extension in EXTENSIONS.values():
+                path = os.path.join(directory, table.name + extension)
+                if os.path.exists(path):
+                    merged, skipped = import_table(conn, table, path, params)
+                    log(f"Merged {merged} {table.name} rows from {path}")
+                    if skipped:
+                        log(f"Skipped {skipped} {table.name} rows already taken by other accounts")
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help="write a snapshot")
+    export.add_argument('directory')
+    export.add_argument('--format', choices=EXTENSIONS, default='csv')
+    export.add_argument('--with-lists', action='store_true',
+                        help="include users, their lists and favorites")
+
+    load = commands.add_parser('import', help="load a snapshot")
+    load.add_argument('directory')
+
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        if args.command == 'export':
+            export_snapshot(args.directory, args.format, args.with_lists)
+        else:
+            import_snapshot(args.directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+$('#recipes').on('click', '.recipe-item', async function(evt) {
+    let resp = await axios.post('/lists/add', {
+        recipeId: Number(evt.target.dataset.recipeid),
+        listTitle: localStorage.getItem('currentList')
+    })
+
+    console.log(resp)
+})
@@ -12,4 +12,4 @@ $(document).ready(function() {
 $('#currentListMenu').click(function(evt) {
     localStorage.setItem('currentList', evt.target.innerText)
     $('#currentList').text(evt.target.innerText)
-})
\ No newline at end of file
+})
@@ -1,8 +1,41 @@
-$('.recipe-item').click(async function(evt) {
-    let resp = await axios.post('/lists/add', {
-        recipeId: evt.target.dataset.recipeid,
-        listTitle: localStorage.getItem('currentList')
-    })
+// Cards for the next few pages are fetched (and their images loaded) ahead
+// of time, so "Show me more!" only swaps markup.
+const pageSize = parseInt($('#recipes').data('page-size')) || 3
+const prefetchSize = pageSize * 3
+let queue = []
+let refilling = null
 
-    console.log(resp)
+function refill() {
+    if (!refilling && queue.length < prefetchSize) {
+        refilling = axios.get('/api/recipes/next', {
+            params: { n: prefetchSize - queue.length }
+        }).then(function(resp) {
+            for (let recipe of resp.data.recipes) {
+                new Image().src = recipe.imageUrl
+                queue.push(recipe)
+            }
+        }).finally(function() {
+            refilling = null
+        })
+    }
+    return refilling || Promise.resolve()
+}
+
+$('#showMore').click(async function(evt) {
+    evt.preventDefault()
+
+    if (queue.length < pageSize) {
+        await refill()
+    }
+    if (queue.length === 0) {
+        window.location = '/'
+        return
+    }
+
+    // Each recipe carries its card, rendered by the same template as the page's.
+    $('#recipes').empty().append(queue.splice(0, pageSize).map(recipe => recipe.html).join(''))
+    window.scrollTo(0, 0)
+    refill()
 })
+
+refill()
@@ -0,0 +1,30 @@
+// Infinite scroll for pages whose #recipes has data-page-url and data-next.
+// The next page is requested when the sentinel below the cards comes into view.
+const $recipes = $('#recipes')
+const pageUrl = $recipes.data('page-url')
+let next = $recipes.data('next')
+let loading = false
+
+async function loadNextPage() {
+    if (loading || next === '' || next === undefined) {
+        return
+    }
+    loading = true
+
+    try {
+        let resp = await axios.get(pageUrl, { params: { after: next } })
+
+        // Each recipe carries its card (with a list's delete link), rendered
+        // by the same template as the page's.
+        $recipes.append(resp.data.recipes.map(recipe => recipe.html).join(''))
+        next = resp.data.next === null ? '' : resp.data.next
+    } finally {
+        loading = false
+    }
+}
+
+new IntersectionObserver(function(entries) {
+    if (entries.some(entry => entry.isIntersecting)) {
+        loadNextPage()
+    }
+}, { rootMargin: '400px' }).observe(document.getElementById('recipesEnd'))
@@ -0,0 +1,217 @@
+"""Fill the database with a production-sized synthetic dataset.
+
+Generates recipes with made-up titles, users with a shared password, their
+favorites, and lists of recipes. How much each user saves is skewed (most
+save a little, a few save a lot), and which recipes they save follows a Zipf
+distribution over a shuffled catalog, so a few recipes are very popular and
+most are rarely saved. The same seed and sizes always produce the same rows.
+
+Rows are streamed in with COPY, with the tables' secondary indexes and
+foreign keys dropped during the load and rebuilt after it.
+
+run like:
+
+    python synthetic.py [--recipes 2000000] [--users 200000] [--seed 0] [--zipf 1.1]
+
+Every table is emptied first, including recommendations; run
+`python recommend.py` afterwards to rebuild them. Every user's password is
+"password".
+"""
+
+import argparse
+import csv
+import io
+import time
+
+import numpy as np
+
+from models import db, hasher
+
+CHUNK = 100_000
+TABLES = ['users', 'recipes', 'lists', 'users_favorites_recipes', 'lists_recipes']
+ADJECTIVES = [
+    "Spicy", "Smoky", "Roasted", "Grilled", "Creamy", "Crispy", "Lemony", "Garlicky",
+    "Sweet", "Tangy", "Herbed", "Braised", "Quick", "Easy", "Classic", "Rustic",
+]
+INGREDIENTS = [
+    "Chicken", "Beef", "Pork", "Tofu", "Salmon", "Shrimp", "Lentil", "Chickpea",
+    "Mushroom", "Eggplant", "Spinach", "Potato", "Tomato", "Coconut", "Peanut", "Apple",
+]
+DISHES = [
+    "Pasta", "Curry", "Tacos", "Salad", "Soup", "Stew", "Noodles", "Rice Bowl",
+    "Burger", "Pie", "Cake", "Bread", "Risotto", "Stir Fry", "Casserole", "Sandwich",
+]
+FIRST_NAMES = ["Ada", "Ben", "Cleo", "Dev", "Eli", "Fay", "Gus", "Hana", "Ivan", "Jo"]
+LAST_NAMES = ["Smith", "Garcia", "Chen", "Okafor", "Novak", "Patel", "Kim", "Silva"]
+LIST_TITLES = ["Weeknight", "Holidays", "Meal Prep", "Desserts", "Try Soon", "Party"]
+
+
+class ZipfSampler:
+    """Draws recipe ids whose popularity falls off as 1 / rank ** s."""
+
+    def __init__(self, rng, n, s):
+        weights = 1 / np.arange(1, n + 1) ** s
+        self.cdf = np.cumsum(weights / weights.sum())
+        # Shuffle ranks so popularity doesn't follow insertion order.
+        self.ids = rng.permutation(n) + 1
+        self.rng = rng
+
+    def sample(self, size):
+        ranks = np.searchsorted(self.cdf, self.rng.random(size), side='right')
+        return self.ids[np.minimum(ranks, len(self.ids) - 1)]
+
+
+def skewed_counts(rng, n, mean, cap):
+    """Per-owner row counts: geometric, so most are small and a few are large."""
+
+    return np.minimum(rng.geometric(1 / mean, n), cap)
+
+
+def memberships(rng, sampler, counts):
+    """Return (owner ids, recipe ids) with `counts[i]` distinct recipes for owner i + 1."""
+
+    owners = np.repeat(np.arange(1, len(counts) + 1), counts)
+    recipes = sampler.sample(len(owners))
+    # Duplicate draws for the same owner collapse into one row.
+    pairs = np.unique(owners.astype(np.int64) << 32 | recipes)
+    return pairs >> 32, pairs & 0xFFFFFFFF
+
+
+def copy(cursor, table, columns, rows):
+    """COPY an iterable of rows into a table, CHUNK rows at a time."""
+
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % CHUNK == 0:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            buffer.seek(0)
+            buffer.truncate()
+
+    buffer.seek(0)
+    cursor.copy_expert(statement, buffer)
+
+
+def foreign_keys(cursor):
+    """Return (table, name, definition) of every foreign key on TABLES."""
+
+    cursor.execute("""
+        SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE contype = 'f' AND conrelid::regclass::text = ANY(%s)
+    """, (TABLES,))
+    return cursor.fetchall()
+
+
+def secondary_indexes(cursor):
+    """Return (name, definition) of every index on TABLES that isn't a constraint."""
+
+    cursor.execute("""
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = ANY(%s)
+          AND indexname NOT IN (SELECT conname FROM pg_constraint)
+    """, (TABLES,))
+    return cursor.fetchall()
+
+
+def generate(recipes=2_000_000, users=200_000, seed=0, zipf=1.1, favorites=20, lists=2,
+             list_size=12, log=print):
+    """Replace every table's rows with a synthetic dataset."""
+
+    rng = np.random.default_rng(seed)
+    sampler = ZipfSampler(rng, recipes, zipf)
+    password = hasher.hash("password")
+
+    favorite_users, favorite_recipes = memberships(
+        rng, sampler, skewed_counts(rng, users, favorites, recipes))
+    # Everyone has the list signup creates, and some have more.
+    list_counts = 1 + rng.poisson(max(lists - 1, 0), users)
+    list_owners = np.repeat(np.arange(1, users + 1), list_counts)
+    list_ranks = np.arange(len(list_owners)) - np.repeat(np.cumsum(list_counts) - list_counts, list_counts)
+    list_ids, list_recipes = memberships(
+        rng, sampler, skewed_counts(rng, len(list_owners), list_size, recipes))
+    words = [rng.integers(len(choices), size=recipes) for choices in (ADJECTIVES, INGREDIENTS, DISHES)]
+    names = [rng.integers(len(choices), size=users) for choices in (FIRST_NAMES, LAST_NAMES)]
+
+    start = time.perf_counter()
+    conn = db.engine.raw_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = 0")
+            cursor.execute("SET LOCAL maintenance_work_mem = '512MB'")
+            # Checking each row's foreign keys as it arrives is most of a load's
+            # cost; adding the keys back afterwards checks them in one pass.
+            keys = foreign_keys(cursor)
+            for table, name, _ in keys:
+                cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+            indexes = secondary_indexes(cursor)
+            for name, _ in indexes:
+                cursor.execute(f"DROP INDEX {name}")
+            cursor.execute("TRUNCATE users, recipes, lists, users_favorites_recipes, lists_recipes, "
+                           "recipe_neighbors, user_recommendations RESTART IDENTITY")
+
+            copy(cursor, 'recipes', ['id', 'source_id', 'title', 'image_url'], (
+                (i, i, f"{ADJECTIVES[a]} {INGREDIENTS[b]} {DISHES[c]}", f"https://img.example.com/{i}.jpg")
+                for i, a, b, c in zip(range(1, recipes + 1), *(w.tolist() for w in words))
+            ))
+            log(f"Loaded {recipes} recipes")
+
+            copy(cursor, 'users', ['id', 'first_name', 'last_name', 'email', 'username', 'password'], (
+                (i, FIRST_NAMES[a], LAST_NAMES[b], f"user{i}@example.com", f"user{i}", password)
+                for i, a, b in zip(range(1, users + 1), *(n.tolist() for n in names))
+            ))
+            log(f"Loaded {users} users")
+
+            copy(cursor, 'lists', ['id', 'title', 'description', 'user_id'], (
+                (i, "My List", "My first list", owner) if rank == 0
+                else (i, LIST_TITLES[(rank - 1) % len(LIST_TITLES)], "Saved for later", owner)
+                for i, owner, rank in zip(range(1, len(list_owners) + 1), list_owners.tolist(),
+                                          list_ranks.tolist())
+            ))
+            copy(cursor, 'users_favorites_recipes', ['user_id', 'recipe_id'],
+                 zip(favorite_users.tolist(), favorite_recipes.tolist()))
+            copy(cursor, 'lists_recipes', ['list_id', 'recipe_id'],
+                 zip(list_ids.tolist(), list_recipes.tolist()))
+            log(f"Loaded {len(list_owners)} lists, {len(favorite_users)} favorites "
+                f"and {len(list_ids)} list recipes")
+
+            for table in ['users', 'recipes', 'lists']:
+                cursor.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                               f"(SELECT coalesce(max(id), 0) + 1 FROM {table}), false)")
+
+            for name, definition in indexes:
+                cursor.execute(definition)
+            for table, name, definition in keys:
+                cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+            log(f"Rebuilt {len(indexes)} indexes and {len(keys)} foreign keys")
+            cursor.execute(f"ANALYZE {', '.join(TABLES)}")
+        conn.commit()
+    finally:
+        conn.close()
+
+    log(f"Done in {time.perf_counter() - start:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--recipes', type=int, default=2_000_000)
+    parser.add_argument('--users', type=int, default=200_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--zipf', type=float, default=1.1, help="popularity exponent, > 0")
+    parser.add_argument('--favorites', type=float, default=20, help="mean favorites per user")
+    parser.add_argument('--lists', type=float, default=2, help="mean lists per user, >= 1")
+    parser.add_argument('--list-size', type=float, default=12, help="mean recipes per list")
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        generate(args.recipes, args.users, args.seed, args.zipf, args.favorites, args.lists,
+                 args.list_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Recipe card cache tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_cards.py
+
+
+import datetime
+import os
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Recipe
+
+os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
+
+from app import app, CURR_USER_KEY
+import cards
+
+with app.app_context():
+    db.create_all()
+
+
+class RecipeCardsTestCase(TestCase):
+    """Test rendering cards from cached fragments."""
+
+    def setUp(self):
+        self.context = app.test_request_context()
+        self.context.push()
+        self.cards = cards.RecipeCards(app)
+        self.recipe = SimpleNamespace(id=7, title='Mac & "Cheese"', image_url="https://example.com/7.jpg",
+                                      updated_at=datetime.datetime(2024, 1, 1))
+
+    def tearDown(self):
+        self.context.pop()
+
+    def test_per_user_bits(self):
+        """Are the heart state and delete link applied to the shared card?"""
+
+        favorited = self.cards.render(self.recipe, True, "/lists/delete_recipe/1/7")
+        self.assertIn('fa-heart fas favorite-selector" data-recipeId="7"', favorited)
+        self.assertIn('href="/lists/delete_recipe/1/7"', favorited)
+        self.assertIn("Mac &amp; &#34;Cheese&#34;", favorited)
+
+        plain = self.cards.render(self.recipe, False)
+        self.assertIn('fa-heart far favorite-selector', plain)
+        self.assertNotIn("Delete", plain)
+
+    def test_cached_by_version(self):
+        """Is each recipe version rendered once?"""
+
+        with patch.object(cards, 'get_template_attribute', wraps=cards.get_template_attribute) as lookup:
+            self.cards.render(self.recipe, True)
+            self.cards.render(self.recipe, False)
+            self.assertEqual(lookup.call_count, 1)
+
+            self.recipe.title = "Mac and Cheese"
+            self.recipe.updated_at = datetime.datetime(2024, 1, 2)
+            self.assertIn("Mac and Cheese", self.cards.render(self.recipe, False))
+            self.assertEqual(lookup.call_count, 2)
+
+
+class RecipeCardViewTestCase(TestCase):
+    """Test cards on pages."""
+
+    def setUp(self):
+        self.app = app.app_context()
+        self.app.push()
+
+        User.query.delete()
+        Recipe.query.delete()
+
+        self.testuser = User.signup(first_name="Test", last_name="User", username="testuser",
+                                    email="test@test", password="testuser")
+        self.recipe = Recipe(source_id=1, title="Old Title", image_url="https://example.com/1.jpg")
+        db.session.add_all([self.testuser, self.recipe])
+        db.session.commit()
+        self.testuser.favorites.append(self.recipe)
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.extensions['recommendations'].drain()
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
+    def test_edited_recipe(self):
+        """Does an edited recipe's card show the edit?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            self.assertIn(b"Old Title", c.get("/favorites").data)
+
+            self.recipe.title = "New Title"
+            db.session.commit()
+
+            resp = c.get("/favorites")
+            self.assertIn(b"New Title", resp.data)
+            self.assertIn(b"fa-heart fas", resp.data)
@@ -0,0 +1,181 @@
+"""Recipe deck tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_decks.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, Recipe
+
+os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
+
+from app import app, CURR_USER_KEY, DECK_KEY
+from decks import MAX_SEGMENTS, Permutation, RecipeDeck, get_recipe_bounds
+
+with app.app_context():
+    db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class DeckTestCase(TestCase):
+    """Test shuffled recipe decks."""
+
+    def setUp(self):
+        """Add recipes with a gap in their ids."""
+
+        self.app = app.app_context()
+        self.app.push()
+
+        User.query.delete()
+        Recipe.query.delete()
+
+        self.recipes = [
+            Recipe(source_id=i, title=f"Recipe {i}", image_url=f"https://example.com/{i}.jpg")
+            for i in range(20)
+        ]
+        db.session.add_all(self.recipes)
+        db.session.commit()
+
+        db.session.delete(self.recipes[5])
+        db.session.commit()
+
+        self.testuser = User.signup(first_name="Test",
+                                    last_name="User",
+                                    username="testuser",
+                                    email="test@test",
+                                    password="testuser")
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
+    def test_permutation_is_bijection(self):
+        """Does the permutation hit every value exactly once?"""
+
+        for size in [1, 2, 7, 64, 1000]:
+            perm = Permutation(b"key", size)
+            self.assertEqual(sorted(perm[i] for i in range(size)), list(range(size)))
+
+    def test_deal_never_repeats(self):
+        """Does a deck deal every existing recipe once before running out?"""
+
+        deck = RecipeDeck.shuffle(*get_recipe_bounds())
+        dealt = []
+        while True:
+            cards = deck.deal(3)
+            if not cards:
+                break
+            dealt.extend(r.id for r in cards)
+
+        self.assertEqual(len(dealt), 19)
+        self.assertEqual(set(dealt), {r.id for r in Recipe.query.all()})
+
+    def test_deck_survives_session_round_trip(self):
+        """Does a deck resume from its session form without repeats?"""
+
+        deck = RecipeDeck.shuffle(*get_recipe_bounds())
+        first = {r.id for r in deck.deal(5)}
+
+        deck = RecipeDeck.from_session(deck.to_session())
+        second = {r.id for r in deck.deal(5)}
+
+        self.assertEqual(len(first), 5)
+        self.assertEqual(len(second), 5)
+        self.assertFalse(first & second)
+
+    def test_merge_new_recipes(self):
+        """Are recipes added after shuffling merged into the deck?"""
+
+        deck = RecipeDeck.shuffle(*get_recipe_bounds())
+        deck.deal(10)
+
+        new = Recipe(source_id=100, title="New Recipe", image_url="https://example.com/new.jpg")
+        db.session.add(new)
+        db.session.commit()
+
+        deck.merge(get_recipe_bounds()[1])
+        rest = [r.id for r in deck.deal(100)]
+
+        self.assertIn(new.id, rest)
+        self.assertEqual(len(rest), 10)
+
+    def test_spent_segments_dropped(self):
+        """Are used-up segments dropped without forgetting which ids were covered?"""
+
+        deck = RecipeDeck.shuffle(*get_recipe_bounds())
+        deck.deal(100)
+        self.assertEqual(deck.segments, [])
+
+        new = Recipe(source_id=100, title="New Recipe", image_url="https://example.com/new.jpg")
+        db.session.add(new)
+        db.session.commit()
+
+        deck = RecipeDeck.from_session(deck.to_session())
+        deck.merge(get_recipe_bounds()[1])
+        self.assertEqual([r.id for r in deck.deal(100)], [new.id])
+
+    def test_segments_stay_bounded(self):
+        """Does a deck that keeps merging new recipes keep a bounded number of segments?"""
+
+        deck = RecipeDeck.shuffle(*get_recipe_bounds())
+
+        for i in range(3 * MAX_SEGMENTS):
+            for j in range(3):
+                db.session.add(Recipe(source_id=1000 + 3 * i + j, title=f"New {i} {j}",
+                                      image_url="https://example.com/new.jpg"))
+            db.session.commit()
+
+            deck = RecipeDeck.from_session(deck.to_session())
+            deck.merge(get_recipe_bounds()[1])
+            deck.deal(1)
+            self.assertLessEqual(len(deck.segments), MAX_SEGMENTS)
+
+        # Untouched new recipes join the last segment instead of adding one.
+        deck.merge(deck.high + 10)
+        before = len(deck.segments)
+        deck.merge(deck.high + 10)
+        self.assertEqual(len(deck.segments), before)
+
+    def test_homepage_pages_through_deck(self):
+        """Do repeated homepage visits show distinct recipes?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            titles = [r.title for r in Recipe.query.all()]
+            seen = []
+            for _ in range(6):
+                resp = c.get("/")
+                self.assertEqual(resp.status_code, 200)
+                with c.session_transaction() as sess:
+                    self.assertIn(DECK_KEY, sess)
+                seen.extend(t for t in titles if f">{t}<".encode() in resp.data)
+
+            self.assertEqual(len(seen), 18)
+            self.assertEqual(len(set(seen)), 18)
+
+    def test_next_recipes_api(self):
+        """Does the JSON endpoint deal a prefetch window of unseen cards?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            first = c.get("/api/recipes/next?n=9").json['recipes']
+            second = c.get("/api/recipes/next?n=9").json['recipes']
+
+            self.assertEqual(len(first), 9)
+            self.assertEqual(len(second), 9)
+            self.assertFalse({r['id'] for r in first} & {r['id'] for r in second})
+            self.assertEqual(set(first[0]), {'id', 'title', 'imageUrl', 'favorited', 'html'})
+            self.assertFalse(first[0]['favorited'])
@@ -0,0 +1,169 @@
+"""Image proxy tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_images.py
+
+
+import io
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+
+from PIL import Image
+
+from models import db, Recipe
+
+os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
+
+from app import app
+from images import ImageStore, ImageFetchError, image_path
+
+with app.app_context():
+    db.create_all()
+
+
+def make_png(width, height):
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 100, 50)).save(out, 'PNG')
+    return out.getvalue()
+
+
+class StubOrigin(BaseHTTPRequestHandler):
+    """Serves two PNGs and counts the requests for them."""
+
+    body = make_png(1200, 800)
+    other = make_png(300, 200)
+    hits = 0
+    hits_lock = threading.Lock()
+
+    def do_GET(self):
+        with StubOrigin.hits_lock:
+            StubOrigin.hits += 1
+
+        body = {"/image.png": self.body, "/other.png": self.other}.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ImageProxyTestCase(TestCase):
+    """Test the /img route and the image store."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubOrigin)
+        cls.origin = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.app = app.app_context()
+        self.app.push()
+
+        Recipe.query.delete()
+
+        self.recipe = Recipe(source_id=1, title="Test Recipe", image_url=f"{self.origin}/image.png")
+        self.broken = Recipe(source_id=2, title="Broken Recipe", image_url=f"{self.origin}/missing.png")
+        db.session.add_all([self.recipe, self.broken])
+        db.session.commit()
+
+        app.extensions['image_store'] = ImageStore(tempfile.mkdtemp())
+        StubOrigin.hits = 0
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
+    def test_serves_resized_variant_with_etag(self):
+        """Is a thumbnail served with a strong ETag and long caching?"""
+
+        resp = self.client.get(image_path(self.recipe, 'thumb'))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, 'image/jpeg')
+        self.assertEqual(Image.open(io.BytesIO(resp.data)).size, (160, 107))
+        self.assertFalse(resp.headers['ETag'].startswith('W/'))
+        self.assertIn('max-age=2592000', resp.headers['Cache-Control'])
+
+        again = self.client.get(image_path(self.recipe, 'thumb'),
+                                headers={'If-None-Match': resp.headers['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+        full = self.client.get(image_path(self.recipe, 'full'))
+        self.assertEqual(full.data, StubOrigin.body)
+        self.assertEqual(StubOrigin.hits, 1)
+
+    def test_changed_image(self):
+        """Is a recipe's new image served once its URL changes?"""
+
+        old = image_path(self.recipe, 'full')
+        self.assertEqual(self.client.get(old).data, StubOrigin.body)
+
+        self.recipe.image_url = f"{self.origin}/other.png"
+        db.session.commit()
+
+        resp = self.client.get(image_path(self.recipe, 'full'))
+        self.assertEqual(resp.data, StubOrigin.other)
+        self.assertIn('max-age=2592000', resp.headers['Cache-Control'])
+
+        # Pages rendered before the change get the new image, uncached.
+        stale = self.client.get(old)
+        self.assertEqual(stale.data, StubOrigin.other)
+        self.assertNotIn('max-age=2592000', stale.headers['Cache-Control'])
+        self.assertEqual(StubOrigin.hits, 2)
+
+    def test_non_http_images(self):
+        """Are empty and non-http(s) image URLs neither fetched nor redirected to?"""
+
+        for url in ("", "file:///etc/passwd"):
+            self.broken.image_url = url
+            db.session.commit()
+
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(image_path(self.broken, 'card')).status_code, 404)
+                with self.assertRaises(ImageFetchError):
+                    ImageStore(tempfile.mkdtemp()).fetch(self.broken.id, url)
+
+    def test_unknown_size_and_broken_origin(self):
+        """Are bad sizes 404s, and unreachable images redirected to the origin?"""
+
+        self.assertEqual(self.client.get(f"/img/{self.recipe.id}/huge").status_code, 404)
+
+        resp = self.client.get(f"/img/{self.broken.id}/card")
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(resp.location, self.broken.image_url)
+
+    def test_concurrent_misses_fetch_once(self):
+        """Do simultaneous misses for one image share a single fetch?"""
+
+        store = ImageStore(tempfile.mkdtemp())
+        url = self.recipe.image_url
+        entries = []
+
+        threads = [threading.Thread(target=lambda: entries.append(store.fetch(7, url))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(StubOrigin.hits, 1)
+        self.assertEqual(len({e['digest'] for e in entries}), 1)
@@ -0,0 +1,136 @@
+"""Recipe ingestion tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_ingest.py
+
+
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from urllib.error import HTTPError
+from urllib.parse import urlparse, parse_qs
+
+from models import db, Recipe
+
+os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
+
+from app import app
+import ingest
+
+with app.app_context():
+    db.create_all()
+
+
+class StubAPI(BaseHTTPRequestHandler):
+    """Serves /recipes/complexSearch pages from `catalog`."""
+
+    catalog = []
+    fail_at = None
+    offsets = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        offset, number = int(query['offset'][0]), int(query['number'][0])
+        StubAPI.offsets.append(offset)
+
+        if offset == StubAPI.fail_at:
+            self.send_error(500)
+            return
+
+        body = json.dumps({
+            'results': StubAPI.catalog[offset:offset + number],
+            'offset': offset,
+            'number': number,
+            'totalResults': len(StubAPI.catalog),
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class IngestTestCase(TestCase):
+    """Test ingestion against a local stub of the recipe API."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubAPI)
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.app = app.app_context()
+        self.app.push()
+
+        Recipe.query.delete()
+        db.session.commit()
+
+        StubAPI.catalog = [
+            {'id': 1000 + i, 'title': f"Recipe {i}", 'image': f"https://example.com/{i}.jpg"}
+            for i in range(450)
+        ]
+        StubAPI.fail_at = None
+        StubAPI.offsets = []
+        ingest.BACKOFF = 0
+
+        self.checkpoint = ingest.Checkpoint(os.path.join(tempfile.mkdtemp(), 'checkpoint.json'))
+
+    def tearDown(self):
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
+    def test_ingest_all_pages(self):
+        """Are all pages loaded, and is a re-run an update rather than a crash?"""
+
+        written = ingest.ingest(self.base_url, 'key', self.checkpoint, batch_size=200, log=lambda m: None)
+
+        self.assertEqual(written, 450)
+        self.assertEqual(Recipe.query.count(), 450)
+        self.assertFalse(os.path.exists(self.checkpoint.path))
+
+        StubAPI.catalog[0]['title'] = "Renamed"
+        ingest.ingest(self.base_url, 'key', self.checkpoint, log=lambda m: None)
+
+        self.assertEqual(Recipe.query.count(), 450)
+        self.assertEqual(Recipe.query.filter_by(source_id=1000).one().title, "Renamed")
+
+    def test_ingest_limit(self):
+        """Does --limit stop early?"""
+
+        written = ingest.ingest(self.base_url, 'key', self.checkpoint, limit=150, log=lambda m: None)
+
+        self.assertEqual(written, 150)
+        self.assertEqual(Recipe.query.count(), 150)
+
+    def test_ingest_resumes_from_checkpoint(self):
+        """Does an interrupted run resume after the last committed batch?"""
+
+        StubAPI.fail_at = 300
+
+        with self.assertRaises(HTTPError):
+            ingest.ingest(self.base_url, 'key', self.checkpoint, concurrency=1, batch_size=100,
+                          log=lambda m: None)
+
+        self.assertEqual(self.checkpoint.load(), 300)
+        self.assertEqual(Recipe.query.count(), 300)
+
+        StubAPI.fail_at = None
+        StubAPI.offsets = []
+        ingest.ingest(self.base_url, 'key', self.checkpoint, log=lambda m: None)
+
+        self.assertEqual(min(StubAPI.offsets), 300)
+        self.assertEqual(Recipe.query.count(), 450)
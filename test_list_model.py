@@ -17,6 +17,7 @@ from sqlalchemy.exc import IntegrityError
 # connected to the database
 
 os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
 
 
 # Now we can import app
@@ -84,14 +85,14 @@ class ListModelTestCase(TestCase):
         l = List(
             title="Test List",
             description="Test Description",
-            username="testuser"
+            user_id=self.testuser.id
         )
 
         db.session.add(l)
         db.session.commit()
 
         self.assertEqual(l.title, "Test List")
-        self.assertEqual(l.username, self.testuser.username)
+        self.assertEqual(l.user_id, self.testuser.id)
         self.assertEqual(len(self.testuser.lists), 1)
 
 
@@ -101,7 +102,7 @@ class ListModelTestCase(TestCase):
         l = List(
             title="Test List",
             description="Test Description",
-            username="testuser"
+            user_id=self.testuser.id
         )
 
         db.session.add(l)
@@ -119,11 +120,11 @@ class ListModelTestCase(TestCase):
         l = List(
             title="Test List",
             description="Test Description",
-            username="testuser"
+            user_id=self.testuser.id
         )
 
         db.session.add(l)
         db.session.commit()
 
         self.assertEqual(repr(l), 
-            f"<List #{l.id}: {l.title}, {l.username}>")
+            f"<List #{l.id}: {l.title}, {l.user_id}>")
@@ -8,6 +8,8 @@
 import os, json
 from unittest import TestCase
 
+from sqlalchemy import event
+
 from models import db, User, List, Recipe, ListsRecipes, UsersFavoritesRecipes
 
 # BEFORE we import our app, let's set an environmental variable
@@ -16,6 +18,7 @@ from models import db, User, List, Recipe, ListsRecipes, UsersFavoritesRecipes
 # connected to the database
 
 os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
 
 
 # Now we can import app
@@ -37,6 +40,13 @@ app.config['WTF_CSRF_ENABLED'] = False
 class ListViewTestCase(TestCase):
     """Test views for lists."""
 
+    def tearDown(self):
+        """Clean up after each test."""
+
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
     def setUp(self):
         """Create test client, add sample data."""
 
@@ -61,10 +71,13 @@ class ListViewTestCase(TestCase):
                                      email="test2@test",
                                      password="testuser2")
 
+        db.session.add_all([self.testuser, self.testuser2])
+        db.session.commit()
+
         self.list = List(
             title="Test List",
             description="Test description",
-            username="testuser"
+            user_id=self.testuser.id
         )
 
         self.recipe = Recipe(
@@ -73,7 +86,7 @@ class ListViewTestCase(TestCase):
             image_url="https://example.com/image.jpg"
         )
 
-        db.session.add_all([self.testuser, self.testuser2, self.list, self.recipe])
+        db.session.add_all([self.list, self.recipe])
         db.session.commit()
 
     def test_show_lists(self):
@@ -169,3 +182,248 @@ class ListViewTestCase(TestCase):
             self.assertEqual(resp.status_code, 200)
             self.assertNotIn(b'{list_title}', resp.data)
             self.assertEqual(len(List.query.get(list_id).recipes), 0)
+
+    def test_show_list_favorite_state(self):
+        """Does the list page mark favorited recipes?"""
+
+        self.list.recipes.append(self.recipe)
+        self.testuser.favorites.append(self.recipe)
+        db.session.commit()
+
+        list_id = self.list.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            resp = c.get(f"/lists/{list_id}")
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn(b"fa-heart fas", resp.data)
+
+            self.testuser.favorites.remove(self.recipe)
+            db.session.commit()
+
+            resp = c.get(f"/lists/{list_id}")
+            self.assertIn(b"fa-heart far", resp.data)
+
+    def test_navbar_lists_cached_and_invalidated(self):
+        """Are navbar lists cached, and refreshed when a list is added?"""
+
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            c.get("/my-account")
+            event.listen(db.engine, "before_cursor_execute", count)
+            try:
+                c.get("/my-account")
+            finally:
+                event.remove(db.engine, "before_cursor_execute", count)
+
+            self.assertFalse([s for s in statements if "FROM lists" in s])
+
+            c.post("/lists/new", data={"title": "Brand New List", "description": ""})
+            resp = c.get("/my-account")
+            self.assertIn(b"Brand New List", resp.data)
+
+    def test_navbar_lists_across_sessions(self):
+        """Do a user's other sessions see lists added and deleted elsewhere?"""
+
+        other = app.test_client()
+
+        for c in (self.client, other):
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+            self.assertIn(b"Test List", c.get("/my-account").data)
+
+        self.client.post("/lists/new", data={"title": "Brand New List", "description": ""})
+        self.assertIn(b"Brand New List", other.get("/my-account").data)
+
+        self.client.get(f"/lists/delete/{self.list.id}")
+        self.assertNotIn(b"Test List", other.get("/my-account").data)
+
+    def test_add_recipe_to_list_twice(self):
+        """Is adding the same recipe twice harmless?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            for _ in range(2):
+                resp = c.post("/lists/add", json={
+                    "listTitle": self.list.title,
+                    "recipeId": self.recipe.id})
+                self.assertEqual(resp.status_code, 200)
+
+            self.assertEqual(len(self.list.recipes), 1)
+
+    def test_bulk_sync_list_recipes(self):
+        """Can we add and remove many recipes on a list in one request?"""
+
+        other = Recipe(source_id="67890", title="Other Recipe", image_url="https://example.com/other.jpg")
+        db.session.add(other)
+        self.list.recipes.append(self.recipe)
+        db.session.commit()
+
+        list_id = self.list.id
+        ids = [self.recipe.id, other.id, 0]
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            resp = c.post(f"/api/lists/{list_id}/recipes", json={"recipeIds": ids})
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual([r['status'] for r in resp.json['results']], ['exists', 'added', 'not_found'])
+
+            resp = c.delete(f"/api/lists/{list_id}/recipes", json={"recipeIds": ids})
+            self.assertEqual([r['status'] for r in resp.json['results']], ['removed', 'removed', 'missing'])
+            self.assertEqual(ListsRecipes.query.filter_by(list_id=list_id).count(), 0)
+
+            resp = c.post(f"/api/lists/{list_id}/recipes", json={"recipeIds": "nope"})
+            self.assertEqual(resp.status_code, 400)
+
+            resp = c.post(f"/api/lists/{list_id}/recipes", json={"recipeIds": [ids[0], True]})
+            self.assertEqual(resp.status_code, 400)
+
+            for payload in ({"listTitle": "Test List", "recipeId": True},
+                            {"listTitle": "Test List", "recipeId": 1.5},
+                            {"listTitle": "Test List", "recipeId": str(ids[0])},
+                            {"recipeId": ids[0]},
+                            {"listTitle": None, "recipeId": ids[0]},
+                            [ids[0]]):
+                with self.subTest(payload=payload):
+                    resp = c.post("/lists/add", json=payload)
+                    self.assertEqual(resp.status_code, 400)
+                    self.assertIn('message', resp.json)
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser2.id
+
+            resp = c.post(f"/api/lists/{list_id}/recipes", json={"recipeIds": ids})
+            self.assertEqual(resp.status_code, 403)
+
+    def test_list_recipes_keyset_pages(self):
+        """Can we page through a list's recipes with a cursor?"""
+
+        recipes = [
+            Recipe(source_id=str(100 + i), title=f"Recipe {i}", image_url="https://example.com/image.jpg")
+            for i in range(5)
+        ]
+        db.session.add_all(recipes)
+        self.list.recipes.extend(recipes)
+        db.session.commit()
+
+        list_id = self.list.id
+        expected = sorted(r.id for r in recipes)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            seen = []
+            after = None
+            while True:
+                params = {"limit": 2} if after is None else {"limit": 2, "after": after}
+                resp = c.get(f"/api/lists/{list_id}/recipes", query_string=params)
+                self.assertEqual(resp.status_code, 200)
+                seen.extend(r['id'] for r in resp.json['recipes'])
+                after = resp.json['next']
+                if after is None:
+                    break
+
+            self.assertEqual(seen, expected)
+
+            resp = c.get(f"/lists/{list_id}?limit=2")
+            self.assertIn(f'data-next="{expected[1]}"'.encode(), resp.data)
+            self.assertNotIn(b"Recipe 2", resp.data)
+
+    def test_list_recipes_page_cards(self):
+        """Does the API send the same card markup as the list page?"""
+
+        recipe = Recipe(source_id="100", title="Recipe 0", image_url="https://example.com/image.jpg")
+        db.session.add(recipe)
+        self.list.recipes.append(recipe)
+        db.session.commit()
+
+        list_id = self.list.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            card = c.get(f"/api/lists/{list_id}/recipes").json['recipes'][0]['html']
+            self.assertIn(f"/lists/delete_recipe/{list_id}/{recipe.id}", card)
+            self.assertIn(card, c.get(f"/lists/{list_id}").get_data(as_text=True))
+
+    def test_list_etag(self):
+        """Does an unchanged list answer 304, and do changes to it or to favorites change its ETag?"""
+
+        list_id = self.list.id
+        recipe_id = self.recipe.id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            resp = c.get(f"/lists/{list_id}")
+            etag = resp.headers['ETag']
+            self.assertEqual(resp.headers['Cache-Control'], "private, no-cache")
+
+            statements = []
+            count = lambda *args: statements.append(args[2])
+            event.listen(db.engine, "before_cursor_execute", count)
+            try:
+                resp = c.get(f"/lists/{list_id}", headers={"If-None-Match": etag})
+            finally:
+                event.remove(db.engine, "before_cursor_execute", count)
+
+            # Just the list's version; the user's is cached.
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(len(statements), 1)
+            self.assertFalse([s for s in statements if "recipes" in s])
+
+            c.post("/lists/add", json={"listTitle": "Test List", "recipeId": recipe_id})
+            resp = c.get(f"/lists/{list_id}", headers={"If-None-Match": etag})
+            self.assertEqual(resp.status_code, 200)
+            etag = resp.headers['ETag']
+
+            c.post("/favorites/add", json={"recipeId": recipe_id})
+            resp = c.get(f"/lists/{list_id}", headers={"If-None-Match": etag})
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn(b"fa-heart fas", resp.data)
+
+    def test_lists_etag(self):
+        """Do /lists and /favorites change their ETags when lists or favorites change?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            lists_etag = c.get("/lists").headers['ETag']
+            favorites_etag = c.get("/favorites").headers['ETag']
+            self.assertEqual(c.get("/lists", headers={"If-None-Match": lists_etag}).status_code, 304)
+
+            c.post("/lists/new", data={"title": "Brand New List", "description": ""})
+            resp = c.get("/lists", headers={"If-None-Match": lists_etag})
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn(b"Brand New List", resp.data)
+
+            c.post("/favorites/add", json={"recipeId": self.recipe.id})
+            resp = c.get("/favorites", headers={"If-None-Match": favorites_etag})
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn(b"Test Recipe", resp.data)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser2.id
+
+            # Another user's list has no ETag and isn't theirs to see.
+            resp = c.get(f"/lists/{self.list.id}")
+            self.assertNotIn('ETag', resp.headers)
+            self.assertEqual(resp.status_code, 302)
@@ -0,0 +1,199 @@
+"""Metrics and query budget tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_metrics.py
+
+
+import os
+from unittest import TestCase
+
+from flask import Flask
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import ProgrammingError
+
+from models import db, User, List, Recipe
+
+os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
+
+from app import app, CURR_USER_KEY
+from metrics import Histogram, Metrics, query_budget
+
+with app.app_context():
+    db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+# The most SQL statements each route may run once the user's caches are warm.
+# Raise a budget only when a route genuinely needs another query.
+QUERY_BUDGETS = {
+    "/": 3,
+    "/?mode=for-you": 4,
+    "/api/recipes/next?n=9": 4,
+    "/favorites": 1,
+    "/api/favorites?after={recipe_id}": 1,
+    "/lists": 0,
+    "/lists/{list_id}": 3,
+    "/api/lists/{list_id}/recipes": 2,
+    "/search?q=recipe": 2,
+    "/api/search?q=recipe": 2,
+    "/my-account": 0,
+}
+
+
+class HistogramTestCase(TestCase):
+    """Test the Prometheus histogram."""
+
+    def test_observe(self):
+        """Are bucket counts cumulative?"""
+
+        histogram = Histogram((1, 5))
+        for value in (0.5, 3, 10):
+            histogram.observe(value)
+
+        lines = list(histogram.lines('t', [('endpoint', 'a')]))
+        self.assertEqual(lines, ['t_bucket{endpoint="a",le="1"} 1',
+                                 't_bucket{endpoint="a",le="5"} 2',
+                                 't_bucket{endpoint="a",le="+Inf"} 3',
+                                 't_sum{endpoint="a"} 13.5',
+                                 't_count{endpoint="a"} 3'])
+
+
+class MetricsErrorTestCase(TestCase):
+    """Test recording requests and statements that fail."""
+
+    def setUp(self):
+        self.engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], pool_size=1, max_overflow=0)
+        self.app = Flask(__name__)
+        self.app.config['PROPAGATE_EXCEPTIONS'] = False
+        self.metrics = Metrics(self.app, self.engine)
+
+        @self.app.route('/boom')
+        def boom():
+            raise RuntimeError("boom")
+
+        @self.app.route('/bad-sql')
+        def bad_sql():
+            with self.engine.connect() as conn:
+                with self.assertRaises(ProgrammingError):
+                    conn.execute(text("SELECT * FROM no_such_table"))
+            return "ok"
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_errors_counted(self):
+        """Are requests whose view raised counted as 500s?"""
+
+        self.assertEqual(self.app.test_client().get("/boom").status_code, 500)
+
+        # When exceptions propagate (debug, testing) no response is made at all.
+        self.app.config['PROPAGATE_EXCEPTIONS'] = True
+        with self.assertRaises(RuntimeError):
+            self.app.test_client().get("/boom")
+
+        self.assertIn('tender_http_requests_total{endpoint="boom",method="GET",status="500"} 2',
+                      self.metrics.render())
+
+    def test_failed_statement(self):
+        """Is a failed statement counted without leaving its start time on the connection?"""
+
+        self.assertEqual(self.app.test_client().get("/bad-sql").status_code, 200)
+        self.assertEqual(self.metrics.queries['bad_sql'].sum, 1)
+
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.info.get('metrics_started'), [])
+
+
+class MetricsViewTestCase(TestCase):
+    """Test request instrumentation and per-route query budgets."""
+
+    def setUp(self):
+        self.app = app.app_context()
+        self.app.push()
+
+        app.extensions['recommendations'].drain()
+        User.query.delete()
+        Recipe.query.delete()
+
+        self.testuser = User.signup(first_name="Test", last_name="User", username="testuser",
+                                    email="test@test", password="testuser")
+        self.recipes = [
+            Recipe(source_id=i, title=f"Recipe {i}", image_url=f"https://example.com/{i}.jpg")
+            for i in range(40)
+        ]
+        db.session.add_all([self.testuser] + self.recipes)
+        db.session.commit()
+
+        self.list = List(title="Dinner", description="", user_id=self.testuser.id)
+        db.session.add(self.list)
+        db.session.commit()
+
+        self.list.recipes.extend(self.recipes[:20])
+        self.testuser.favorites.extend(self.recipes[10:30])
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.extensions['recommendations'].drain()
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
+    def test_query_budgets(self):
+        """Does every route stay within its query budget?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            c.get("/")
+            c.get("/lists")
+
+            for url, budget in QUERY_BUDGETS.items():
+                url = url.format(recipe_id=self.recipes[0].id, list_id=self.list.id)
+                with self.subTest(url=url), query_budget(db.engine, budget):
+                    self.assertEqual(c.get(url).status_code, 200)
+
+    def test_query_budget_exceeded(self):
+        """Does the budget helper fail when it's exceeded?"""
+
+        with self.assertRaises(AssertionError):
+            with query_budget(db.engine, 1):
+                User.query.count()
+                Recipe.query.count()
+
+    def test_metrics(self):
+        """Are requests, latency and statements reported for Prometheus?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            c.get("/favorites")
+            resp = c.get("/metrics")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+
+        body = resp.data.decode()
+        self.assertIn('tender_http_requests_total{endpoint="tender.show_favorites",method="GET",status="200"}',
+                      body)
+        self.assertIn('tender_http_request_duration_seconds_bucket{endpoint="tender.show_favorites",'
+                      'method="GET",le="+Inf"}', body)
+        self.assertIn('tender_db_statements_per_request_count{endpoint="tender.show_favorites"}', body)
+        self.assertIn('tender_db_seconds_total{endpoint="tender.show_favorites"}', body)
+        self.assertIn('tender_db_pool_checkouts_total', body)
+
+    def test_metrics_token(self):
+        """Is /metrics hidden without the internal token once one is set?"""
+
+        app.config['INTERNAL_TOKEN'] = "secret"
+        try:
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
+            resp = self.client.get("/metrics", headers={'Authorization': "Bearer secret"})
+            self.assertEqual(resp.status_code, 200)
+        finally:
+            app.config['INTERNAL_TOKEN'] = None
@@ -0,0 +1,91 @@
+"""Password hasher tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_passwords.py
+
+
+import threading
+import time
+from unittest import TestCase
+
+from flask import Flask
+
+from passwords import PasswordHasher, PasswordHasherBusy, hasher
+
+
+class PasswordHasherTestCase(TestCase):
+    """Test hashing in the bounded pool."""
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.config['BCRYPT_LOG_ROUNDS'] = 4
+        app.config['PASSWORD_HASH_WORKERS'] = 1
+        app.config['PASSWORD_HASH_QUEUE'] = 1
+        self.hasher = PasswordHasher(app)
+
+    def test_hash_and_check(self):
+        """Do hashes verify and use the configured work factor?"""
+
+        hashed = self.hasher.hash("secret")
+        self.assertTrue(hashed.startswith("$2b$04$"))
+        self.assertTrue(self.hasher.check(hashed, "secret"))
+        self.assertFalse(self.hasher.check(hashed, "wrong"))
+        self.assertFalse(self.hasher.needs_rehash(hashed))
+
+        self.hasher.rounds = 5
+        self.assertTrue(self.hasher.needs_rehash(hashed))
+        self.assertTrue(self.hasher.check(hashed, "secret"))
+
+    def test_hasher_per_app(self):
+        """Does `hasher` resolve to the current app's own hasher?"""
+
+        apps = []
+        for rounds in (4, 5):
+            app = Flask(__name__)
+            app.config['BCRYPT_LOG_ROUNDS'] = rounds
+            app.extensions['password_hasher'] = PasswordHasher(app)
+            apps.append(app)
+
+        for app, rounds in zip(apps, (4, 5)):
+            with app.app_context():
+                self.assertEqual(hasher.rounds, rounds)
+                self.assertIs(hasher._get_current_object(), app.extensions['password_hasher'])
+
+        self.assertEqual(hasher.rounds, 12)
+        self.assertIsNone(hasher.pool)
+
+    def test_empty_password(self):
+        """Are empty passwords refused?"""
+
+        with self.assertRaises(ValueError):
+            self.hasher.hash("")
+
+    def test_queue_limit(self):
+        """Are hashes refused once the pool and its queue are full?"""
+
+        release = threading.Event()
+        started = threading.Event()
+
+        def block(*args):
+            started.set()
+            release.wait()
+
+        # One hash running and one waiting fill the pool.
+        running = threading.Thread(target=self.hasher._run, args=(block,))
+        waiting = threading.Thread(target=self.hasher._run, args=(lambda: None,))
+        running.start()
+        started.wait()
+        waiting.start()
+
+        try:
+            while self.hasher._slots._value:
+                time.sleep(0.01)
+            with self.assertRaises(PasswordHasherBusy):
+                self.hasher.hash("secret")
+        finally:
+            release.set()
+            running.join()
+            waiting.join()
+
+        self.assertTrue(self.hasher.check(self.hasher.hash("secret"), "secret"))
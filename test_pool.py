@@ -0,0 +1,134 @@
+"""Connection pool tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_pool.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+
+os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
+
+from app import app
+from dbpool import engine_options, instrument, TimedQueuePool
+import migrations
+
+
+class PoolTestCase(TestCase):
+    """Test the pool settings and counters."""
+
+    def setUp(self):
+        options = engine_options(pool_size=1, max_overflow=0, pool_timeout=0.1, statement_timeout=200)
+        self.engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], **options)
+        self.stats = instrument(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_checkout_stats(self):
+        """Are checkouts, waits and connects counted?"""
+
+        for _ in range(3):
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+
+        stats = self.stats.snapshot()
+        self.assertEqual(stats['checkouts'], 3)
+        self.assertEqual(stats['connects'], 1)
+        self.assertEqual(stats['size'], 1)
+        self.assertEqual(stats['checked_out'], 0)
+        self.assertGreaterEqual(stats['wait_max_ms'], stats['wait_avg_ms'])
+
+    def test_timeout(self):
+        """Does a checkout from an exhausted pool time out and get counted?"""
+
+        with self.engine.connect():
+            with self.assertRaises(PoolTimeoutError):
+                self.engine.connect()
+
+        self.assertEqual(self.stats.snapshot()['timeouts'], 1)
+
+    def test_statement_timeout(self):
+        """Are slow statements cancelled?"""
+
+        with self.engine.connect() as conn:
+            with self.assertRaises(OperationalError):
+                conn.execute(text("SELECT pg_sleep(1)"))
+
+    def test_migration_settings_reset(self):
+        """Do migrations leave no timeouts behind on the pooled connection?"""
+
+        step = migrations.Migration(10 ** 6, "Test settings", "SELECT false", ["SET lock_timeout = '5s'"])
+
+        with patch.object(migrations, 'MIGRATIONS', [step]):
+            try:
+                migrations.migrate(self.engine, log=lambda message: None)
+            finally:
+                with self.engine.begin() as conn:
+                    conn.execute(text("DELETE FROM schema_migrations WHERE version = :v"), {'v': step.version})
+
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text("SHOW lock_timeout")).scalar(), "0")
+            self.assertEqual(conn.execute(text("SHOW statement_timeout")).scalar(), "200ms")
+
+    def test_invalidation(self):
+        """Are invalidated connections counted and replaced?"""
+
+        with self.engine.connect() as conn:
+            conn.invalidate()
+
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+        stats = self.stats.snapshot()
+        self.assertEqual(stats['invalidations'], 1)
+        self.assertEqual(stats['connects'], 2)
+
+    def test_recreate(self):
+        """Do the counters survive the pool being recreated?"""
+
+        self.engine.dispose()
+        self.assertIsInstance(self.engine.pool, TimedQueuePool)
+        self.assertIs(self.engine.pool.stats, self.stats)
+
+    def test_pgbouncer(self):
+        """Does PgBouncer mode drop the pool and startup options?"""
+
+        self.assertEqual(engine_options(pgbouncer=True), {'poolclass': NullPool})
+
+
+class PoolViewTestCase(TestCase):
+    """Test the internal pool endpoint."""
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.config['INTERNAL_TOKEN'] = None
+
+    def test_pool_stats(self):
+        """Are the app's pool stats served in testing?"""
+
+        resp = self.client.get("/internal/pool")
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreater(resp.json['max_connections'], 0)
+        self.assertGreaterEqual(resp.json['connections'], 1)
+        self.assertIn('checked_out', resp.json)
+
+    def test_token(self):
+        """Is the bearer token required once one is set?"""
+
+        app.config['INTERNAL_TOKEN'] = "secret"
+
+        self.assertEqual(self.client.get("/internal/pool").status_code, 404)
+        resp = self.client.get("/internal/pool", headers={'Authorization': "Bearer wrong"})
+        self.assertEqual(resp.status_code, 404)
+        resp = self.client.get("/internal/pool", headers={'Authorization': "Bearer secret"})
+        self.assertEqual(resp.status_code, 200)
@@ -0,0 +1,171 @@
+"""Account deletion tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_purge.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, User, List, Recipe, ListsRecipes, UsersFavoritesRecipes
+
+os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
+
+from app import app, CURR_USER_KEY
+from metrics import query_budget
+import purge
+
+with app.app_context():
+    db.create_all()
+
+
+class PurgeTestCase(TestCase):
+    """Test deleting users and lists by cascade."""
+
+    def setUp(self):
+        self.app = app.app_context()
+        self.app.push()
+
+        app.extensions['recommendations'].drain()
+        User.query.delete()
+        Recipe.query.delete()
+
+        self.testuser = User.signup(first_name="Test", last_name="User", username="testuser",
+                                    email="test@test", password="testuser")
+        self.recipes = [
+            Recipe(source_id=i, title=f"Recipe {i}", image_url=f"https://example.com/{i}.jpg")
+            for i in range(12)
+        ]
+        db.session.add_all([self.testuser] + self.recipes)
+        db.session.commit()
+
+        self.lists = [List(title=f"List {i}", description="", user_id=self.testuser.id) for i in range(3)]
+        db.session.add_all(self.lists)
+        db.session.commit()
+
+        for lst in self.lists:
+            lst.recipes.extend(self.recipes[:4])
+        self.testuser.favorites.extend(self.recipes)
+        db.session.commit()
+
+        self.user_id = self.testuser.id
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.config['ACCOUNT_PURGE_THRESHOLD'] = 10000
+        app.config['ACCOUNT_PURGE_BATCH'] = 5000
+        app.extensions['purger'].drain()
+        app.extensions['recommendations'].drain()
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
+    def assertGone(self):
+        db.session.expire_all()
+        self.assertIsNone(db.session.get(User, self.user_id))
+        self.assertEqual(List.query.count(), 0)
+        self.assertEqual(ListsRecipes.query.count(), 0)
+        self.assertEqual(UsersFavoritesRecipes.query.count(), 0)
+        self.assertEqual(Recipe.query.count(), 12)
+
+    def test_is_large(self):
+        """Is an account's size compared with the threshold?"""
+
+        self.assertTrue(purge.is_large(self.user_id, 23))
+        self.assertFalse(purge.is_large(self.user_id, 24))
+
+    def test_delete_user(self):
+        """Does one statement delete a user and everything of theirs?"""
+
+        with query_budget(db.engine, 1):
+            purge.delete_user(self.user_id)
+        db.session.commit()
+
+        self.assertGone()
+
+    def test_delete_user_with_lists(self):
+        """Can the ORM delete a user who owns lists without loading them?"""
+
+        db.session.delete(self.testuser)
+        db.session.commit()
+
+        self.assertGone()
+
+    def test_purge_user(self):
+        """Does a batched purge remove everything?"""
+
+        purge.purge_user(self.user_id, batch_size=5)
+
+        self.assertGone()
+
+    def test_delete_account(self):
+        """Is a small account deleted at once?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            resp = c.get("/my-account/delete")
+            self.assertEqual(resp.status_code, 302)
+
+        self.assertGone()
+
+    def test_delete_large_account(self):
+        """Is a large account closed at once and purged in the background?"""
+
+        app.config['ACCOUNT_PURGE_THRESHOLD'] = 10
+        app.config['ACCOUNT_PURGE_BATCH'] = 5
+        purger = app.extensions['purger']
+        submitted = []
+        submit, purger.submit = purger.submit, submitted.append
+
+        try:
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.user_id
+
+                resp = c.get("/my-account/delete")
+                self.assertEqual(resp.status_code, 302)
+        finally:
+            purger.submit = submit
+
+        self.assertEqual(submitted, [self.user_id])
+        db.session.expire_all()
+        closed = db.session.get(User, self.user_id)
+        self.assertEqual(closed.password, purge.CLOSED_PASSWORD)
+        self.assertTrue(closed.username.startswith("deleted-"))
+        self.assertFalse(User.authenticate("testuser", "testuser"))
+        db.session.rollback()
+
+        purger.submit(self.user_id)
+        purger.drain()
+
+        self.assertGone()
+
+    def test_delete_list(self):
+        """Is a list and its entries deleted, but only by its owner?"""
+
+        other = User.signup(first_name="Other", last_name="User", username="other",
+                            email="other@test", password="other")
+        db.session.add(other)
+        db.session.commit()
+        list_id = self.lists[0].id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = other.id
+
+            c.get(f"/lists/delete/{list_id}")
+            self.assertIsNotNone(db.session.get(List, list_id))
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.user_id
+
+            self.assertEqual(c.get(f"/lists/delete/{list_id}").status_code, 302)
+            self.assertEqual(c.get("/lists/delete/0").status_code, 404)
+
+        db.session.expire_all()
+        self.assertIsNone(db.session.get(List, list_id))
+        self.assertEqual(ListsRecipes.query.count(), 8)
@@ -0,0 +1,148 @@
+"""Query plan regression tests.
+
+Each route is requested while its SQL is captured, then every captured
+statement is EXPLAINed with sequential scans disabled. The planner only picks
+a Seq Scan then if no index can answer the query, so a Seq Scan on one of our
+tables means a hot query lost its index.
+"""
+
+# run these tests like:
+#
+#    python -m unittest test_query_plans.py
+
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from models import db, User, List, Recipe
+
+os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
+
+from app import app, CURR_USER_KEY
+from migrations import migrate
+
+with app.app_context():
+    db.create_all()
+    migrate(db.engine, log=lambda message: None)
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+TABLES = {'users', 'lists', 'recipes', 'lists_recipes', 'users_favorites_recipes'}
+
+
+def seq_scans(plan):
+    """Yield the tables read by Seq Scan nodes anywhere in a JSON plan."""
+
+    if plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in TABLES:
+        yield plan['Relation Name']
+    for child in plan.get('Plans', []):
+        yield from seq_scans(child)
+
+
+class QueryPlanTestCase(TestCase):
+    """Check that every route's queries can use an index."""
+
+    def setUp(self):
+        """Seed a user with lists and favorites."""
+
+        self.app = app.app_context()
+        self.app.push()
+
+        User.query.delete()
+        List.query.delete()
+        Recipe.query.delete()
+
+        self.client = app.test_client()
+
+        self.testuser = User.signup(first_name="Test",
+                                    last_name="User",
+                                    username="testuser",
+                                    email="test@test",
+                                    password="testuser")
+
+        self.recipes = [
+            Recipe(source_id=i, title=f"Recipe {i}", image_url=f"https://example.com/{i}.jpg")
+            for i in range(50)
+        ]
+        db.session.add_all([self.testuser] + self.recipes)
+        db.session.commit()
+
+        self.list = List(title="Test List", description="", user_id=self.testuser.id)
+        db.session.add(self.list)
+        db.session.commit()
+
+        self.list.recipes.extend(self.recipes[:20])
+        self.testuser.favorites.extend(self.recipes[10:30])
+        db.session.commit()
+
+        self.statements = []
+
+    def tearDown(self):
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
+    def capture(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')):
+            self.statements.append((statement, parameters))
+
+    def assert_no_seq_scans(self):
+        """EXPLAIN every captured statement with sequential scans disabled."""
+
+        conn = db.engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SET enable_seqscan = off")
+            for statement, parameters in self.statements:
+                cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+                plan = cursor.fetchone()[0][0]['Plan']
+                scanned = list(seq_scans(plan))
+                self.assertFalse(scanned, f"Seq Scan on {scanned} for:\n{statement}")
+            conn.rollback()
+        finally:
+            conn.close()
+
+    def request_all_routes(self, c):
+        list_id = self.list.id
+        recipe_id = self.recipes[0].id
+
+        c.get("/")
+        c.get("/?mode=for-you")
+        c.get("/api/recipes/next?n=9")
+        c.get("/favorites")
+        c.get(f"/api/favorites?after={recipe_id}")
+        c.get("/lists")
+        c.get(f"/lists/{list_id}")
+        c.get(f"/api/lists/{list_id}/recipes?after={recipe_id}")
+        c.post("/lists/add", json={"listTitle": "Test List", "recipeId": self.recipes[40].id})
+        c.post(f"/api/lists/{list_id}/recipes", json={"recipeIds": [r.id for r in self.recipes[40:45]]})
+        c.delete(f"/api/lists/{list_id}/recipes", json={"recipeIds": [r.id for r in self.recipes[40:45]]})
+        c.post("/favorites/add", json={"recipeId": self.recipes[45].id})
+        c.post("/favorites/remove", json={"recipeId": self.recipes[45].id})
+        c.get(f"/lists/delete_recipe/{list_id}/{recipe_id}")
+        c.get("/my-account")
+        c.get("/api/search?q=recipe")
+
+    def test_routes_use_indexes(self):
+        """Do all the routes' queries avoid sequential scans?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            event.listen(db.engine, "before_cursor_execute", self.capture)
+            try:
+                self.request_all_routes(c)
+            finally:
+                event.remove(db.engine, "before_cursor_execute", self.capture)
+
+        self.assertTrue(self.statements)
+        self.assert_no_seq_scans()
+
+    def test_migrations_are_idempotent(self):
+        """Can migrations run again on an up-to-date database?"""
+
+        migrate(db.engine, log=self.fail)
@@ -0,0 +1,168 @@
+"""Recommendation tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_recommend.py
+
+
+import os
+from unittest import TestCase
+
+import numpy as np
+from scipy import sparse
+
+from models import db, User, List, Recipe, RecipeNeighbor, UserRecommendation
+
+os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
+
+from app import app, CURR_USER_KEY
+from cooccurrence import build, neighbor_matrix, top_k
+
+with app.app_context():
+    db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+
+class NeighborMatrixTestCase(TestCase):
+    """Test the vectorized co-occurrence math."""
+
+    def test_top_k(self):
+        """Does top_k keep the largest entries of each row?"""
+
+        matrix = sparse.csr_matrix(np.array([[0, 3, 1, 2], [5, 0, 0, 4], [0, 0, 0, 0]], dtype=float))
+        keep = top_k(matrix, 2)
+        self.assertEqual(sorted(matrix.data[keep]), [2, 3, 4, 5])
+
+    def test_neighbor_matrix(self):
+        """Are co-occurrences counted and scored by cosine similarity?"""
+
+        # Recipes 0 and 1 share two baskets, 1 and 2 share one.
+        baskets = sparse.csr_matrix(np.array([[1, 1, 0], [1, 1, 0], [0, 1, 1]], dtype=float))
+        rows, cols, counts, scores = neighbor_matrix(baskets, k=1)
+
+        pairs = {(r, c): (n, s) for r, c, n, s in zip(rows, cols, counts, scores)}
+        self.assertEqual(set(pairs), {(0, 1), (1, 0), (2, 1)})
+        self.assertEqual(pairs[(0, 1)][0], 2)
+        self.assertAlmostEqual(pairs[(0, 1)][1], 2 / np.sqrt(2 * 3))
+
+
+class RecommendTestCase(TestCase):
+    """Test building and updating recommendations."""
+
+    def setUp(self):
+        self.app = app.app_context()
+        self.app.push()
+
+        app.extensions['recommendations'].drain()
+        User.query.delete()
+        Recipe.query.delete()
+
+        self.users = [
+            User.signup(first_name="Test", last_name="User", username=f"user{i}",
+                        email=f"user{i}@test", password="password")
+            for i in range(3)
+        ]
+        self.recipes = [
+            Recipe(source_id=i, title=f"Recipe {i}", image_url=f"https://example.com/{i}.jpg")
+            for i in range(6)
+        ]
+        db.session.add_all(self.users + self.recipes)
+        db.session.commit()
+
+        # Recipes 0, 1 and 2 are saved together; 3 is only saved with 0.
+        first, second, third = self.users
+        first.favorites.extend(self.recipes[:3])
+        second.favorites.extend(self.recipes[1:3])
+        self.list = List(title="Dinner", description="", user_id=third.id)
+        self.list.recipes.extend([self.recipes[0], self.recipes[3]])
+        db.session.add(self.list)
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.extensions['recommendations'].drain()
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
+    def recommended(self, user):
+        return [recipe.id for recipe in UserRecommendation.page(user.id, limit=10)[0]]
+
+    def test_build(self):
+        """Does a build recommend recipes saved alongside the user's?"""
+
+        build(log=lambda message: None)
+
+        self.assertEqual(self.recommended(self.users[1]), [self.recipes[0].id])
+        self.assertEqual(set(self.recommended(self.users[2])), {r.id for r in self.recipes[1:3]})
+        self.assertNotIn(self.recipes[5].id, self.recommended(self.users[0]))
+
+    def test_incremental_update(self):
+        """Does favoriting a recipe update neighbors and recommendations?"""
+
+        build(log=lambda message: None)
+        first, second = self.recipes[0].id, self.recipes[5].id
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.users[1].id
+
+            resp = c.post("/favorites/add", json={"recipeId": second})
+            self.assertTrue(resp.json['changed'])
+            app.extensions['recommendations'].drain()
+
+        db.session.expire_all()
+        neighbor = db.session.get(RecipeNeighbor, (self.recipes[1].id, second))
+        self.assertEqual(neighbor.count, 1)
+        self.assertNotIn(second, self.recommended(self.users[1]))
+        self.assertIn(first, self.recommended(self.users[1]))
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.users[1].id
+
+            c.post("/favorites/remove", json={"recipeId": second})
+            app.extensions['recommendations'].drain()
+
+        db.session.expire_all()
+        self.assertIsNone(db.session.get(RecipeNeighbor, (self.recipes[1].id, second)))
+
+    def test_for_you_mode(self):
+        """Does the homepage's "for you" mode show recommendations first?"""
+
+        build(log=lambda message: None)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.users[1].id
+
+            resp = c.get("/?mode=for-you")
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn(f'data-recipeId="{self.recipes[0].id}"'.encode(), resp.data)
+
+            resp = c.get("/api/recipes/next?n=3")
+            self.assertEqual(len(resp.json['recipes']), 3)
+
+    def test_pages_survive_rescoring(self):
+        """Do recommendation pages neither skip nor repeat when scores are rewritten?"""
+
+        user_id = self.users[0].id
+        db.session.add_all([UserRecommendation(user_id=user_id, recipe_id=recipe.id, score=10 - i)
+                            for i, recipe in enumerate(self.recipes[3:])])
+        db.session.commit()
+
+        first, cursor = UserRecommendation.page(user_id, limit=2)
+        self.assertEqual([r.id for r in first], [r.id for r in self.recipes[3:5]])
+
+        # A save adds a better recommendation ahead of the cursor.
+        db.session.add(UserRecommendation(user_id=user_id, recipe_id=self.recipes[0].id, score=20))
+        db.session.commit()
+
+        second, cursor = UserRecommendation.page(user_id, cursor, limit=2)
+        self.assertEqual([r.id for r in second], [self.recipes[5].id])
+
+        third, _ = UserRecommendation.page(user_id, cursor, limit=2)
+        self.assertEqual(third, [])
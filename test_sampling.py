@@ -0,0 +1,87 @@
+"""Recipe sampler tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_sampling.py
+
+
+import os
+from unittest import TestCase
+
+from models import db, Recipe
+
+os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
+
+from app import app
+from sampling import get_sampler, OrderByRandomSampler, RandomIdSampler, TableSampleSampler
+
+with app.app_context():
+    db.create_all()
+
+
+class SamplerTestCase(TestCase):
+    """Test the random recipe samplers."""
+
+    def setUp(self):
+        """Add recipes with gaps in their ids."""
+
+        self.app = app.app_context()
+        self.app.push()
+
+        Recipe.query.delete()
+
+        recipes = [
+            Recipe(source_id=i, title=f"Recipe {i}", image_url=f"https://example.com/{i}.jpg")
+            for i in range(100)
+        ]
+        db.session.add_all(recipes)
+        db.session.commit()
+
+        # Punch holes in the id range, as deletes would.
+        for recipe in recipes[10:60]:
+            db.session.delete(recipe)
+        db.session.commit()
+
+        self.ids = {r.id for r in Recipe.query.all()}
+
+    def tearDown(self):
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
+    def test_samplers_return_distinct_existing_recipes(self):
+        """Does every sampler return n distinct, existing recipes?"""
+
+        for sampler in [OrderByRandomSampler(), RandomIdSampler(), TableSampleSampler()]:
+            recipes = sampler.sample(5)
+            ids = [r.id for r in recipes]
+
+            self.assertEqual(len(ids), 5)
+            self.assertEqual(len(set(ids)), 5)
+            self.assertTrue(set(ids) <= self.ids)
+
+    def test_random_id_sampler_covers_catalog(self):
+        """Can the id sampler reach recipes on both sides of a gap?"""
+
+        seen = set()
+        for _ in range(50):
+            seen.update(r.id for r in RandomIdSampler().sample(3))
+
+        self.assertTrue(seen <= self.ids)
+        self.assertGreater(len(seen), 25)
+
+    def test_sampler_on_empty_table(self):
+        """Do samplers cope with no recipes at all?"""
+
+        Recipe.query.delete()
+        db.session.commit()
+
+        self.assertEqual(RandomIdSampler().sample(3), [])
+        self.assertEqual(TableSampleSampler().sample(3), [])
+
+    def test_get_sampler(self):
+        """Does get_sampler look samplers up by name?"""
+
+        self.assertIsInstance(get_sampler('random_id'), RandomIdSampler)
+        self.assertRaises(ValueError, get_sampler, 'nope')
@@ -0,0 +1,152 @@
+"""Recipe search tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_search.py
+
+
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from models import db, User, Recipe
+
+os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
+
+from app import app, CURR_USER_KEY
+import search
+from search import search_recipes, InvertedIndex
+
+with app.app_context():
+    db.create_all()
+
+app.config['WTF_CSRF_ENABLED'] = False
+
+TITLES = [
+    "Chicken Tacos",
+    "Spicy Chicken Curry",
+    "Beef Taco Salad",
+    "Chicken Noodle Soup",
+    "Lemon Chicken",
+    "Vegetable Curry",
+]
+
+
+class SearchTestCase(TestCase):
+    """Test title search."""
+
+    def setUp(self):
+        self.app = app.app_context()
+        self.app.push()
+
+        User.query.delete()
+        Recipe.query.delete()
+
+        self.testuser = User.signup(first_name="Test",
+                                    last_name="User",
+                                    username="testuser",
+                                    email="test@test",
+                                    password="testuser")
+        db.session.add_all([self.testuser] + [
+            Recipe(source_id=i, title=title, image_url=f"https://example.com/{i}.jpg")
+            for i, title in enumerate(TITLES)
+        ])
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
+    def test_full_text_search(self):
+        """Does search match stems and combine words?"""
+
+        recipes, _, _ = search_recipes("tacos")
+        self.assertEqual({r.title for r in recipes}, {"Chicken Tacos", "Beef Taco Salad"})
+
+        recipes, _, _ = search_recipes("chicken curry")
+        self.assertEqual([r.title for r in recipes], ["Spicy Chicken Curry"])
+
+    def test_search_pages(self):
+        """Can we page through results with the cursor?"""
+
+        seen = []
+        recipes, cursor, truncated = search_recipes("chicken", limit=3)
+        seen.extend(r.title for r in recipes)
+        self.assertIsNotNone(cursor)
+        self.assertFalse(truncated)
+
+        recipes, cursor, _ = search_recipes("chicken", after=cursor, limit=3)
+        seen.extend(r.title for r in recipes)
+        self.assertIsNone(cursor)
+
+        self.assertEqual(len(seen), 4)
+        self.assertEqual(set(seen), {t for t in TITLES if "Chicken" in t})
+
+    def test_bad_cursor(self):
+        """Does a malformed or out-of-range cursor start from the first page?"""
+
+        first, _, _ = search_recipes("chicken", limit=3)
+
+        for after in ("f:1e999999:1", "f:-1e999999:1", "f:NaN:1", "f:Infinity:1", "f:2:1", "nope"):
+            with self.subTest(after=after):
+                recipes, _, _ = search_recipes("chicken", after=after, limit=3)
+                self.assertEqual(recipes, first)
+
+    def test_candidates_capped(self):
+        """Are the matches with the lowest ids ranked, and is the cap reported?"""
+
+        chicken = {t for t in TITLES if "Chicken" in t}
+
+        for probe in (2, 3, 10):
+            with self.subTest(probe=probe), patch.multiple(search, MAX_CANDIDATES=2, PROBE_CANDIDATES=probe):
+                recipes, cursor, truncated = search_recipes("chicken", limit=3)
+
+                self.assertEqual({r.title for r in recipes}, {"Chicken Tacos", "Spicy Chicken Curry"})
+                self.assertIsNone(cursor)
+                self.assertTrue(truncated)
+
+        with patch.multiple(search, MAX_CANDIDATES=4, PROBE_CANDIDATES=4):
+            recipes, _, truncated = search_recipes("chicken", limit=4)
+
+        self.assertEqual({r.title for r in recipes}, chicken)
+        self.assertFalse(truncated)
+
+    def test_inverted_index(self):
+        """Does the in-process index match words, pages and forgive typos?"""
+
+        index = InvertedIndex()
+
+        recipes, cursor, _ = index.search("chicken", limit=3)
+        self.assertEqual(len(recipes), 3)
+
+        rest, cursor, _ = index.search("chicken", after=cursor, limit=3)
+        self.assertEqual(len(rest), 1)
+        self.assertIsNone(cursor)
+
+        recipes, _, _ = index.search("chiken curry")
+        self.assertEqual([r.title for r in recipes], ["Spicy Chicken Curry"])
+
+    def test_search_routes(self):
+        """Do the search page and JSON endpoint show matches?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            resp = c.get("/search?q=curry")
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn(b"Vegetable Curry", resp.data)
+            self.assertNotIn(b"Lemon Chicken", resp.data)
+
+            resp = c.get("/api/search?q=soup")
+            self.assertEqual([r['title'] for r in resp.json['recipes']], ["Chicken Noodle Soup"])
+            self.assertFalse(resp.json['truncated'])
+
+            with patch.object(search, 'MAX_CANDIDATES', 2):
+                resp = c.get("/search?q=chicken")
+                self.assertIn(b"Add words to narrow your search", resp.data)
+                self.assertTrue(c.get("/api/search?q=chicken").json['truncated'])
@@ -0,0 +1,150 @@
+"""Catalog snapshot tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_snapshot.py
+
+
+import gzip
+import os
+import tempfile
+from unittest import TestCase
+
+from models import db, User, List, Recipe, UsersFavoritesRecipes
+
+os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
+
+from app import app
+from snapshot import export_snapshot, import_snapshot
+
+with app.app_context():
+    db.create_all()
+
+
+class SnapshotTestCase(TestCase):
+    """Test exporting and importing snapshots."""
+
+    def setUp(self):
+        self.app = app.app_context()
+        self.app.push()
+
+        User.query.delete()
+        Recipe.query.delete()
+
+        user = User.signup(first_name="Test",
+                           last_name="User",
+                           username="testuser",
+                           email="test@test",
+                           password="testuser")
+        recipes = [
+            Recipe(source_id=i, title=f'Recipe "{i}", with, commas', image_url=f"https://example.com/{i}.jpg")
+            for i in range(10)
+        ]
+        # Ingest stores a missing image as an empty string.
+        recipes.append(Recipe(source_id=10, title="No Image", image_url=""))
+        db.session.add_all([user] + recipes)
+        db.session.commit()
+
+        l = List(title="Test List", description="Line one\nline two", user_id=user.id)
+        empty = List(title="Empty", description="", user_id=user.id)
+        db.session.add_all([l, empty])
+        db.session.commit()
+
+        l.recipes.extend(recipes[:3])
+        user.favorites.extend(recipes[5:7])
+        db.session.commit()
+
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
+    def round_trip(self, format):
+        export_snapshot(self.directory, format, with_lists=True, log=lambda m: None)
+
+        User.query.delete()
+        Recipe.query.delete()
+        db.session.commit()
+
+        import_snapshot(self.directory, log=lambda m: None)
+        # Loading twice merges rather than duplicating.
+        import_snapshot(self.directory, log=lambda m: None)
+        db.session.expire_all()
+
+        self.assertEqual(Recipe.query.count(), 11)
+        self.assertEqual(Recipe.query.filter_by(source_id=3).one().title, 'Recipe "3", with, commas')
+        # Empty strings stay empty rather than loading as NULL.
+        self.assertEqual(Recipe.query.filter_by(source_id=10).one().image_url, "")
+        self.assertEqual(List.query.filter_by(title="Empty").one().description, "")
+
+        l = List.query.filter_by(title="Test List").one()
+        self.assertEqual(l.description, "Line one\nline two")
+        self.assertEqual(sorted(r.source_id for r in l.recipes), [0, 1, 2])
+        self.assertEqual(sorted(r.source_id for r in User.query.one().favorites), [5, 6])
+
+        # Users are loaded without their email or a usable password.
+        self.assertEqual(User.query.one().email, "testuser@snapshot.invalid")
+        self.assertFalse(User.authenticate("testuser", "testuser"))
+        db.session.rollback()
+
+    def test_no_credentials_exported(self):
+        """Are emails and password hashes left out of a snapshot?"""
+
+        password = User.query.one().password
+
+        for format in ('csv', 'jsonl'):
+            export_snapshot(self.directory, format, with_lists=True, log=lambda m: None)
+            with gzip.open(os.path.join(self.directory, f"users.{format}.gz"), 'rt') as f:
+                exported = f.read()
+
+            self.assertIn("testuser", exported)
+            self.assertNotIn("test@test", exported)
+            self.assertNotIn(password, exported)
+
+    def test_taken_username_skipped(self):
+        """Are a snapshot user's lists and favorites kept from someone else with their username?"""
+
+        export_snapshot(self.directory, with_lists=True, log=lambda m: None)
+
+        User.query.delete()
+        db.session.commit()
+        stranger = User.signup(first_name="Someone", last_name="Else", username="testuser",
+                               email="else@test", password="else")
+        db.session.add(stranger)
+        db.session.commit()
+
+        messages = []
+        import_snapshot(self.directory, log=messages.append)
+        db.session.expire_all()
+
+        self.assertEqual(User.query.one().email, "else@test")
+        self.assertEqual(List.query.count(), 0)
+        self.assertEqual(UsersFavoritesRecipes.query.count(), 0)
+        self.assertIn("Skipped 1 users rows already taken by other accounts", messages)
+
+    def test_csv_round_trip(self):
+        """Does a CSV snapshot load back the same data?"""
+
+        self.round_trip('csv')
+
+    def test_jsonl_round_trip(self):
+        """Does a JSONL snapshot load back the same data?"""
+
+        self.round_trip('jsonl')
+
+    def test_import_updates_recipes(self):
+        """Are existing recipes updated from the snapshot by source_id?"""
+
+        export_snapshot(self.directory, log=lambda m: None)
+        self.assertEqual(os.listdir(self.directory), ['recipes.csv.gz'])
+
+        Recipe.query.filter_by(source_id=1).one().title = "Changed"
+        db.session.commit()
+
+        import_snapshot(self.directory, log=lambda m: None)
+        db.session.expire_all()
+
+        self.assertEqual(Recipe.query.filter_by(source_id=1).one().title, 'Recipe "1", with, commas')
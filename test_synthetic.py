@@ -0,0 +1,105 @@
+"""Synthetic data generator tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_synthetic.py
+
+
+import os
+from unittest import TestCase
+
+import numpy as np
+from sqlalchemy import text
+
+from models import db, User, List, Recipe
+
+os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
+
+from app import app
+from synthetic import ZipfSampler, generate
+
+with app.app_context():
+    db.create_all()
+
+
+class ZipfSamplerTestCase(TestCase):
+    """Test the skewed recipe sampler."""
+
+    def test_skew(self):
+        """Is the most popular recipe drawn far more often than the median one?"""
+
+        sampler = ZipfSampler(np.random.default_rng(0), 1000, 1.1)
+        counts = np.bincount(sampler.sample(100_000), minlength=1001)[1:]
+
+        self.assertEqual(counts.argmax() + 1, sampler.ids[0])
+        self.assertGreater(counts.max(), 50 * np.median(counts))
+
+
+class GenerateTestCase(TestCase):
+    """Test generating and loading a dataset."""
+
+    def setUp(self):
+        self.app = app.app_context()
+        self.app.push()
+
+        app.extensions['recommendations'].drain()
+
+    def tearDown(self):
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
+    def generate(self, seed=0):
+        # The load needs exclusive locks, so end this session's transaction first.
+        db.session.rollback()
+        generate(recipes=500, users=50, seed=seed, log=lambda message: None)
+
+    def checksum(self):
+        return db.session.execute(text("""
+            SELECT md5(string_agg(user_id || ':' || recipe_id, ',' ORDER BY user_id, recipe_id))
+            FROM users_favorites_recipes
+        """)).scalar()
+
+    def test_generate(self):
+        """Are every table's rows loaded, with one signup list per user?"""
+
+        self.generate()
+
+        self.assertEqual(Recipe.query.count(), 500)
+        self.assertEqual(User.query.count(), 50)
+        self.assertEqual(List.query.filter_by(title="My List").count(), 50)
+        self.assertGreater(db.session.execute(text("SELECT count(*) FROM lists_recipes")).scalar(), 0)
+
+        # Sequences continue after the loaded ids.
+        user = User.signup(first_name="New", last_name="User", username="newuser",
+                           email="new@test", password="password")
+        db.session.commit()
+        self.assertEqual(user.id, 51)
+        self.assertIsNotNone(User.authenticate("user1", "password"))
+
+    def test_deterministic(self):
+        """Does the same seed produce the same rows, and another seed different ones?"""
+
+        self.generate(seed=1)
+        first = self.checksum()
+        self.generate(seed=1)
+        self.assertEqual(self.checksum(), first)
+        self.generate(seed=2)
+        self.assertNotEqual(self.checksum(), first)
+
+    def test_constraints_restored(self):
+        """Are foreign keys and indexes back after a load?"""
+
+        self.generate()
+
+        keys = db.session.execute(text("""
+            SELECT count(*) FROM pg_constraint
+            WHERE contype = 'f' AND conrelid = 'lists_recipes'::regclass
+        """)).scalar()
+        self.assertEqual(keys, 2)
+
+        indexes = db.session.execute(text("""
+            SELECT indexname FROM pg_indexes WHERE tablename = 'users_favorites_recipes'
+        """)).scalars().all()
+        self.assertIn('ix_users_favorites_recipes_recipe_id', indexes)
@@ -8,7 +8,7 @@
 import os
 from unittest import TestCase
 
-from models import db, User, List, Recipe, ListsRecipes, UsersFavoritesRecipes
+from models import db, hasher, User, List, Recipe, ListsRecipes, UsersFavoritesRecipes
 from sqlalchemy.exc import IntegrityError
 
 # BEFORE we import our app, let's set an environmental variable
@@ -17,6 +17,7 @@ from sqlalchemy.exc import IntegrityError
 # connected to the database
 
 os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
 
 
 # Now we can import app
@@ -149,3 +150,18 @@ class UserModelTestCase(TestCase):
         """Does user authentication fail with invalid password?"""
         user = User.authenticate(self.testuser.username, "testuser3")
         self.assertFalse(user)
+
+    def test_user_authenticate_rehashes(self):
+        """Does logging in upgrade a hash made with an old work factor?"""
+
+        rounds = hasher.rounds
+        hasher.rounds = rounds + 1
+        try:
+            user = User.authenticate(self.testuser.username, "testuser")
+            self.assertEqual(user, self.testuser)
+            self.assertTrue(user.password.startswith(f"$2b${rounds + 1:02}$"))
+            db.session.commit()
+
+            self.assertTrue(User.authenticate(self.testuser.username, "testuser"))
+        finally:
+            hasher.rounds = rounds
@@ -6,9 +6,21 @@
 
 
 import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
 from unittest import TestCase
+from unittest.mock import patch
 
-from models import db, User, List, Recipe, ListsRecipes, UsersFavoritesRecipes
+from werkzeug.serving import make_server
+
+from sqlalchemy import event
+
+from models import db, hasher, User, List, Recipe, ListsRecipes, UsersFavoritesRecipes
+import passwords
+from purge import close_user
 
 # BEFORE we import our app, let's set an environmental variable
 # to use a different database for tests (we need to do this
@@ -16,6 +28,7 @@ from models import db, User, List, Recipe, ListsRecipes, UsersFavoritesRecipes
 # connected to the database
 
 os.environ['DATABASE_URL'] = "postgresql:///tender-test"
+os.environ['FLASK_CONFIG'] = 'testing'
 
 
 # Now we can import app
@@ -37,6 +50,13 @@ app.config['WTF_CSRF_ENABLED'] = False
 class UserViewTestCase(TestCase):
     """Test views for users."""
 
+    def tearDown(self):
+        """Clean up after each test."""
+
+        db.session.rollback()
+        db.session.close()
+        self.app.pop()
+
     def setUp(self):
         """Create test client, add sample data."""
 
@@ -44,6 +64,7 @@ class UserViewTestCase(TestCase):
         self.app.push()
         
         User.query.delete()
+        Recipe.query.delete()
 
         self.client = app.test_client()
 
@@ -73,6 +94,9 @@ class UserViewTestCase(TestCase):
             self.assertEqual(resp.status_code, 302)
             self.assertEqual(User.query.count(), 3)
 
+            user = User.query.filter_by(username="testuser3").one()
+            self.assertEqual([l.title for l in user.lists], ["My List"])
+
     def test_user_delete(self):
         """Can user delete themselves?"""
 
@@ -106,3 +130,198 @@ class UserViewTestCase(TestCase):
             self.assertEqual(resp.status_code, 200)
             self.assertEqual(User.query.count(), 2)
             self.assertIn(b"testuser3", resp.data)
+
+    def test_current_user_is_cached(self):
+        """Is the user cached, and only their version read once it's due for revalidation?"""
+
+        statements = []
+
+        def count(*args):
+            statements.append(args[2])
+
+        cache = app.extensions['user_cache']
+        revalidate = app.config['USER_CACHE_REVALIDATE']
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            c.get("/my-account")
+            event.listen(db.engine, "before_cursor_execute", count)
+            try:
+                c.get("/my-account")
+                self.assertFalse([s for s in statements if "FROM users" in s])
+
+                with patch.object(cache, 'clock', lambda: time.monotonic() + revalidate):
+                    c.get("/my-account")
+            finally:
+                event.remove(db.engine, "before_cursor_execute", count)
+
+            users = [s for s in statements if "FROM users" in s]
+            self.assertEqual(len(users), 1)
+            self.assertNotIn("users.username", users[0])
+
+    def test_other_sessions_see_changes(self):
+        """Do a user's other sessions see an edit, and lose a closed or deleted account?"""
+
+        other = app.test_client()
+
+        for c in (self.client, other):
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+            c.get("/my-account")
+
+        self.client.post("/my-account", data={"username": "renamed", "password": "testuser",
+                                              "email": "renamed@test.com"})
+        self.assertIn(b'value="renamed"', other.get("/my-account").data)
+
+        # As if closed by another worker: seen once the cached copy is revalidated.
+        close_user(self.testuser.id)
+        db.session.commit()
+        cache = app.extensions['user_cache']
+        with patch.object(cache, 'clock', lambda: time.monotonic() + app.config['USER_CACHE_REVALIDATE']):
+            self.assertEqual(other.get("/my-account").status_code, 302)
+
+        with other.session_transaction() as sess:
+            self.assertNotIn(CURR_USER_KEY, sess)
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser2.id
+        self.client.get("/my-account")
+        with other.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser2.id
+
+        self.client.get("/my-account/delete")
+        self.assertEqual(other.get("/my-account").status_code, 302)
+
+    def test_user_cache_invalidated_on_edit(self):
+        """Does an account edit show up on the next request?"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            c.get("/my-account")
+            c.post("/my-account",
+                   data={"username": "renamed",
+                         "password": "testuser",
+                         "email": "renamed@test.com"})
+
+            resp = c.get("/my-account")
+            self.assertIn(b'value="renamed"', resp.data)
+
+    def test_favorite_toggles(self):
+        """Do favorite toggles return JSON and cost one statement each?"""
+
+        recipe = Recipe(source_id="12345", title="Test Recipe", image_url="https://example.com/image.jpg")
+        db.session.add(recipe)
+        db.session.commit()
+        recipe_id = recipe.id
+
+        statements = []
+
+        def count(*args):
+            # Recommendation updates run on their own thread; only count the request's.
+            if threading.current_thread() is threading.main_thread():
+                statements.append(args[2])
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            c.get("/favorites")
+            event.listen(db.engine, "before_cursor_execute", count)
+            try:
+                first = c.post("/favorites/add", json={"recipeId": recipe_id})
+                second = c.post("/favorites/add", json={"recipeId": recipe_id})
+            finally:
+                event.remove(db.engine, "before_cursor_execute", count)
+
+            self.assertEqual(first.json, {'message': 'success', 'recipeId': recipe_id,
+                                          'favorited': True, 'changed': True})
+            self.assertFalse(second.json['changed'])
+            # Besides each request's read of the user's version.
+            toggles = [s for s in statements if "users_favorites_recipes" in s]
+            self.assertEqual(len(toggles), 2)
+            self.assertEqual(UsersFavoritesRecipes.query.count(), 1)
+
+            resp = c.post("/favorites/remove", json={"recipeId": recipe_id})
+            self.assertEqual(resp.status_code, 200)
+            self.assertFalse(resp.json['favorited'])
+            self.assertEqual(UsersFavoritesRecipes.query.count(), 0)
+
+            resp = c.post("/favorites/add", json={"recipeId": 0})
+            self.assertEqual(resp.status_code, 404)
+
+            for bad in (True, "nope", None, 1.5, str(recipe_id)):
+                with self.subTest(recipeId=bad):
+                    resp = c.post("/favorites/add", json={"recipeId": bad})
+                    self.assertEqual(resp.status_code, 400)
+                    resp = c.post("/favorites/remove", json={"recipeId": bad})
+                    self.assertEqual(resp.status_code, 400)
+
+    def test_favorites_keyset_pages(self):
+        """Can we page through favorites with a cursor?"""
+
+        recipes = [
+            Recipe(source_id=str(100 + i), title=f"Recipe {i}", image_url="https://example.com/image.jpg")
+            for i in range(3)
+        ]
+        db.session.add_all(recipes)
+        self.testuser.favorites.extend(recipes)
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            first = c.get("/api/favorites?limit=2").json
+            second = c.get(f"/api/favorites?limit=2&after={first['next']}").json
+
+            self.assertEqual(len(first['recipes']), 2)
+            self.assertEqual(len(second['recipes']), 1)
+            self.assertIsNone(second['next'])
+            self.assertTrue(all(r['favorited'] for r in first['recipes'] + second['recipes']))
+
+    def test_login_busy(self):
+        """Are logins refused with a 503 once every hashing slot is taken?"""
+
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/login"
+        data = urllib.parse.urlencode({"username": "testuser", "password": "testuser"}).encode()
+
+        def login():
+            try:
+                return urllib.request.urlopen(url, data).status
+            except urllib.error.HTTPError as e:
+                return e.code
+
+        release = threading.Event()
+        checkpw = passwords.bcrypt.checkpw
+
+        def slow_checkpw(*args):
+            release.wait()
+            return checkpw(*args)
+
+        slots = app.config['PASSWORD_HASH_WORKERS'] + app.config['PASSWORD_HASH_QUEUE']
+        statuses = []
+
+        with patch.object(passwords.bcrypt, 'checkpw', slow_checkpw):
+            waiting = [threading.Thread(target=lambda: statuses.append(login())) for _ in range(slots)]
+            for thread in waiting:
+                thread.start()
+
+            try:
+                for _ in range(500):
+                    if not hasher._slots._value:
+                        break
+                    release.wait(0.01)
+                self.assertEqual(login(), 503)
+            finally:
+                release.set()
+                for thread in waiting:
+                    thread.join()
+                server.shutdown()
+
+        self.assertEqual(statuses, [200] * slots)